@@ -7,7 +7,8 @@ Test Vincent.charts
 
 import pandas as pd
 import nose.tools as nt
-from vincent.charts import (data_type, Chart, Bar, Scatter, Line, Area)
+from vincent.charts import (data_type, fold_top_n, top_n_data, Chart, Bar,
+                            Scatter, Line, Area)
 
 
 def chart_runner(chart, scales, axes, marks):
@@ -65,6 +66,37 @@ def test_data_type():
     nt.assert_raises(ValueError, data_type, test, False)
 
 
+def test_fold_top_n():
+    """Test folding of small categories into a single category"""
+
+    labels, values = fold_top_n(['a', 'b', 'c', 'd', 'e'], [5, 1, 7, 2, 3], 2)
+    nt.assert_list_equal(labels, ['a', 'c', 'Other'])
+    nt.assert_list_equal(values, [5, 7, 6])
+
+    labels, values = fold_top_n(['a', 'b'], [1.5, 2.5], 2, other='Rest')
+    nt.assert_list_equal(labels, ['a', 'b'])
+    nt.assert_list_equal(values, [1.5, 2.5])
+
+    nt.assert_raises(ValueError, fold_top_n, ['a'], [1], 0)
+    nt.assert_raises(ValueError, fold_top_n, ['a', 'b'], [1], 1)
+
+    #Input types
+    gets = [('a', 5), ('c', 7), ('Other', 3)]
+    puts = [[('a', 5), ('b', 1), ('c', 7), ('d', 2)],
+            pd.Series([5, 1, 7, 2], index=['a', 'b', 'c', 'd']),
+            pd.DataFrame({'y': [5, 1, 7, 2]}, index=['a', 'b', 'c', 'd'])]
+    for ins in puts:
+        nt.assert_list_equal(top_n_data(ins, 2), gets)
+
+    nt.assert_list_equal(top_n_data([5, 1, 7, 2], 2),
+                         [(0, 5), (2, 7), ('Other', 3)])
+    nt.assert_dict_equal(top_n_data({'x': ['a', 'b', 'c'], 'y': [1, 2, 3]},
+                                    1, iter_pairs=True),
+                         {'x': ['c', 'Other'], 'y': [3, 3]})
+    nt.assert_raises(ValueError, top_n_data,
+                     pd.DataFrame({'y': [1], 'z': [2]}), 1)
+
+
 class TestChart(object):
     """Test Chart ABC"""
 
@@ -110,6 +142,17 @@ class TestBar(object):
 
         chart_runner(bar, scales, axes, marks)
 
+    def test_top_n(self):
+        bar = Bar({'a': 5, 'b': 1, 'c': 7, 'd': 2}, top_n=2, other='Rest')
+        nt.assert_equal(len(bar.data[0].values), 3)
+        nt.assert_dict_equal(bar.data[0].values[-1], {'x': 'Rest', 'y': 3})
+        nt.assert_equal(sum(v['y'] for v in bar.data[0].values), 15)
+
+        df = pd.DataFrame({'y': [5, 1, 7, 2]}, index=['a', 'b', 'c', 'd'])
+        bar = Bar(df, top_n=2)
+        nt.assert_equal([v['x'] for v in bar.data[0].values],
+                        ['a', 'c', 'Other'])
+
 
 class TestScatter(object):
     """Test Scatter Chart"""
@@ -0,0 +1,101 @@
+  # -*- coding: utf-8 -*-
+'''
+Test Vincent.columnar
+---------------------
+
+'''
+import gzip
+import json
+import shutil
+import tempfile
+from os import path
+
+import numpy as np
+import pandas as pd
+import nose.tools as nt
+
+from vincent import columnar
+
+
+def decode(info, buffer):
+    '''Rebuild a column like the HTML scaffold does'''
+    dtypes = {'int32': '<i4', 'float32': '<f4', 'float64': '<f8'}
+    array = np.frombuffer(buffer, dtype=dtypes[info['type']])
+    if info.get('encoding') == 'xor':
+        bits = array.view('<u{0}'.format(array.itemsize)).copy()
+        for i in range(1, len(bits)):
+            bits[i] ^= bits[i - 1]
+        array = bits.view(array.dtype)
+    elif info.get('encoding') == 'delta':
+        array = info['base'] + np.cumsum(array, dtype=np.int64)
+    return array
+
+
+def test_columns():
+    '''Numeric columns are split into arrays'''
+    values = [{'x': i, 'y': i * 0.5, 'label': 'a', 'flag': True}
+              for i in range(5)]
+    values[2]['y'] = None
+    values[3]['x'] = 3.5
+    data = columnar.columns(values)
+    nt.assert_equal(list(data), ['flag', 'label', 'x', 'y'])
+    nt.assert_equal(data['flag'], [True] * 5)
+    nt.assert_equal(data['label'], ['a'] * 5)
+    nt.assert_equal(data['x'].dtype, np.float64)
+    nt.assert_true(np.isnan(data['y'][2]))
+
+    frame = pd.DataFrame({'x': range(5), 'label': list('abcde')})
+    data = columnar.columns(frame)
+    nt.assert_equal(data['x'].dtype.kind, 'i')
+    nt.assert_equal(data['label'], list('abcde'))
+
+
+def test_encode_column():
+    '''Encoded columns decode to the original values'''
+    times = 1.4e12 + np.arange(100) * 1000.
+    series = np.cumsum(np.random.rand(100))
+    cases = [(np.arange(100), False, 'int32', None),
+             (np.arange(100) + 2 ** 40, False, 'float64', None),
+             (np.arange(100) + 2 ** 40, True, 'int32', 'delta'),
+             (times, True, 'int32', 'delta'),
+             (series, False, 'float64', None),
+             (series, True, 'float64', 'xor')]
+    for column, delta, dtype, method in cases:
+        array, info = columnar.encode_column(column, delta=delta)
+        nt.assert_equal(info['type'], dtype)
+        nt.assert_equal(info.get('encoding'), method)
+        decoded = decode(info, array.tostring())
+        nt.assert_true((decoded == column).all())
+
+    array, info = columnar.encode_column(series, float32=True, delta=True)
+    nt.assert_equal(info['type'], 'float32')
+    decoded = decode(info, array.tostring())
+    nt.assert_true(np.allclose(decoded, series))
+
+
+def test_dump_columns():
+    '''Columns are written next to the manifest'''
+    values = [{'x': 1.4e12 + i * 1000., 'y': np.sin(i / 10.), 'label': 'a'}
+              for i in range(1000)]
+    tmp = tempfile.mkdtemp()
+    try:
+        for compress in (False, True):
+            manifest_path = path.join(tmp, 'data.json')
+            manifest = columnar.dump_columns(values, manifest_path,
+                                             delta=['x', 'y'],
+                                             compress=compress)
+            opener = gzip.open if compress else open
+            with opener(manifest_path) as f:
+                nt.assert_equal(json.load(f), manifest)
+            nt.assert_equal(manifest['rows'], 1000)
+            label, x, y = manifest['columns']
+            nt.assert_equal(label, {'name': 'label', 'values': ['a'] * 1000})
+            nt.assert_equal(x['encoding'], 'delta')
+            nt.assert_equal(y['encoding'], 'xor')
+            for info in (x, y):
+                with opener(info['url'], 'rb') as f:
+                    decoded = decode(info, f.read())
+                nt.assert_equal(decoded.tolist(),
+                                [row[info['name']] for row in values])
+    finally:
+        shutil.rmtree(tmp)
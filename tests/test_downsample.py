@@ -0,0 +1,100 @@
+  # -*- coding: utf-8 -*-
+'''
+Test Vincent.downsample
+-----------------------
+
+'''
+import json
+import numpy as np
+import nose.tools as nt
+
+from vincent.downsample import (min_max_envelope, pyramid, estimate_size,
+                                reduce_values, fit_spec)
+
+
+def test_min_max_envelope():
+    '''Test min/max envelope indices'''
+    y = [3, 1, 2, 9, 5, 4, 0, 8, 7]
+    nt.assert_equal(list(min_max_envelope(y, 3)), [0, 1, 3, 5, 6, 7])
+
+    # A partial last bucket and NaN values
+    y = [1, np.nan, 5, 2, 2]
+    nt.assert_equal(list(min_max_envelope(y, 2)), [0, 2, 3, 4])
+
+    # No reduction
+    nt.assert_equal(list(min_max_envelope(y, 1)), range(5))
+    nt.assert_equal(list(min_max_envelope([1, 2], 10)), [0, 1])
+
+
+def test_pyramid():
+    '''Test pyramid levels'''
+    values = [{'x': i, 'y': (-1) ** i * i} for i in range(100)]
+    levels = pyramid(values, [10, 1, 50, 1000])
+    nt.assert_equal([factor for factor, _ in levels], [50, 10, 1])
+    nt.assert_is(levels[-1][1], values)
+
+    coarse = levels[0][1]
+    nt.assert_equal([row['x'] for row in coarse], [48, 49, 98, 99])
+    nt.assert_is(coarse[0], values[48])
+
+
+def test_estimate_size():
+    '''Test sampled size estimate'''
+    values = [{'x': i, 'y': i * 0.5} for i in range(10000)]
+    for args in [{}, {'indent': 2, 'separators': (',', ': ')}]:
+        size = len(json.dumps(values, **args))
+        estimate = estimate_size(values, **args)
+        nt.assert_less(abs(estimate - size) / size, 0.05)
+
+    nt.assert_equal(estimate_size([1, 2]), len('[1, 2]'))
+
+
+def test_reduce_values():
+    '''Test reductions by mark type'''
+    values = [{'x': i, 'y': np.sin(i / 100.)} for i in range(10000)]
+    mark = {'type': 'line', 'properties': {'enter': {
+        'x': {'field': 'data.x'}, 'y': {'field': 'data.y'}}}}
+    reduced, reports = reduce_values(values, 20000, mark)
+    nt.assert_less_equal(len(json.dumps(reduced)), 20000)
+    nt.assert_equal(len(reports), 1)
+    nt.assert_in('min/max envelope', reports[0])
+    nt.assert_almost_equal(max(r['y'] for r in reduced), 1, 3)
+    nt.assert_equal(len(values), 10000)
+
+    mark['type'] = 'symbol'
+    reduced, reports = reduce_values(values, 20000, mark)
+    nt.assert_less_equal(len(json.dumps(reduced)), 20000)
+    nt.assert_in('binned', reports[0])
+
+    mark['type'] = 'rect'
+    bars = [{'x': 'bar{0}'.format(i), 'y': i} for i in range(1000)]
+    reduced, reports = reduce_values(bars, 2000, mark)
+    nt.assert_less_equal(len(json.dumps(reduced)), 2000)
+    nt.assert_equal(reduced[-1]['x'], 'Other')
+    nt.assert_equal(sum(r['y'] for r in reduced), sum(range(1000)))
+
+    # Other marks only get rounded floats.
+    reduced, reports = reduce_values(values, 300000, {'type': 'text'})
+    nt.assert_equal(len(reduced), len(values))
+    nt.assert_less_equal(len(json.dumps(reduced)), 300000)
+    nt.assert_in('significant digits', reports[-1])
+    nt.assert_is_instance(values[1]['y'], float)
+    nt.assert_not_equal(values[1]['y'], reduced[1]['y'])
+
+
+def test_fit_spec():
+    '''Test byte budget of a grammar'''
+    values = [{'x': i, 'y': i * 0.5} for i in range(1000)]
+    spec = {'data': [{'name': 'table', 'values': values}, {'name': 'url',
+                                                           'url': 'a.json'}],
+            'marks': [{'type': 'line', 'from': {'data': 'table'}}]}
+    nt.assert_equal(fit_spec(spec, 10 ** 6), (spec, []))
+
+    fitted, reports = fit_spec(spec, 5000)
+    nt.assert_less_equal(len(json.dumps(fitted)), 5000)
+    nt.assert_equal(len(reports), 1)
+    nt.assert_true(reports[0].startswith("data 'table': downsampled"))
+    nt.assert_is(fitted['data'][1], spec['data'][1])
+    nt.assert_is(spec['data'][0]['values'], values)
+
+    nt.assert_raises(ValueError, fit_spec, spec, 10)
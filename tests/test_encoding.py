@@ -0,0 +1,137 @@
+  # -*- coding: utf-8 -*-
+'''
+Test Vincent.encoding
+---------------------
+
+'''
+import json
+import gzip
+from StringIO import StringIO
+
+import numpy as np
+import pandas as pd
+import nose.tools as nt
+
+import vincent
+from vincent import encoding
+from vincent.vega import GrammarDict
+
+
+dumps_args = [
+    {}, {'sort_keys': True}, {'indent': 2, 'separators': (',', ': ')},
+    {'indent': 4, 'sort_keys': True, 'separators': (',', ': ')},
+    {'indent': 3}]
+
+
+def test_dumps_matches_json():
+    '''Streamed output is the same as json.dumps'''
+    encoder = GrammarDict().encoder
+    line = vincent.Line()
+    line.tabular_data(np.sin(np.arange(2500) / 100.))
+    chart = vincent.charts.Line(list(np.random.rand(2500)))
+    chart.data[0].format = {1: 2, 'a': (1, [2, {'b': None}]), 'c': {},
+                            'd': [], 'e': [[]]}
+    objects = [line.vega, chart, {'x': [1, [2, [3]], {}, [], {'a': [1]}]},
+               [], {}, [[], {}], 1.5, u'\xe9', [float('nan')],
+               [np.float64(0.5)] * 1500 + [chart.marks[0]]]
+    for obj in objects:
+        for args in dumps_args:
+            expected = json.dumps(obj, default=encoder, **args)
+            nt.assert_equal(encoding.dumps(obj, **args), expected)
+            nt.assert_equal(''.join(encoding.iterencode(obj, **args)),
+                            expected)
+
+
+def test_lazy_values():
+    '''DataFrames and generators are encoded as lists of rows'''
+    def dumps(obj, **kwargs):
+        return ''.join(encoding.iterencode(obj, **kwargs))
+
+    df = pd.DataFrame({'x': range(2500), 'y': np.arange(2500) * 0.5})
+    rows = [{'x': x, 'y': x * 0.5} for x in range(2500)]
+    for args in dumps_args:
+        expected = json.dumps({'values': rows}, **args)
+        nt.assert_equal(dumps({'values': df}, **args), expected)
+        nt.assert_equal(dumps({'values': iter(rows)}, **args), expected)
+        nt.assert_equal(dumps({'values': (r for r in [])}, **args),
+                        json.dumps({'values': []}, **args))
+
+
+def test_dump():
+    '''Output is written in chunks'''
+    class Output(StringIO):
+        writes = 0
+
+        def write(self, s):
+            self.writes += 1
+            StringIO.write(self, s)
+
+    values = [{'x': i, 'y': i * 0.5} for i in range(10000)]
+    output = Output()
+    encoding.dump({'values': values}, output, chunk_size=4096)
+    nt.assert_equal(output.getvalue(), json.dumps({'values': values}))
+    nt.assert_greater(output.writes, 10)
+
+
+def test_dump_compress():
+    '''Compressed output is reproducible gzip'''
+    values = [{'x': i, 'y': i * 0.5} for i in range(10000)]
+    outputs = []
+    for level in (True, True, 1):
+        output = StringIO()
+        encoding.dump({'values': values}, output, compress=level)
+        outputs.append(output.getvalue())
+    nt.assert_equal(outputs[0], outputs[1])
+    nt.assert_not_equal(outputs[0], outputs[2])
+    for compressed in outputs:
+        text = gzip.GzipFile(fileobj=StringIO(compressed)).read()
+        nt.assert_equal(text, json.dumps({'values': values}))
+    nt.assert_less(len(outputs[0]) * 5, len(text))
+
+
+def test_numpy():
+    '''NumPy scalars and arrays are encoded as Python values'''
+    obj = {'a': np.arange(3), 'b': np.float32(0.5), 'c': np.bool_(False),
+           'd': [np.int8(1), object()]}
+    expected = '{"a": [0, 1, 2], "b": 0.5, "c": false, "d": [1, null]}'
+    nt.assert_equal(encoding.dumps(obj, sort_keys=True), expected)
+    nt.assert_equal(''.join(encoding.iterencode(obj, sort_keys=True)),
+                    expected)
+    nt.assert_equal(encoding.to_plain(obj),
+                    {'a': [0, 1, 2], 'b': 0.5, 'c': False, 'd': [1, None]})
+
+
+def test_backends():
+    '''Backend selection'''
+    nt.assert_equal(encoding.get_backend(), 'json')
+    nt.assert_in('json', encoding.available_backends())
+    nt.assert_raises(ValueError, encoding.set_backend, 'yaml')
+    nt.assert_raises(ValueError, encoding.dumps, {}, backend='yaml')
+    nt.assert_raises(ValueError, encoding.set_backend, 'orjson')
+    for name in ('rapidjson', 'ujson'):
+        if name not in encoding.available_backends():
+            nt.assert_raises(vincent.vega.LoadError, encoding.set_backend,
+                             name)
+        else:
+            nt.assert_raises(ValueError, encoding.dumps, {}, backend=name,
+                             indent=2, separators=(', ', ': '))
+            obj = {'a': [1, 2], 'b': {'c': 0.5}}
+            text = encoding.dumps(obj, backend=name, indent=2)
+            nt.assert_equal(json.loads(text), obj)
+            nt.assert_in('\n  "b"', text)
+            chart = vincent.charts.Bar([1, 2, 3])
+            output = StringIO()
+            encoding.dump(chart, output, backend=name, indent=2)
+            text = chart.to_json(backend=name)
+            nt.assert_in('\n  "', text)
+            nt.assert_equal(json.loads(text), json.loads(output.getvalue()))
+
+    try:
+        encoding.set_backend('auto')
+        nt.assert_equal(encoding.get_backend(),
+                        encoding.available_backends()[0])
+        chart = vincent.charts.Bar([1, 2, 3])
+        nt.assert_equal(json.loads(chart.to_json()),
+                        json.loads(chart.to_json(backend='json')))
+    finally:
+        encoding.set_backend('json')
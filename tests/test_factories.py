@@ -0,0 +1,75 @@
+  # -*- coding: utf-8 -*-
+'''
+Test Vincent.factories
+----------------------
+
+'''
+
+import nose.tools as nt
+from vincent.factories import BarFactory
+from vincent.vega import Scale, DataRef
+
+
+def test_bar_factory():
+    '''Charts share the templates of the factory until they change them'''
+
+    factory = BarFactory()
+    red = factory(['a', 'b'], [1, 2], color='red')
+    default = factory(['a', 'b'], [1, 2])
+
+    nt.assert_equal(red.marks[0].properties.update.fill.value, 'red')
+    nt.assert_equal(default.marks[0].properties.update.fill.value,
+                    'steelblue')
+    nt.assert_equal(factory.color, 'steelblue')
+    nt.assert_is(red.marks[0].properties.grammar['enter'],
+                 default.marks[0].properties.grammar['enter'])
+
+    default.scales['x'].domain.field = 'data.z'
+    nt.assert_equal(factory.x_scale.domain.field, 'data.x')
+    nt.assert_equal(red.scales['x'].domain.field, 'data.x')
+
+    factory.color = 'blue'
+    blue = factory(['a'], [1])
+    nt.assert_equal(blue.marks[0].properties.update.fill.value, 'blue')
+    nt.assert_equal(default.marks[0].properties.update.fill.value,
+                    'steelblue')
+
+    grammar = red.grammar()
+    nt.assert_equal(grammar['marks'][0]['properties']['enter']['y2'],
+                    {'scale': 'y', 'value': 0})
+    nt.assert_equal([s['name'] for s in grammar['scales']], ['x', 'y'])
+
+
+def test_bar_factory_templates():
+    '''The templates of the factory stay mutable and independent'''
+
+    y_scale = Scale(name='y', range=[0, 100], type='linear',
+                    domain=DataRef(data='table', field='data.y'))
+    factory = BarFactory(y_scale=y_scale)
+    chart_a = factory(['a'], [1])
+    chart_b = factory(['a'], [1])
+
+    chart_a.scales['y'].range[1] = 5
+    nt.assert_equal(chart_a.scales['y'].range, [0, 5])
+    nt.assert_equal(chart_b.scales['y'].range, [0, 100])
+    nt.assert_equal(factory.y_scale.range, [0, 100])
+
+    snapshot = factory._template('y_scale')
+    nt.assert_is(factory._template('y_scale'), snapshot)
+    factory.x_scale.nice = False
+    factory.mark.properties.update.fill.value = 'red'
+    factory.y_scale.range[1] = 50
+    factory.y_scale.invalidate()
+    chart_c = factory(['a'], [1])
+    nt.assert_equal(chart_c.marks[0].properties.update.fill.value, 'red')
+    nt.assert_false(chart_c.scales['x'].nice)
+    nt.assert_equal(chart_c.scales['y'].range, [0, 50])
+    nt.assert_is_none(chart_b.scales['x'].nice)
+
+    # Without copies, the charts share the templates of the factory.
+    chart_d = factory(['a'], [1], make_copies=False)
+    nt.assert_is(chart_d.scales['y'], factory.y_scale)
+    chart_d.marks[0].type = 'area'
+    nt.assert_equal(factory.mark.type, 'area')
+    nt.assert_equal(factory(['a'], [1]).marks[0].type, 'area')
+    nt.assert_equal(chart_a.marks[0].type, 'rect')
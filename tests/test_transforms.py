@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+'''
+Test Vincent.transforms
+-----------------------
+
+'''
+
+import nose.tools as nt
+from vincent.vega import (Visualization, Data, Mark, MarkRef, MarkProperties,
+                          PropertySet, ValueRef, Scale, DataRef)
+from vincent.transforms import evaluate, is_supported, is_inlinable
+
+
+rows = [{'c': 'a', 'y': 1}, {'c': 'b', 'y': 5}, {'c': 'a', 'y': 3},
+        {'c': None, 'y': 2}]
+
+
+def test_stats():
+    """Test the stats transform"""
+
+    out = evaluate(rows, [{'type': 'stats', 'value': 'data.y',
+                           'median': True}])
+    nt.assert_dict_equal(out[0], {'count': 4, 'min': 1.0, 'max': 5.0,
+                                  'sum': 11.0, 'mean': 2.75, 'median': 2.5,
+                                  'variance': 35 / 12.0,
+                                  'stdev': (35 / 12.0) ** 0.5})
+
+    out = evaluate(rows, [{'type': 'stats', 'value': 'data.y',
+                           'assign': True}])
+    nt.assert_equal(len(out), 4)
+    nt.assert_equal(out[0]['y'], 1)
+    nt.assert_equal(out[0]['sum'], 11.0)
+    nt.assert_not_in('sum', rows[0])
+
+
+def test_sort():
+    """Test the sort transform"""
+
+    out = evaluate(rows, [{'type': 'sort', 'by': '-data.y'}])
+    nt.assert_list_equal([r['y'] for r in out], [5, 3, 2, 1])
+
+    out = evaluate(rows, [{'type': 'sort', 'by': ['data.c', '-data.y']}])
+    nt.assert_list_equal([r['y'] for r in out], [3, 1, 5, 2])
+
+    nt.assert_list_equal(evaluate([3, 1, 2], [{'type': 'sort',
+                                               'by': 'data'}]), [1, 2, 3])
+
+
+def test_facet_aggregate():
+    """Test facets and grouped aggregates"""
+
+    out = evaluate(rows, [{'type': 'facet', 'keys': ['data.c'],
+                           'transform': [{'type': 'stats',
+                                          'value': 'data.y'}]}])
+    nt.assert_list_equal([f['keys'] for f in out], [['a'], ['b'], [None]])
+    nt.assert_equal(out[0]['key'], 'a')
+    nt.assert_equal(out[0]['values'][0]['sum'], 4.0)
+    nt.assert_is_none(out[1]['values'][0]['stdev'])
+
+    out = evaluate(rows, [{'type': 'aggregate', 'groupby': ['data.c'],
+                           'fields': [{'name': 'data.y',
+                                       'ops': ['count', 'sum', 'max']}]}])
+    nt.assert_list_equal(out, [
+        {'c': 'a', 'count_y': 2, 'sum_y': 4.0, 'max_y': 3.0},
+        {'c': 'b', 'count_y': 1, 'sum_y': 5.0, 'max_y': 5.0},
+        {'c': None, 'count_y': 1, 'sum_y': 2.0, 'max_y': 2.0}])
+
+
+def test_window_fold():
+    """Test the window and fold transforms"""
+
+    out = evaluate(rows, [{'type': 'window', 'size': 3}])
+    nt.assert_equal(len(out), 2)
+    nt.assert_list_equal(out[1]['values'], rows[1:])
+
+    out = evaluate(rows[:1], [{'type': 'fold', 'fields': ['data.c',
+                                                          'data.y']}])
+    nt.assert_list_equal(out, [{'key': 'c', 'value': 'a'},
+                               {'key': 'y', 'value': 1}])
+
+
+def test_unsupported():
+    """Unsupported transforms are reported"""
+
+    geo = [{'type': 'geopath', 'value': 'data'}]
+    nt.assert_false(is_supported(geo))
+    nt.assert_false(is_supported([{'type': 'facet', 'keys': ['data.c'],
+                                   'transform': geo}]))
+    nt.assert_true(is_supported([{'type': 'sort', 'by': 'data.y'}]))
+    nt.assert_raises(ValueError, evaluate, rows, geo)
+
+
+def test_evaluate_visualization():
+    """Transforms of a Visualization are replaced by their results"""
+
+    vis = Visualization()
+    vis.data.append(Data('table', values=list(rows)))
+    vis.data.append(Data('sorted', source='table',
+                         transform=[{'type': 'sort', 'by': '-data.y'}]))
+    vis.data.append(Data('geo', url='geo.json',
+                         transform=[{'type': 'geopath', 'value': 'data'}]))
+    vis.marks.append(Mark(type='rect', from_=MarkRef(
+        data='table', transform=[{'type': 'stats', 'value': 'data.y'}])))
+
+    vis.evaluate_transforms()
+
+    nt.assert_is_none(vis.data['sorted'].transform)
+    nt.assert_is_none(vis.data['sorted'].source)
+    nt.assert_equal(vis.data['sorted'].values[0]['y'], 5)
+    nt.assert_equal(vis.data['geo'].transform[0]['type'], 'geopath')
+    nt.assert_equal(vis.marks[0].from_.data, 'table_mark0')
+    nt.assert_is_none(vis.marks[0].from_.transform)
+    nt.assert_equal(vis.data['table_mark0'].values[0]['count'], 4)
+
+
+def test_evaluate_field_references():
+    """Fields of inlined transform output are referenced through data"""
+
+    def properties(field):
+        return MarkProperties(enter=PropertySet(
+            y=ValueRef(scale='y', field=field),
+            x=ValueRef.intern(field=field)))
+
+    vis = Visualization()
+    vis.data.append(Data('table', values=list(rows)))
+    vis.data.append(Data('stats', source='table',
+                         transform=[{'type': 'stats', 'value': 'data.y'}]))
+    vis.data.append(Data('sorted', source='table',
+                         transform=[{'type': 'sort', 'by': 'data.y'}]))
+    facet = [{'type': 'facet', 'keys': ['data.c']}]
+    vis.data.append(Data('faceted', source='table', transform=facet))
+    vis.scales.append(Scale(name='y', domain=DataRef(data='stats',
+                                                     field='sum')))
+    vis.marks.append(Mark(type='rect', from_=MarkRef(data='stats'),
+                          properties=properties('count')))
+    vis.marks.append(Mark(type='rect', from_=MarkRef(data='sorted'),
+                          properties=properties('data.y')))
+    vis.marks.append(Mark(type='rect', from_=MarkRef(
+        data='table', transform=[{'type': 'fold', 'fields': ['data.y']}]),
+        properties=properties('value')))
+
+    vis.evaluate_transforms()
+
+    nt.assert_equal(vis.scales['y'].domain.field, 'data.sum')
+    for mark, field in zip(vis.marks, ['data.count', 'data.y',
+                                       'data.value']):
+        nt.assert_equal(mark.properties.enter.y.field, field)
+        nt.assert_equal(mark.properties.enter.x.field, field)
+    nt.assert_equal(vis.data['stats'].values[0]['count'], 4)
+
+    # Facets are iterated by group marks and left to Vega.
+    nt.assert_false(is_inlinable(facet))
+    nt.assert_equal(vis.data['faceted'].transform, facet)
@@ -8,12 +8,14 @@ from datetime import datetime, timedelta
 from itertools import product
 import time
 import json
+import copy
+import pickle
 
 from vincent.vega import (KeyedList, ValidationError, GrammarDict, grammar,
                           GrammarClass, Visualization, Data, LoadError,
                           ValueRef, Mark, PropertySet, Scale, Axis,
                           MarkProperties, MarkRef, DataRef, Scale,
-                          AxisProperties, Axis)
+                          AxisProperties, Axis, minified)
 import nose.tools as nt
 
 import pandas as pd
@@ -31,6 +33,14 @@ sequences = {
     'numpy int': lambda l: map(np.int32, range(l))}
 
 
+def make_line_vis(values):
+    """Visualization of a line drawing data values"""
+    vis = Visualization(width=100)
+    vis.data.append(Data('table', values=values))
+    vis.marks.append(Mark(type='line', from_=MarkRef(data='table')))
+    return vis
+
+
 def test_keyed_list():
     """Test keyed list implementation"""
 
@@ -84,6 +94,50 @@ def test_keyed_list():
     nt.assert_equal(err.expected, ValidationError)
     nt.assert_equal(err.exception.message, 'object must have type attribute')
 
+    #Index updates
+    key_list = KeyedList(attr_name='name')
+    keys = [TestKey(name='k{0}'.format(i)) for i in range(5)]
+    key_list.extend(keys)
+    nt.assert_equal(key_list['k3'], keys[3])
+    key_list.insert(0, TestKey(name='first'))
+    nt.assert_equal(key_list['k3'], keys[3])
+    del key_list[0]
+    key_list.reverse()
+    nt.assert_equal(key_list['k0'], keys[0])
+    keys[1].name = 'renamed'
+    nt.assert_equal(key_list['renamed'], keys[1])
+    with nt.assert_raises(KeyError):
+        key_list['k1']
+
+    #Renamed grammar objects
+    scales = KeyedList(attr_name='name')
+    scales.extend([Scale(name='x'), Scale(name='y')])
+    nt.assert_equal(scales['y'], scales[1])
+    scales[0].name = 'y'
+    with nt.assert_raises(ValidationError):
+        scales['y']
+    scales[1].name = 'x'
+    nt.assert_equal(scales['x'], scales[1])
+    nt.assert_equal(copy.deepcopy(scales)['x'].name, 'x')
+
+    #Only the lists containing a renamed object reset their index
+    others = KeyedList(attr_name='name')
+    others.append(Scale(name='z'))
+    nt.assert_is(others['z'], others[0])
+    Scale(name='w')
+    scales[0].name = 'w'
+    nt.assert_is_not_none(others._index)
+    nt.assert_is_none(scales._index)
+    nt.assert_equal(scales['w'], scales[0])
+    replacement = Scale(name='w')
+    scales['w'] = replacement
+    replacement.name = 'v'
+    nt.assert_is(scales['v'], replacement)
+    index = scales._index
+    with nt.assert_raises(KeyError):
+        scales['missing']
+    nt.assert_is(scales._index, index)
+
 
 def test_grammar():
     """Grammar decorator behaves correctly."""
@@ -164,6 +218,29 @@ def test_grammar_dict():
     nt.assert_equal(str(test.grammar), test_str)
     nt.assert_equal(g_dict.encoder(test), test.grammar)
 
+    # The result matches a JSON round trip.
+    values = [{'x': i, 'y': i * 0.5} for i in range(10)]
+    test.data.append(Data('table', values=values))
+    test.marks.append(Mark(type='line', from_=MarkRef(data='table')))
+    test.padding = {'top': 1, 'left': 2, 'right': 3, 'bottom': 4}
+    test.data[0].format = {1: np.int64(2), None: np.float64(0.5),
+                           'a': np.bool_(True), 'b': (1, 2)}
+    nt.assert_equal(test.grammar(),
+                    json.loads(json.dumps(test.grammar,
+                                          default=g_dict.encoder)))
+    nt.assert_equal(test.grammar()['data'][0]['format'],
+                    {'1': 2, 'null': 0.5, 'a': True, 'b': [1, 2]})
+    nt.assert_equal(type(test.grammar()['data'][0]['format']['b']), list)
+
+    # Plain values are shared, not copied, but other containers are.
+    nt.assert_is(test.grammar()['data'][0]['values'], values)
+    nt.assert_is_not(test.grammar()['padding'], test.padding)
+    test.grammar()['padding']['top'] = 10
+    nt.assert_equal(test.padding['top'], 1)
+    test.data[0].format = {'parse': {'x': 'number'}}
+    test.grammar()['data'][0]['format']['parse']['y'] = 'date'
+    nt.assert_equal(test.data[0].format, {'parse': {'x': 'number'}})
+
 
 def assert_grammar_typechecking(grammar_types, test_obj):
     """Assert that the grammar fields of a test object are correctly type-checked.
@@ -222,6 +299,326 @@ class TestGrammarClass(object):
                         'invalid contents: axes[0] must be Axis')
 
 
+    def test_to_json_cache(self):
+        """Test cached JSON output and invalidation"""
+        values = [{'x': i, 'y': i * 0.5} for i in range(3000)]
+        vis = Visualization(data=[Data('table', values=values)])
+        vis.marks.append(Mark(type='line', from_=MarkRef(data='table')))
+        mark = vis.marks[0]
+        mark.properties = MarkProperties(enter=PropertySet(
+            stroke=ValueRef(value='red')))
+
+        def check():
+            for pretty in (False, True):
+                nt.assert_equal(vis.to_json(pretty_print=pretty, cache=True),
+                                vis.to_json(pretty_print=pretty))
+
+        # Caching is opt-in, and objects are only linked to their parents
+        # once they cache their output.
+        vis.to_json()
+        nt.assert_false(vis._cache or vis.data[0]._cache)
+        nt.assert_is_none(mark.properties.enter.stroke._parents)
+
+        check()
+        nt.assert_true(vis._cache and vis.data[0]._cache)
+        cached = vis.data[0]._cache['json'][2]
+        vis.to_json(cache=True)
+        nt.assert_is(vis.data[0]._cache['json'][2], cached)
+
+        # Only the last output is kept.
+        nt.assert_equal(len(vis.data[0]._cache), 1)
+
+        # Property changes invalidate the object and its parents only.
+        mark.properties.enter.stroke.value = 'blue'
+        nt.assert_false(vis._cache or mark._cache)
+        nt.assert_true(vis.data[0]._cache)
+        nt.assert_in('blue', vis.to_json(cache=True))
+        nt.assert_is(vis.data[0]._cache['json'][2], cached)
+        check()
+
+        # Changed containers of grammar objects are detected.
+        vis.marks.append(Mark(type='rect'))
+        vis.marks[1] = Mark(type='area')
+        check()
+
+        # In-place changes need an explicit invalidation.
+        vis.data[0].values.append({'x': 1, 'y': -54321.5})
+        values[0]['y'] = -12345.5
+        output = vis.to_json(cache=True)
+        nt.assert_not_in('-12345.5', output)
+        nt.assert_not_in('-54321.5', output)
+        vis.data[0].invalidate()
+        nt.assert_false(vis._cache or vis.data[0]._cache)
+        check()
+        del vis.data[0].values
+        check()
+
+        # Copies drop the caches.
+        nt.assert_false(copy.deepcopy(vis)._cache)
+        nt.assert_equal(json.loads(copy.deepcopy(vis).to_json()),
+                        json.loads(vis.to_json()))
+
+
+    def test_to_json_compress(self):
+        """Test compressed JSON output"""
+        import gzip
+        from StringIO import StringIO
+
+        test = GrammarClass()
+        test.grammar['values'] = range(1000)
+        compressed = test.to_json(compress=True)
+        text = gzip.GzipFile(fileobj=StringIO(compressed)).read()
+        nt.assert_equal(text, test.to_json())
+        nt.assert_less(len(compressed), len(text))
+
+    def test_slots(self):
+        """Test the compact representation of grammar objects"""
+        import cPickle as pickle
+
+        mark = Mark(type='rect', from_=MarkRef(data='table'))
+        nt.assert_false(hasattr(mark, '__dict__'))
+        nt.assert_raises(AttributeError, setattr, mark, 'typo', 1)
+        mark.validate()
+
+        for copied in (copy.deepcopy(mark),
+                       pickle.loads(pickle.dumps(mark, 2))):
+            nt.assert_equal(json.loads(copied.to_json()),
+                            json.loads(mark.to_json()))
+            nt.assert_equal(copied.from_.data, 'table')
+
+    def test_intern(self):
+        """Test interned frozen objects"""
+        from StringIO import StringIO
+
+        fill = ValueRef.intern(value='steelblue')
+        nt.assert_is(fill, ValueRef.intern(value='steelblue'))
+        nt.assert_is_not(ValueRef.intern(value=1),
+                         ValueRef.intern(value=1.0))
+        nt.assert_raises(AttributeError, setattr, fill, 'value', 'red')
+        nt.assert_raises(AttributeError, delattr, fill, 'value')
+        fill.validate()
+        nt.assert_is(copy.deepcopy(fill), fill)
+
+        # Grammar objects in the properties are interned too.
+        x = ValueRef(scale='x', field='data.x')
+        enter = PropertySet.intern(fill=ValueRef(value='steelblue'), x=x)
+        nt.assert_is(enter.grammar['fill'], fill)
+        nt.assert_is(enter, PropertySet.intern(fill=fill, x=x))
+        nt.assert_false(x._frozen)
+
+        # Changes through a mutable parent are copied on write.
+        marks = [Mark(type='rect', properties=MarkProperties(enter=enter))
+                 for _ in range(2)]
+        marks[0].properties.enter.fill.value = 'red'
+        nt.assert_equal(marks[0].properties.enter.fill.value, 'red')
+        nt.assert_equal(marks[1].properties.enter.fill.value, 'steelblue')
+        nt.assert_equal(enter.fill.value, 'steelblue')
+
+        # Reading through a mutable parent doesn't copy.
+        nt.assert_equal(marks[1].properties.enter.x.field, 'data.x')
+        nt.assert_is(marks[1].properties.grammar['enter'], enter)
+
+        # Frozen elements of lists are copied on write too.
+        scale = Scale.intern(name='x', range=[0, 100],
+                             domain=DataRef(data='table', field='data.x'))
+        vis = Visualization()
+        vis.scales.append(scale)
+        vis.marks.append(Mark.intern(type='rect'))
+        nt.assert_is(vis.scales['x'].grammar['domain'], scale.domain)
+        vis.scales['x'].domain.field = 'data.y'
+        vis.marks[0].type = 'area'
+        nt.assert_equal(vis.scales['x'].domain.field, 'data.y')
+        nt.assert_equal(vis.marks[0].type, 'area')
+        nt.assert_equal(scale.domain.field, 'data.x')
+
+        # Lists and dicts of frozen objects are immutable, and copied when
+        # accessed through a mutable object.
+        nt.assert_raises(TypeError, scale.range.append, 1)
+        nt.assert_raises(TypeError, scale.range.__setitem__, 1, 5)
+        vis.scales['x'].range[1] = 5
+        nt.assert_equal(vis.scales['x'].range, [0, 5])
+        nt.assert_equal(scale.range, [0, 100])
+        nt.assert_is(copy.deepcopy(scale), scale)
+        nt.assert_equal(pickle.loads(pickle.dumps(scale, 2)), scale)
+        nt.assert_raises(TypeError, pickle.loads(pickle.dumps(scale)).
+                         range.append, 1)
+
+        # Shared objects are encoded once, with the same output.
+        vis = Visualization()
+        vis.marks.extend(marks * 3)
+        nt.assert_equal(vis.to_json(cache=True), vis.to_json())
+        output = StringIO()
+        vis.to_json(output, pretty_print=False)
+        nt.assert_equal(output.getvalue(),
+                        vis.to_json(pretty_print=False, cache=True))
+
+    def test_equality(self):
+        """Test structural equality and hashing"""
+        values = [{'x': i, 'y': i * 0.5} for i in range(100)]
+        vis1 = make_line_vis(values)
+        vis2 = make_line_vis([dict(row) for row in values])
+        del vis2.width
+        vis2.width = 100
+        nt.assert_equal(vis1, vis2)
+        nt.assert_false(vis1 != vis2)
+        nt.assert_equal(Visualization.from_json(vis1.to_json()), vis1)
+
+        vis2.data[0].values[50]['y'] = -1
+        nt.assert_not_equal(vis1, vis2)
+        nt.assert_not_equal(Mark(type='line'), Mark(type='area'))
+        nt.assert_not_equal(MarkRef(data='table'), DataRef(data='table'))
+        nt.assert_not_equal(MarkRef(data='table'), {'data': 'table'})
+
+        # Frozen objects are hashable, mutable ones are not.
+        nt.assert_raises(TypeError, hash, ValueRef(value=1))
+
+        # Grammar lists find their elements by identity.
+        marks = vis1.marks
+        marks.append(Mark(type='line', from_=MarkRef(data='table')))
+        nt.assert_equal(marks[0], marks[1])
+        nt.assert_equal(marks.index(marks[1]), 1)
+        nt.assert_not_in(Mark(type='line'), marks)
+        nt.assert_equal(marks.count(marks[0]), 1)
+        second = marks[1]
+        marks.remove(second)
+        nt.assert_equal(len(marks), 1)
+        nt.assert_is_not(marks[0], second)
+        marks.append(Mark(type='area').freeze())
+        nt.assert_in(marks[1], marks)
+        marks.remove(marks[1])
+        nt.assert_equal(len(marks), 1)
+        scales = KeyedList()
+        scales.extend([Scale(name='x'), Scale(name='y')])
+        nt.assert_not_in(Scale(name='x'), scales)
+        nt.assert_raises(ValueError, scales.remove, Scale(name='x'))
+        scales.remove(scales['y'])
+        nt.assert_equal([s.name for s in scales], ['x'])
+        scales = {Scale(name='x', domain=DataRef(data='table')).freeze(): 1}
+        nt.assert_equal(
+            scales[Scale(name='x', domain=DataRef(data='table')).freeze()], 1)
+        nt.assert_equal(hash(ValueRef(value=1).freeze()),
+                        hash(ValueRef.intern(value=1)))
+
+    def test_pickle(self):
+        """Test pickling grammar objects"""
+        rows = [{'x': i, 'y': i * 0.5, 'name': 'n%d' % i, 'ok': i % 2 == 0,
+                 'mixed': i if i % 3 else 'z', 'none': None}
+                for i in range(50)]
+        vis = Visualization(width=100)
+        vis.data.append(Data('table', values=rows))
+        vis.data.append(Data('numbers', values=range(50)))
+        vis.marks.append(Mark(type='line', from_=MarkRef(data='table')))
+        for protocol in (0, 2):
+            loaded = pickle.loads(pickle.dumps(vis, protocol))
+            nt.assert_equal(loaded, vis)
+            nt.assert_equal(json.loads(loaded.to_json()),
+                            json.loads(vis.to_json()))
+            row = loaded.data['table'].values[1]
+            for key in rows[1]:
+                nt.assert_is(type(row[key]), type(rows[1][key]))
+            nt.assert_is(type(loaded.data['numbers'].values[0]), int)
+
+            # The loaded tree is linked, so the JSON cache is invalidated.
+            loaded.to_json(cache=True)
+            loaded.marks[0].type = 'area'
+            nt.assert_in('area', loaded.to_json(cache=True))
+
+        # Lazy values are packed too.
+        values = [{'x': i, 'y': i * 0.5} for i in range(1000)]
+        vis.data['table'].values = values
+        lazy = Visualization.from_json(vis.to_json(), lazy_threshold=100)
+        raw = lazy.data[0].grammar['values']
+        nt.assert_equal(type(raw).__name__, 'RawJSON')
+        packed = pickle.dumps(lazy, 2)
+        nt.assert_less(len(packed), len(raw.text) / 2)
+        nt.assert_is(lazy.data[0].grammar['values'], raw)
+        nt.assert_equal(pickle.loads(packed).data[0].values, values)
+
+        frozen = pickle.loads(pickle.dumps(Scale(name='x').freeze(), 2))
+        nt.assert_true(frozen._frozen)
+        nt.assert_equal(frozen, Scale(name='x'))
+        nt.assert_is(copy.copy(frozen), frozen)
+
+    def test_fingerprint(self):
+        """Test content fingerprints"""
+        values = [{'x': i, 'y': i * 0.5, 'c': 'a'} for i in range(100)]
+        vis1 = make_line_vis(values)
+        vis2 = make_line_vis([dict(row) for row in values])
+        fingerprint = vis1.fingerprint()
+        nt.assert_equal(len(fingerprint), 40)
+        nt.assert_equal(fingerprint, vis2.fingerprint())
+
+        # Property order doesn't matter.
+        vis3 = make_line_vis(values)
+        del vis3.width
+        vis3.width = 100
+        nt.assert_equal(vis3.fingerprint(), fingerprint)
+
+        # Changes are detected.
+        vis2.marks[0].type = 'area'
+        nt.assert_not_equal(vis2.fingerprint(), fingerprint)
+        vis2.marks[0].type = 'line'
+        nt.assert_equal(vis2.fingerprint(), fingerprint)
+        rows = vis2.data[0].values
+        vis2.data[0].values = rows + [{'x': 100, 'y': 50, 'c': 'b'}]
+        nt.assert_not_equal(vis2.fingerprint(), fingerprint)
+        vis2.data[0].values = rows
+        nt.assert_equal(vis2.fingerprint(), fingerprint)
+
+        # Fingerprints are cached until changed in place contents are
+        # invalidated.
+        cached = vis2._cache['fingerprint']
+        nt.assert_equal(vis2.fingerprint(), fingerprint)
+        nt.assert_is(vis2._cache['fingerprint'], cached)
+        vis2.data[0].values[0]['y'] = 3.0
+        nt.assert_equal(vis2.fingerprint(), fingerprint)
+        vis2.data[0].invalidate()
+        nt.assert_not_equal(vis2.fingerprint(), fingerprint)
+        vis2.data[0].values[0]['y'] = 0.0
+        vis2.data[0].invalidate()
+        nt.assert_equal(vis2.fingerprint(), fingerprint)
+
+        # Data of different types and layouts
+        fingerprints = set()
+        for values in ([1, 2, 3], [1.0, 2.0, 3.0], [1, 2, 4],
+                       [{'x': 1}, {'x': 2, 'y': 3}], [{'x': 1}, {'x': None}],
+                       [{'x': 1}, {'y': 1}], [{'x': 1}, {'x': 1}]):
+            fingerprints.add(Data('table', values=values).fingerprint())
+        nt.assert_equal(len(fingerprints), 7)
+
+
+def test_minified():
+    """Test grammar minification"""
+    vis = Visualization(width=500, height=300)
+    vis.grammar['viewport'] = None
+    vis.data['table'] = Data(name='table',
+                             values=[{'x': 1.0, 'y': None, 'z': 0.5}])
+    vis.scales['x'] = Scale(name='x', type='linear',
+                            domain=DataRef(data='table', field='data.x'))
+    vis.scales['y'] = Scale(name='y', type='log', domain_min=2.0)
+    vis.marks.append(Mark(type='rect', ease='cubic-in-out',
+                          from_=MarkRef(data='table')))
+    vis.marks[0].grammar['key'] = None
+    vis.grammar['extra'] = {'a': None}
+
+    expected = {
+        'height': 300,
+        'data': [{'name': 'table', 'values': [{'x': 1, 'y': None,
+                                               'z': 0.5}]}],
+        'scales': [{'name': 'x', 'domain': {'data': 'table',
+                                            'field': 'data.x'}},
+                   {'name': 'y', 'type': 'log', 'domainMin': 2}],
+        'axes': [],
+        'marks': [{'type': 'rect', 'from': {'data': 'table'}}],
+        'extra': {'a': None}}
+    nt.assert_equal(minified(vis), expected)
+    nt.assert_equal(minified(vis.grammar(), Visualization), expected)
+    nt.assert_is_instance(minified(vis)['data'][0]['values'][0]['x'], int)
+    nt.assert_equal(json.loads(vis.to_json(minify=True)), expected)
+    nt.assert_not_in(' ', vis.to_json(minify=True))
+    nt.assert_equal(vis.grammar['width'], 500)
+
+
 class TestVisualization(object):
     """Test the Visualization Class"""
 
@@ -297,6 +694,168 @@ class TestVisualization(object):
         actual, tested = json.loads(pretty), json.loads(test.to_json())
         nt.assert_dict_equal(actual, tested)
 
+    def test_from_json(self):
+        """Test loading a visualization from JSON"""
+
+        vis = Visualization(width=300)
+        vis.data['table'] = Data.from_iter([1, 2, 3])
+        vis.scales['x'] = Scale(name='x', type='ordinal',
+                                domain=DataRef(data='table',
+                                               field='data.idx'))
+        vis.axes.append(Axis(type='x', scale='x'))
+        enter = PropertySet(x=ValueRef(scale='x', field='data.idx'))
+        vis.marks.append(Mark(type='rect', from_=MarkRef(data='table'),
+                              properties=MarkProperties(enter=enter)))
+        text = vis.to_json()
+
+        loaded = Visualization.from_json(text)
+        nt.assert_equal(json.loads(loaded.to_json()), json.loads(text))
+        nt.assert_equal(loaded.fingerprint(), vis.fingerprint())
+        nt.assert_is_instance(loaded.data['table'], Data)
+        nt.assert_is_instance(loaded.scales['x'].domain, DataRef)
+        nt.assert_equal(loaded.axes.attr_name, 'type')
+        nt.assert_is_instance(loaded.axes['x'], Axis)
+        mark = loaded.marks[0]
+        nt.assert_equal(mark.from_.data, 'table')
+        nt.assert_is_instance(mark.properties.enter.x, ValueRef)
+        nt.assert_equal(mark.properties.enter.x.field, 'data.idx')
+
+        # Unknown keys and invalid values are kept as they are
+        loaded = Visualization.from_json(
+            '{"width": -1, "extra": {"a": [1]}, "data": []}')
+        nt.assert_equal(loaded.width, -1)
+        nt.assert_equal(loaded.grammar['extra'], {'a': [1]})
+
+    def test_from_grammar(self):
+        """Test building a visualization from its grammar"""
+
+        grammar = {
+            'width': 300,
+            'data': [{'name': 'table', 'values': [{'x': 1}]}],
+            'axes': [{'type': 'x', 'scale': 'x'}],
+            'marks': [{'type': 'rect', 'from': {'data': 'table'},
+                       'properties': {'enter': {'x': {'field': 'data.x'}}}}]}
+        for trusted in (True, False):
+            vis = Visualization.from_grammar(grammar, trusted=trusted)
+            nt.assert_equal(vis.grammar(), dict(grammar, scales=[]))
+            nt.assert_is_instance(vis.data['table'], Data)
+            nt.assert_equal(vis.axes.attr_name, 'type')
+            mark = vis.marks[0]
+            nt.assert_is_instance(mark.properties.enter.x, ValueRef)
+            nt.assert_equal(mark.from_.data, 'table')
+            mark.validate()
+
+            # Children invalidate the cached output of their parents.
+            vis.to_json(cache=True)
+            mark.properties.enter.x.field = 'data.y'
+            nt.assert_equal(json.loads(vis.to_json(cache=True))['marks'][0]
+                            ['properties']['enter']['x']['field'], 'data.y')
+
+        # Only untrusted grammar is validated.
+        mark = Mark.from_grammar({'type': 'bogus'})
+        nt.assert_raises(ValidationError, mark.validate)
+        nt.assert_raises(ValueError, Mark.from_grammar, {'type': 'bogus'},
+                         trusted=False)
+
+    def test_diff(self):
+        """Test JSON Patch between visualizations"""
+
+        vis = Visualization(width=300)
+        vis.data['table'] = Data.from_iter(range(100))
+        vis.scales['x'] = Scale(name='x', domain=[0, 100])
+        vis.axes.append(Axis(type='x', scale='x'))
+        nt.assert_equal(vis.diff(copy.deepcopy(vis)), [])
+
+        other = copy.deepcopy(vis)
+        other.data['table'].values.extend([{'x': 100, 'y': 1}])
+        other.data['table'].invalidate()
+        other.scales['x'].domain = [0, 101]
+        other.axes.pop()
+        del other.width
+        patch = vis.diff(other)
+        nt.assert_equal(patch, [
+            {'op': 'remove', 'path': '/width'},
+            {'op': 'remove', 'path': '/axes/0'},
+            {'op': 'add', 'path': '/data/0/values/-',
+             'value': {'x': 100, 'y': 1}},
+            {'op': 'replace', 'path': '/scales/0/domain', 'value': [0, 101]}])
+
+        other.data['table'].values[50] = {'x': 50, 'y': 0}
+        other.data['table'].invalidate()
+        patch = vis.diff(other)
+        nt.assert_in({'op': 'replace', 'path': '/data/0/values/50',
+                      'value': {'x': 50, 'y': 0}}, patch)
+        nt.assert_equal(len(patch), 5)
+
+        # Diffs compare the contents, so rows changed in place are found
+        # without invalidating.
+        other.data['table'].values[60]['y'] = -1
+        nt.assert_in({'op': 'replace', 'path': '/data/0/values/60',
+                      'value': {'x': 60, 'y': -1}}, vis.diff(other))
+
+        with nt.assert_raises(ValueError):
+            vis.diff(Data())
+
+    def test_apply_patch(self):
+        """Test applying JSON Patches"""
+
+        vis = Visualization()
+        vis.data['table'] = Data.from_iter(range(10))
+        other = copy.deepcopy(vis)
+        other.scales['x'] = Scale(name='x', type='ordinal')
+        other.data['table'].values = other.data['table'].values[2:]
+        other.marks.append(Mark(type='rect', from_=MarkRef(data='table')))
+
+        patch = json.loads(json.dumps(vis.diff(other)))
+        vis.apply_patch(patch)
+        nt.assert_equal(json.loads(vis.to_json()),
+                        json.loads(other.to_json()))
+        nt.assert_is_instance(vis.scales['x'], Scale)
+        nt.assert_is_instance(vis.marks[0].from_, MarkRef)
+        nt.assert_equal(vis.fingerprint(), other.fingerprint())
+
+        vis.apply_patch([
+            {'op': 'test', 'path': '/data/0/values/0', 'value':
+             {'x': 2, 'y': 2}},
+            {'op': 'copy', 'from': '/scales/0', 'path': '/scales/-'},
+            {'op': 'move', 'from': '/scales/1/type', 'path': '/width'}])
+        nt.assert_is_instance(vis.scales[1], Scale)
+        nt.assert_is_none(vis.scales[1].type)
+        nt.assert_equal(vis.grammar['width'], 'ordinal')
+
+        for patch in ([{'op': 'test', 'path': '/data/0/values/0/x',
+                        'value': 0}],
+                      [{'op': 'remove', 'path': '/data/5'}],
+                      [{'op': 'replace', 'path': '/height', 'value': 1}],
+                      [{'op': 'add', 'path': 'width', 'value': 1}],
+                      [{'op': 'frobnicate', 'path': '/width'}]):
+            with nt.assert_raises(ValueError):
+                vis.apply_patch(patch)
+
+    def test_from_json_lazy_values(self):
+        """Test long data values are decoded on access"""
+
+        vis = Visualization()
+        rows = [{'x': i, 'y': 'a[b]"c' if i == 5 else 'a[b]'}
+                for i in range(100)]
+        vis.data['lazy'] = Data(name='lazy', values=rows[:5] * 20)
+        vis.data['eager'] = Data(name='eager', values=rows)
+        text = vis.to_json()
+
+        loaded = Visualization.from_json(text, lazy_threshold=100)
+        lazy = loaded.data['lazy']
+        nt.assert_equal(type(lazy.grammar['values']).__name__, 'RawJSON')
+        nt.assert_equal(type(loaded.data['eager'].grammar['values']), list)
+        nt.assert_equal(json.loads(loaded.to_json()), json.loads(text))
+        nt.assert_equal(loaded.fingerprint(), vis.fingerprint())
+
+        nt.assert_equal(lazy.values, rows[:5] * 20)
+        nt.assert_equal(type(lazy.grammar['values']), list)
+        nt.assert_equal(loaded.fingerprint(), vis.fingerprint())
+
+        loaded = Visualization.from_json(text, lazy_threshold=None)
+        nt.assert_equal(type(loaded.data['lazy'].grammar['values']), list)
+
 
 class TestData(object):
     """Test the Data class"""
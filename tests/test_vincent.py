@@ -121,6 +121,43 @@ class TestVincent(object):
                                       'field')
         assert self.testvin.vega['scales'][0]['domain']['field'] == 'data.y'
 
+    def test_batch(self):
+        '''Test batch updates'''
+
+        builds = []
+        build_vega = self.testvin.build_vega
+
+        def counted_build(*args):
+            builds.append(args)
+            build_vega(*args)
+        self.testvin.build_vega = counted_build
+
+        with self.testvin.batch():
+            with self.testvin.batch():
+                self.testvin.update_vis(width=1000)
+                self.testvin.build_component(axes=[{"scale": "x"}])
+            self.testvin.multi_update([('add', 'w', 'axes', 0, 'scale'),
+                                       ('add', 'x', 'axes', 0, 'type')])
+            self.testvin.build_vega('viewport')
+            assert self.testvin._vega['width'] == 600
+        assert builds.count(('viewport',)) == 2
+        vega = self.testvin.vega
+        assert vega['width'] == 1000
+        assert vega['axes'] == [{'scale': 'w', 'type': 'x'}]
+        assert 'viewport' not in vega
+
+        # The vega dict is up to date when read in a batch.
+        with self.testvin.batch():
+            self.testvin.update_vis(height=100)
+            assert self.testvin.vega['height'] == 100
+
+        # Charts build the vega dict with their final contents.
+        for chart in (vincent.Bar, vincent.Area, vincent.Line,
+                      vincent.Scatter):
+            vis = chart()
+            assert vis.vega['marks'] == vis.marks
+            assert vis.vega['width'] == vis.width
+
     def test_tabular_data(self):
         '''Test tabular data input'''
 
@@ -204,6 +241,82 @@ class TestVincent(object):
         nt.assert_raises_regexp(ValueError, 'invalid.*dimensions',
                                 self.testvin.tabular_data, array)
 
+    def test_tabular_resample(self):
+        '''Test time resampling of tabular data'''
+
+        index = pd.date_range('2013-01-01', periods=3 * 24 * 60, freq='T')
+        s = pd.Series(np.arange(index.size), index=index, name='Serie')
+        days = [time.mktime(t.timetuple()) * 1000
+                for t in pd.date_range('2013-01-01', periods=3)]
+
+        self.testvin.tabular_data(s, resample='max')
+        values = self.testvin.data[0]['values']
+        nt.assert_list_equal([v['x'] for v in values], days)
+        nt.assert_list_equal([v['y'] for v in values],
+                             [1439, 2879, 4319])
+        assert self.testvin.scales[0]['nice'] == 'day'
+
+        df = pd.DataFrame({'a': s, 'b': -s})
+        self.testvin.tabular_data(df, columns=['b'], axis_time='hour',
+                                  resample='mean')
+        values = self.testvin.data[0]['values']
+        nt.assert_equal(len(values), 72)
+        nt.assert_equal(values[0]['y'], -29.5)
+
+        # Gaps are dropped
+        self.testvin.tabular_data(s[::2 * 24 * 60], resample='sum')
+        values = self.testvin.data[0]['values']
+        nt.assert_list_equal([v['x'] for v in values], days[::2])
+        nt.assert_list_equal([v['y'] for v in values], [0, 2880])
+        self.testvin.tabular_data(df[::2 * 24 * 60], columns=['b'],
+                                  use_index=True, resample='last')
+        nt.assert_equal(len(self.testvin.data[0]['values']), 2)
+
+        nt.assert_raises(ValueError, self.testvin.tabular_data, s,
+                         resample='median')
+        nt.assert_raises(ValueError, self.testvin.tabular_data, [1, 2],
+                         resample='mean')
+        nt.assert_raises(ValueError, self.testvin.tabular_data, df,
+                         columns=['a', 'b'], resample='mean')
+        nt.assert_raises_regexp(ValueError, 'column',
+                                self.testvin.tabular_data, df,
+                                use_index=True, resample='mean')
+
+    def test_tabular_pandas(self):
+        '''Test Pandas tabular data matches the row by row conversion'''
+
+        def rows(pairs):
+            return [{'x': vincent.Vega._serial_value(x),
+                     'y': vincent.Vega._serial_value(y)} for x, y in pairs]
+
+        index = pd.period_range('2013-01', periods=4, freq='M')
+        s = pd.Series([1.5, np.nan, 3, 4], index=index)
+        self.testvin.tabular_data(s)
+        values = self.testvin.data[0]['values']
+        nt.assert_list_equal(values, rows(s.iteritems()))
+        nt.assert_is_none(values[1]['y'])
+
+        # Columns are cast to the row type, as DataFrame.iterrows does.
+        df = pd.DataFrame({'a': [1, 2, 3], 'b': [0.5, np.nan, 2.5]},
+                          index=pd.date_range('2013-01-01', periods=3))
+        self.testvin.tabular_data(df, columns=['a'], use_index=True)
+        values = self.testvin.data[0]['values']
+        nt.assert_list_equal(values, rows((x, r['a'])
+                                          for x, r in df.iterrows()))
+        nt.assert_is(type(values[0]['y']), float)
+
+        df['c'] = pd.date_range('2013-01-01', periods=3)
+        df['d'] = ['x', None, 'z']
+        self.testvin.tabular_data(df, columns=['c', 'a'])
+        values = self.testvin.data[0]['values']
+        nt.assert_list_equal(values, rows((r['c'], r['a'])
+                                          for _, r in df.iterrows()))
+        nt.assert_is(type(values[0]['y']), int)
+        self.testvin.tabular_data(df, columns=['b', 'd'], append=True)
+        nt.assert_list_equal(values[-3:], [{'x': 0.5, 'y': 'x'},
+                                           {'x': None, 'y': None},
+                                           {'x': 2.5, 'y': 'z'}])
+
     def test_axis_title(self):
         '''Test the addition of axis and title labels'''
 
@@ -266,6 +379,56 @@ class TestVincent(object):
             vis4 = vis3 - ('domain', 'scales', 0)
             assert_vega_equal(vis1, vis4)
 
+    def test_add_sub_shared_data(self):
+        '''Test add and subtract share the data of the original'''
+        import shutil
+        import tempfile
+
+        vis = vincent.Bar()
+        vis.tabular_data(range(100))
+        marks = vis.marks[0]
+        variant = vis + ('red', 'marks', 0, 'properties', 'update', 'fill',
+                         'value')
+        nt.assert_is(variant.data[0]['values'], vis.data[0]['values'])
+        nt.assert_equal(marks['properties']['update']['fill']['value'],
+                        '#2a3140')
+        nt.assert_equal(variant.vega['marks'][0]['properties']['update'],
+                        {'fill': {'value': 'red'}})
+
+        variant = vis - ('y2', 'marks', 0, 'properties', 'enter')
+        nt.assert_in('y2', marks['properties']['enter'])
+        nt.assert_not_in('y2', variant.marks[0]['properties']['enter'])
+        variant = variant - ('values', 'data', 0)
+        nt.assert_not_in('values', variant.data[0])
+        nt.assert_equal(len(vis.data[0]['values']), 100)
+        nt.assert_equal(vis.vega['data'], vis.data)
+
+        # Later changes to either object don't leak into the other.
+        variant = vis + ('linear', 'scales', 0, 'type')
+        variant += ('red', 'marks', 0, 'properties', 'update', 'fill')
+        variant.update_component('add', 'Title', 'axes', 0, 'title')
+        variant.tabular_data([4, 5], append=True)
+        variant -= (0, 'data', 0, 'values')
+        nt.assert_equal(marks['properties']['update']['fill']['value'],
+                        '#2a3140')
+        nt.assert_not_in('title', vis.axes[0])
+        nt.assert_equal(len(vis.data[0]['values']), 100)
+        nt.assert_equal(vis.data[0]['values'][0]['x'], 0)
+        nt.assert_equal(len(variant.data[0]['values']), 101)
+        nt.assert_equal(variant.data[0]['values'][0]['x'], 1)
+
+        variant = vis + ('linear', 'scales', 0, 'type')
+        variant.data[0]['format'] = {'type': 'json'}
+        nt.assert_not_in('format', vis.data[0])
+        tmp = tempfile.mkdtemp()
+        try:
+            variant.to_json(path.join(tmp, 'vega.json'), split_data=True,
+                            data_path=path.join(tmp, 'data.json'))
+        finally:
+            shutil.rmtree(tmp)
+        nt.assert_equal(sorted(vis.data[0]), ['name', 'values'])
+        nt.assert_equal(len(vis.data[0]['values']), 100)
+
     def test_datetimeandserial(self):
         '''Test pandas serialization and datetime parsing'''
         rng = pd.date_range('1/1/2013', periods=30, freq='D')
@@ -330,6 +493,175 @@ class TestVincent(object):
                 any_order=True)
             mock_open.reset_mock()
 
+    def test_to_json_pyramid(self):
+        '''Test multi-resolution data output'''
+        import json
+        import shutil
+        import tempfile
+
+        line = vincent.Line()
+        line.tabular_data(np.sin(np.arange(5000) / 100.))
+        tmp = tempfile.mkdtemp()
+        try:
+            spec_path = path.join(tmp, 'vega.json')
+            data_path = path.join(tmp, 'data.json')
+            line.to_json(spec_path, data_path=data_path,
+                         pyramid=(10, 100, 1000))
+
+            with open(path.join(tmp, 'data_manifest.json')) as f:
+                manifest = json.load(f)
+            nt.assert_equal(manifest['name'], 'table')
+            nt.assert_equal(manifest['domain'], [0, 4999])
+            factors = [level['factor'] for level in manifest['levels']]
+            nt.assert_equal(factors, [1000, 100, 10, 1])
+            nt.assert_equal(manifest['levels'][-1]['url'], data_path)
+
+            for level in manifest['levels']:
+                with open(level['url']) as f:
+                    rows = json.load(f)
+                nt.assert_equal(len(rows), level['rows'])
+                nt.assert_almost_equal(max(r['y'] for r in rows), 1, 3)
+                nt.assert_almost_equal(min(r['y'] for r in rows), -1, 3)
+
+            # The grammar references the coarsest level.
+            with open(spec_path) as f:
+                spec = json.load(f)
+            nt.assert_equal(spec['data'][0]['url'],
+                            path.join(tmp, 'data_1000.json'))
+            nt.assert_not_in('values', spec['data'][0])
+            nt.assert_equal(len(line.data[0]['values']), 5000)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_to_json_max_bytes(self):
+        '''Test output byte budget'''
+        import json
+        import shutil
+        import tempfile
+        import warnings
+        from vincent.downsample import DataReductionWarning
+
+        line = vincent.Line()
+        line.tabular_data(np.sin(np.arange(5000) / 100.))
+        tmp = tempfile.mkdtemp()
+        try:
+            spec_path = path.join(tmp, 'vega.json')
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                line.to_json(spec_path, max_bytes=20000)
+            nt.assert_true(caught)
+            nt.assert_true(all(w.category is DataReductionWarning
+                               for w in caught))
+            nt.assert_less_equal(path.getsize(spec_path), 20000)
+            with open(spec_path) as f:
+                spec = json.load(f)
+            nt.assert_less(len(spec['data'][0]['values']), 5000)
+            nt.assert_equal(len(line.data[0]['values']), 5000)
+
+            # Other data sets are reduced when the data is split too.
+            other = {'name': 'other',
+                     'values': [{'x': i, 'y': 0.123456789 * i}
+                                for i in range(300)]}
+            line.data.append(other)
+            line.build_vega()
+            data_path = path.join(tmp, 'data.json')
+            with warnings.catch_warnings(record=True):
+                warnings.simplefilter('always')
+                line.to_json(spec_path, split_data=True,
+                             data_path=data_path, max_bytes=40000)
+            with open(spec_path) as f:
+                spec = json.load(f)
+            nt.assert_equal(spec['data'][0]['url'], data_path)
+            nt.assert_equal(spec['data'][1]['values'][1]['y'], 0.1)
+            with open(data_path) as f:
+                nt.assert_less(len(json.load(f)), 5000)
+            nt.assert_equal(len(line.data), 2)
+            nt.assert_equal(len(line.data[0]['values']), 5000)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_to_json_compress(self):
+        '''Test gzip-compressed output'''
+        import gzip
+        import json
+        import shutil
+        import tempfile
+
+        line = vincent.Line()
+        line.tabular_data(np.sin(np.arange(5000) / 100.))
+        tmp = tempfile.mkdtemp()
+        try:
+            spec_path = path.join(tmp, 'vega.json.gz')
+            data_path = path.join(tmp, 'data.json.gz')
+            line.to_json(spec_path, split_data=True, data_path=data_path,
+                         pyramid=(10,), compress=True)
+            with gzip.open(spec_path) as f:
+                spec = json.load(f)
+            nt.assert_equal(spec['data'][0]['url'],
+                            path.join(tmp, 'data_10.json.gz'))
+            with gzip.open(data_path) as f:
+                nt.assert_equal(json.load(f), line.data[0]['values'])
+            with gzip.open(path.join(tmp, 'data_manifest.json.gz')) as f:
+                nt.assert_equal(len(json.load(f)['levels']), 2)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_to_json_binary(self):
+        '''Test binary column output'''
+        import json
+        import shutil
+        import tempfile
+
+        line = vincent.Line()
+        line.tabular_data(np.sin(np.arange(100) / 10.))
+        tmp = tempfile.mkdtemp()
+        try:
+            spec_path = path.join(tmp, 'vega.json')
+            data_path = path.join(tmp, 'data.json')
+            line.to_json(spec_path, data_path=data_path, binary=True)
+            with open(spec_path) as f:
+                nt.assert_equal(json.load(f)['data'][0]['url'], data_path)
+            with open(data_path) as f:
+                manifest = json.load(f)
+            nt.assert_equal(manifest['rows'], 100)
+            x, y = manifest['columns']
+            nt.assert_equal(x['type'], 'int32')
+            nt.assert_equal(np.fromfile(x['url'], '<i4').tolist(), range(100))
+            nt.assert_equal(np.fromfile(y['url'], '<f8').tolist(),
+                            [row['y'] for row in line.data[0]['values']])
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_to_json_minify(self):
+        '''Test minified output'''
+        import json
+        import shutil
+        import tempfile
+
+        line = vincent.Line()
+        line.tabular_data([1.0, 2.5, None])
+        tmp = tempfile.mkdtemp()
+        try:
+            spec_path = path.join(tmp, 'vega.json')
+            line.to_json(spec_path)
+            with open(spec_path) as f:
+                text = f.read()
+            expected, size = json.loads(text), len(text)
+            nt.assert_is_none(expected['viewport'])
+
+            min_path = path.join(tmp, 'vega.min.json')
+            line.to_json(min_path, minify=True)
+            with open(min_path) as f:
+                text = f.read()
+            spec = json.loads(text)
+            nt.assert_not_in('\n', text)
+            nt.assert_not_in('viewport', spec)
+            nt.assert_less(len(text), size)
+            nt.assert_equal(spec['data'], expected['data'])
+            nt.assert_equal(spec['marks'], expected['marks'])
+        finally:
+            shutil.rmtree(tmp)
+
     def test_deepcopy(self):
         '''Test class deepcopy behavior'''
         from copy import deepcopy
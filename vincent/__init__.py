@@ -5,4 +5,5 @@ from vega import (
     MarkProperties, PropertySet, ValueRef, AxisProperties)
 from factories import (BarFactory)
 import charts
+import transforms
 from ipynb import init_d3, init_vg, display_vega
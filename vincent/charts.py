@@ -4,8 +4,8 @@
 Charts: Constructors for different chart types in Vega grammar.
 
 """
-from .vega import (Data, Visualization, Scale, DataRef, Mark, MarkRef,
-                   MarkProperties, PropertySet, ValueRef, Axis)
+from .vega import (Data, Visualization, Scale, Mark, PropertySet, ValueRef,
+                   Axis, LoadError)
 
 try:
     import pandas as pd
@@ -36,6 +36,87 @@ def data_type(data, iter_pairs):
         raise ValueError('This data type is not supported by Vincent.')
 
 
+def fold_top_n(x, y, n, other='Other'):
+    """Keep the ``n`` largest categories and fold the rest into one
+
+    The ``n`` largest values are selected with ``numpy.argpartition``, so
+    no full sort of the data is done. Kept categories retain their original
+    order and the folded category is appended last.
+
+    Parameters:
+    -----------
+    x: iterable
+        Category labels
+    y: iterable
+        Category values, same length as ``x``
+    n: int
+        Number of categories to keep
+    other: string, default 'Other'
+        Label of the category holding the sum of the remaining values
+
+    Output:
+    -------
+    Tuple of (labels, values) lists
+
+    Example:
+    -------
+    >>>fold_top_n(['a', 'b', 'c', 'd'], [5, 1, 7, 2], 2)
+    (['a', 'c', 'Other'], [5, 7, 3])
+
+    """
+    if not np:
+        raise LoadError('numpy could not be imported')
+    if n < 1:
+        raise ValueError('top_n must be a positive integer')
+
+    x = list(x)
+    y = np.asarray(y)
+    if len(x) != len(y):
+        raise ValueError('iterables must all be same length')
+    if len(x) <= n:
+        return x, y.tolist()
+
+    keep = np.argpartition(-y, n - 1)[:n]
+    keep.sort()
+    rest = np.ones(len(y), dtype=bool)
+    rest[keep] = False
+
+    labels = [x[i] for i in keep] + [other]
+    values = y[keep].tolist() + [y[rest].sum().item()]
+    return labels, values
+
+
+def top_n_data(data, n, other='Other', iter_pairs=False):
+    """Apply :func:`fold_top_n` to any data accepted by :func:`data_type`
+
+    A dict of iterables (``iter_pairs``) must have ``'x'`` and ``'y'`` keys
+    and is returned in the same form. All other inputs are returned as a
+    list of (label, value) pairs. Pandas DataFrames must have a single
+    column, which is used with the index as labels.
+    """
+    if iter_pairs:
+        labels, values = fold_top_n(data['x'], data['y'], n, other)
+        return {'x': labels, 'y': values}
+
+    if pd and isinstance(data, pd.DataFrame):
+        if len(data.columns) != 1:
+            raise ValueError('top_n requires a DataFrame with one column')
+        data = data[data.columns[0]]
+    if pd and isinstance(data, pd.Series):
+        x, y = data.index.tolist(), data.values
+    elif isinstance(data, dict):
+        x, y = data.keys(), data.values()
+    elif isinstance(data, (list, tuple)):
+        if type(data[0]) in (list, tuple):
+            x, y = zip(*data)
+        else:
+            x, y = range(len(data)), data
+    else:
+        raise ValueError('This data type is not supported by Vincent.')
+
+    return zip(*fold_top_n(x, y, n, other))
+
+
 class Chart(Visualization):
     """Abstract Base Class for all Chart types"""
 
@@ -81,30 +162,57 @@ class Chart(Visualization):
 class Bar(Chart):
     """Vega Bar chart"""
 
-    def __init__(self, *args, **kwargs):
-        """Create a Vega Bar Chart"""
+    def __init__(self, data=None, *args, **kwargs):
+        """Create a Vega Bar Chart
+
+        Parameters:
+        -----------
+        top_n: int, default None
+            Keep only the ``top_n`` largest bars and fold the remaining
+            categories into a single bar. The folding is done before the
+            ``Data`` is built, which bounds the size of the spec for data
+            with many categories.
+        other: string, default 'Other'
+            Label of the folded bar. Only used if ``top_n`` is set.
+
+        Example:
+        -------
+        >>>vis = vincent.Bar(long_tail_dict, top_n=20)
+
+        """
+        top_n = kwargs.pop('top_n', None)
+        other = kwargs.pop('other', 'Other')
+        if top_n is not None and data is not None:
+            iter_pairs = kwargs.get('iter_pairs', args[0] if args else False)
+            data = top_n_data(data, top_n, other, iter_pairs)
 
-        super(Bar, self).__init__(*args, **kwargs)
+        super(Bar, self).__init__(data, *args, **kwargs)
 
+        #The fixed parts of the chart are built from their grammar, without
+        #validating every property.
         #Scales
-        self.scales['x'] = Scale(name='x', type='ordinal', range='width',
-                                 domain=DataRef(data='table', field='data.x'))
-        self.scales['y'] = Scale(name='y', range='height', nice=True,
-                                 domain=DataRef(data='table', field='data.y'))
-        self.axes.extend([Axis(type='x', scale='x'),
-                          Axis(type='y', scale='y')])
+        self.scales.extend([
+            Scale.from_grammar({'name': 'x', 'type': 'ordinal',
+                                'range': 'width',
+                                'domain': {'data': 'table',
+                                           'field': 'data.x'}}),
+            Scale.from_grammar({'name': 'y', 'range': 'height', 'nice': True,
+                                'domain': {'data': 'table',
+                                           'field': 'data.y'}})])
+        self.axes.extend([Axis.from_grammar({'type': 'x', 'scale': 'x'}),
+                          Axis.from_grammar({'type': 'y', 'scale': 'y'})])
 
         #Marks
-        enter_props = PropertySet(x=ValueRef(scale='x', field='data.x'),
-                                  y=ValueRef(scale='y', field='data.y'),
-                                  width=ValueRef(scale='x', band=True, offset=-1),
-                                  y2=ValueRef(scale='y', value=0))
+        enter_props = {'x': {'scale': 'x', 'field': 'data.x'},
+                       'y': {'scale': 'y', 'field': 'data.y'},
+                       'width': {'scale': 'x', 'band': True, 'offset': -1},
+                       'y2': {'scale': 'y', 'value': 0}}
 
-        update_props = PropertySet(fill=ValueRef(value='steelblue'))
+        update_props = {'fill': {'value': 'steelblue'}}
 
-        mark = Mark(type='rect', from_=MarkRef(data='table'),
-                    properties=MarkProperties(enter=enter_props,
-                                              update=update_props))
+        mark = Mark.from_grammar({'type': 'rect', 'from': {'data': 'table'},
+                                  'properties': {'enter': enter_props,
+                                                 'update': update_props}})
 
         self.marks.append(mark)
 
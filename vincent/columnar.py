@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+
+Columnar: Binary output of the numeric columns of data values.
+
+Numeric columns are written as raw little-endian buffers, which the
+browser reads into typed arrays without parsing any text. A small JSON
+manifest lists the column files, and holds the other columns as JSON.
+The HTML scaffold recognizes the manifest when it is used as a data url,
+and rebuilds the rows of data from the columns.
+
+"""
+from __future__ import (print_function, division)
+import os
+from collections import OrderedDict
+
+from . import encoding
+from .vega import LoadError, minified
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+_int32 = (-2 ** 31, 2 ** 31 - 1)
+_max_exact = 2 ** 53
+
+
+def _is_number(value):
+    """True for the int and float values of numeric columns"""
+    return (isinstance(value, (int, long, float, np.number)) and
+            not isinstance(value, (bool, np.bool_)))
+
+
+def columns(values):
+    """Split data values into numeric arrays and other columns
+
+    Parameters
+    ----------
+    values : list of dicts or pandas.DataFrame
+        Rows of data, as in :attr:`Data.values`. The columns are those of
+        the first row.
+
+    Returns
+    -------
+    OrderedDict
+        The columns by name, as numpy arrays of ints or floats for numeric
+        columns, where missing values are NaN, or lists otherwise.
+    """
+    if not np:
+        raise LoadError('numpy could not be imported')
+
+    output = OrderedDict()
+    if pd and isinstance(values, pd.DataFrame):
+        for key in values.columns:
+            column = values[key].values
+            if column.dtype.kind in 'iuf':
+                output[str(key)] = column
+            else:
+                output[str(key)] = column.tolist()
+        return output
+
+    if not values:
+        return output
+    n = len(values)
+    for key in sorted(values[0]):
+        first = values[0][key]
+        column = None
+        if _is_number(first):
+            try:
+                column = np.fromiter((row.get(key) for row in values),
+                                     dtype=np.float64, count=n)
+            except (TypeError, ValueError):
+                pass
+        if column is not None and isinstance(first, (int, long, np.integer)):
+            integers = _integral(column)
+            if integers is not None:
+                column = integers
+        if column is None:
+            column = [row.get(key) for row in values]
+        output[key] = column
+    return output
+
+
+def _integral(column):
+    """The column as int64 if it only holds exact integers, else None"""
+    if column.dtype.kind in 'iu':
+        return column.astype(np.int64)
+    finite = np.isfinite(column)
+    if (finite.all() and (np.abs(column) < _max_exact).all() and
+            (column == np.round(column)).all()):
+        return column.astype(np.int64)
+    return None
+
+
+def _is_monotonic(column):
+    """True if a numeric column is sorted in either direction"""
+    steps = np.diff(column)
+    return bool((steps >= 0).all() or (steps <= 0).all())
+
+
+def encode_column(column, float32=False, delta=False):
+    """Binary encoding of a numeric column
+
+    Integer columns are stored as int32 if their values fit, and as
+    float64 otherwise. With ``delta``, columns of integers (or of floats
+    with integer values, such as epoch times in milliseconds) are stored
+    as the int32 differences between consecutive values, if they fit, and
+    other columns as the XOR of the bits of consecutive values, which is
+    exact and makes slowly changing series compress better.
+
+    Parameters
+    ----------
+    column : numpy.ndarray
+        Numeric column.
+    float32 : boolean, default False
+        Store float columns as float32 instead of float64, which halves
+        the size at the cost of precision.
+    delta : boolean, default False
+        Use the delta or XOR encoding.
+
+    Returns
+    -------
+    (numpy.ndarray, dict)
+        The little-endian array to write, and the description of the
+        column for the manifest: its ``type``, and ``encoding`` and
+        ``base`` value if encoded.
+    """
+    info = {}
+    integers = None
+    if delta or column.dtype.kind in 'iu':
+        integers = _integral(column)
+    if integers is not None and len(integers):
+        if delta:
+            steps = np.diff(integers)
+            if len(steps) == 0 or (steps.min() >= _int32[0] and
+                                   steps.max() <= _int32[1]):
+                array = np.empty(len(integers), dtype='<i4')
+                array[0] = 0
+                array[1:] = steps
+                info.update(type='int32', encoding='delta',
+                            base=int(integers[0]))
+                return array, info
+        elif integers.min() >= _int32[0] and integers.max() <= _int32[1]:
+            info['type'] = 'int32'
+            return integers.astype('<i4'), info
+
+    if float32 and column.dtype.kind == 'f':
+        array, words = column.astype('<f4'), '<u4'
+        info['type'] = 'float32'
+    else:
+        array, words = column.astype('<f8'), '<u8'
+        info['type'] = 'float64'
+    if delta:
+        bits = array.view(words)
+        encoded = bits.copy()
+        encoded[1:] ^= bits[:-1]
+        array = encoded
+        info['encoding'] = 'xor'
+    return array, info
+
+
+def _column_path(path, index, compress):
+    """Path of the buffer of a column, next to the manifest"""
+    root, ext = os.path.splitext(path)
+    if ext == '.gz':
+        root = os.path.splitext(root)[0]
+    return '{0}_{1}.bin{2}'.format(root, index, '.gz' if compress else '')
+
+
+def dump_columns(values, path, float32=False, delta=False, compress=False,
+                 minify=False):
+    """Write data values as binary numeric columns and a JSON manifest
+
+    Every numeric column is written to its own file, named after
+    ``path`` with the index of the column, with ``numpy.ndarray.tofile``.
+    The manifest written to ``path`` has the number of rows, and for each
+    column its name and either the url and binary type of its file, or
+    its values as JSON.
+
+    Parameters
+    ----------
+    values : list of dicts or pandas.DataFrame
+        Rows of data, as in :attr:`Data.values`.
+    path : string
+        Path of the manifest. It is also the url of the column files,
+        relative to the page displaying the data.
+    float32 : boolean, default False
+        Store floats as float32, see :func:`encode_column`.
+    delta : boolean or list of strings, default False
+        Delta or XOR encode the monotonic columns, or only the columns
+        named in the list, see :func:`encode_column`.
+    compress : boolean or int, default False
+        Gzip-compress the manifest and the columns, see
+        :func:`vincent.encoding.dump`.
+    minify : boolean, default False
+        Write the manifest with compact separators, and the floats of the
+        JSON columns in their shortest form, see
+        :func:`vincent.vega.minified`.
+
+    Returns
+    -------
+    dict
+        The manifest.
+    """
+    data = columns(values)
+    manifest = {'format': 'columns', 'rows': len(values), 'columns': []}
+    for index, (name, column) in enumerate(data.iteritems()):
+        entry = {'name': name}
+        if isinstance(column, list):
+            entry['values'] = column
+        else:
+            if delta is True:
+                encode = len(column) > 1 and _is_monotonic(column)
+            else:
+                encode = bool(delta) and name in delta
+            array, info = encode_column(column, float32, encode)
+            entry.update(info)
+            entry['url'] = _column_path(path, index, compress)
+            if compress:
+                with open(entry['url'], 'wb') as raw:
+                    gz = encoding.gzip_writer(raw, compress)
+                    try:
+                        gz.write(array.tostring())
+                    finally:
+                        gz.close()
+            else:
+                array.tofile(entry['url'])
+        manifest['columns'].append(entry)
+    if minify:
+        encoding.dump(minified(manifest), path, sort_keys=True,
+                      separators=(',', ':'), compress=compress)
+    else:
+        encoding.dump(manifest, path, sort_keys=True, compress=compress)
+    return manifest
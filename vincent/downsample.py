@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+
+Downsample: Vectorized reductions of long data series.
+
+"""
+from __future__ import (print_function, division)
+import json
+import warnings
+
+from .vega import LoadError
+from .charts import fold_top_n
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class DataReductionWarning(UserWarning):
+    """Warning issued for every reduction applied to fit a byte budget"""
+
+
+def warn_reductions(reports, stacklevel=3):
+    """Issue a :class:`DataReductionWarning` for each report of
+    :func:`fit_spec`"""
+    for report in reports:
+        warnings.warn(report, DataReductionWarning, stacklevel=stacklevel)
+
+
+def _floats(values, key):
+    """Column of a list of row dicts as a float array, nulls as NaN"""
+    return np.array([row.get(key) for row in values], dtype=float)
+
+
+def min_max_envelope(y, factor):
+    """Indices of the min/max envelope of a series
+
+    The series is split into buckets of ``factor`` consecutive points, and
+    the position of the minimum and maximum of every bucket is kept. Lines
+    drawn through the envelope keep the visual extent of the full series
+    with about ``2 / factor`` of the points.
+
+    Parameters
+    ----------
+    y : array-like
+        Values of the series. NaN values are never selected unless a whole
+        bucket is NaN.
+    factor : int
+        Bucket size.
+
+    Returns
+    -------
+    numpy.ndarray
+        Sorted, unique indices of the selected points.
+    """
+    if not np:
+        raise LoadError('numpy could not be imported')
+
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if factor <= 1 or n <= 2:
+        return np.arange(n)
+
+    buckets = -(-n // factor)
+    padded = np.empty(buckets * factor)
+    padded[:n] = y
+    padded[n:] = np.nan
+    padded = padded.reshape(buckets, factor)
+
+    missing = np.isnan(padded)
+    low = np.where(missing, np.inf, padded).argmin(axis=1)
+    high = np.where(missing, -np.inf, padded).argmax(axis=1)
+    offsets = np.arange(buckets) * factor
+
+    indices = np.unique(np.concatenate([offsets + low, offsets + high]))
+    return indices[indices < n]
+
+
+def pyramid(values, factors, y='y'):
+    """Multi-resolution levels of a series of row dicts
+
+    Parameters
+    ----------
+    values : list of dicts
+        Rows of the series, ordered by the x-values.
+    factors : iterable of ints
+        Decimation factors of the levels, e.g. ``(10, 100, 1000)``. Each
+        level is the :func:`min_max_envelope` of the series for the
+        factor. Factors that would not reduce the series, or that leave a
+        single bucket, are skipped.
+    y : string, default 'y'
+        Key of the values used for the envelope.
+
+    Returns
+    -------
+    list of (factor, rows) tuples
+        Levels ordered from the coarsest to the full series, which always
+        comes last with a factor of 1. The rows are shared with ``values``.
+    """
+    column = _floats(values, y)
+    levels = [(1, values)]
+    for factor in sorted(set(factors) - set([1])):
+        if factor >= len(values):
+            break
+        indices = min_max_envelope(column, factor)
+        if len(indices) >= len(levels[0][1]):
+            continue
+        levels.insert(0, (factor, [values[i] for i in indices]))
+    return levels
+
+
+def estimate_size(values, sample=100, depth=0, **dumps_args):
+    """Estimate the length of the JSON serialization of data values
+
+    The size is extrapolated from an evenly spaced sample of rows, so the
+    cost does not depend on the length of ``values``.
+
+    Parameters
+    ----------
+    values : list
+        Rows of data, as in :attr:`Data.values`.
+    sample : int, default 100
+        Number of rows to encode.
+    depth : int, default 0
+        Nesting level of the ``values`` list in the enclosing document,
+        to account for the indentation of the rows.
+    **dumps_args : dict
+        Keyword arguments of ``json.dumps`` used for the output.
+
+    Returns
+    -------
+    int
+        Estimated number of characters.
+    """
+    n = len(values)
+    if n <= sample:
+        rows = values
+    else:
+        rows = [values[int(i)] for i in np.linspace(0, n - 1, sample)]
+    text = json.dumps(rows, **dumps_args)
+    extra = 0
+    if dumps_args.get('indent'):
+        extra = text.count('\n') * depth * dumps_args['indent']
+    if not rows:
+        return len(text)
+    return int((len(text) + extra - 2) * n / len(rows)) + 2
+
+
+def _numeric_keys(values, exclude=()):
+    """Keys of the first row with numeric values"""
+    return [k for k, v in sorted(values[0].iteritems())
+            if isinstance(v, (int, float)) and not isinstance(v, bool)
+            and k not in exclude]
+
+
+def _mark_fields(mark):
+    """Data columns encoded by the x and y properties of a mark"""
+    enter = (mark.get('properties') or {}).get('enter') or {}
+    fields = {}
+    for key in ('x', 'y'):
+        field = (enter.get(key) or {}).get('field') or ''
+        if field.startswith('data.') and '.' not in field[5:]:
+            fields[key] = field[5:]
+    return fields
+
+
+def _target_rows(values, max_bytes, dumps_args):
+    """Number of rows of ``values`` that fit in ``max_bytes``"""
+    per_row = estimate_size(values, **dumps_args) / max(len(values), 1)
+    return max(int(max_bytes // max(per_row, 1)), 1)
+
+
+def envelope(values, keys, rows):
+    """Min/max envelope of every column of ``keys``, with at most ``rows``
+    rows"""
+    columns = [_floats(values, k) for k in keys]
+    factor = max(2, int(np.ceil(2 * len(keys) * len(values) / rows)))
+    while True:
+        indices = np.unique(np.concatenate(
+            [min_max_envelope(c, factor) for c in columns]))
+        if len(indices) <= rows or factor >= len(values):
+            return [values[i] for i in indices]
+        factor *= 2
+
+
+def _bin_codes(column, bins):
+    """Bin index of every value of a column, with NaN in its own bin"""
+    valid = ~np.isnan(column)
+    codes = np.empty(len(column), dtype=np.int64)
+    codes[~valid] = bins
+    if valid.any():
+        low, high = column[valid].min(), column[valid].max()
+        span = high - low
+        scaled = (column[valid] - low) / span * bins if span else 0
+        codes[valid] = np.clip(np.floor(scaled), 0, bins - 1)
+    return codes
+
+
+def bin_points(values, x, y, rows):
+    """Keep the first point of every occupied cell of a regular x/y grid,
+    with at most ``rows`` points"""
+    xs, ys = _floats(values, x), _floats(values, y)
+    bins = max(int(np.sqrt(rows)), 1)
+    while True:
+        codes = _bin_codes(xs, bins) * (bins + 1) + _bin_codes(ys, bins)
+        first = np.sort(np.unique(codes, return_index=True)[1])
+        if len(first) <= rows or bins == 1:
+            return [values[i] for i in first]
+        bins = max(bins * 3 // 4, 1)
+
+
+def quantize(values, digits):
+    """Round the floats of data values to ``digits`` significant digits"""
+    def rounded(value):
+        if isinstance(value, float) and value == value:
+            return float('%.*g' % (digits, value))
+        return value
+
+    return [dict((k, rounded(v)) for k, v in row.iteritems())
+            if isinstance(row, dict) else rounded(row) for row in values]
+
+
+def reduce_values(values, max_bytes, mark=None, **dumps_args):
+    """Reduce data values to fit a byte budget
+
+    The reduction depends on the type of the mark drawing the data: line
+    and area series are downsampled with a min/max envelope, symbols are
+    binned on a grid, and bars are reduced to the top values with the rest
+    folded into an "Other" bar. If the values still don't fit, or the mark
+    type has no specific reduction, floats are rounded to fewer
+    significant digits. ``values`` itself is not modified.
+
+    Parameters
+    ----------
+    values : list
+        Rows of data, as in :attr:`Data.values`.
+    max_bytes : int
+        Size budget of the serialized values.
+    mark : dict, default None
+        Grammar of the mark drawing the data.
+    **dumps_args : dict
+        Keyword arguments of ``json.dumps`` used for the output, and
+        ``depth`` as in :func:`estimate_size`.
+
+    Returns
+    -------
+    (list, list of strings)
+        The reduced values and a description of every reduction applied.
+    """
+    if not np:
+        raise LoadError('numpy could not be imported')
+
+    mark = mark or {}
+    mark_type = mark.get('type')
+    fields = _mark_fields(mark)
+    reports = []
+    n = len(values)
+    if n and isinstance(values[0], dict):
+        rows = _target_rows(values, max_bytes, dumps_args)
+        x, y = fields.get('x', 'x'), fields.get('y', 'y')
+        if mark_type in ('line', 'area'):
+            keys = [y] if 'y' in fields else _numeric_keys(values, [x])
+            if keys:
+                values = envelope(values, keys, rows)
+                reports.append('downsampled {0} from {1} to {2} rows with a '
+                               'min/max envelope'.format(mark_type, n,
+                                                         len(values)))
+        elif mark_type == 'symbol' and x in values[0] and y in values[0]:
+            values = bin_points(values, x, y, rows)
+            reports.append('binned symbol points from {0} to {1} rows'
+                           .format(n, len(values)))
+        elif (mark_type == 'rect' and set(values[0]) == set([x, y])
+              and rows > 1):
+            labels, totals = fold_top_n([row[x] for row in values],
+                                        [row[y] for row in values], rows - 1)
+            values = [{x: label, y: total}
+                      for label, total in zip(labels, totals)]
+            reports.append('kept the top {0} of {1} bars, with the rest '
+                           'folded into "Other"'.format(len(values) - 1, n))
+
+    for digits in (6, 4, 3, 2, 1):
+        if estimate_size(values, **dumps_args) <= max_bytes:
+            break
+        values = quantize(values, digits)
+        reports.append('rounded floats to {0} significant digits'
+                       .format(digits))
+    else:
+        if estimate_size(values, **dumps_args) > max_bytes:
+            reports.append('could not reduce the values below {0} bytes'
+                           .format(max_bytes))
+    return values, reports
+
+
+def fit_spec(spec, max_bytes, **dumps_args):
+    """Reduce the data of a Vega grammar to fit a byte budget
+
+    The size of every inline ``values`` list is estimated with
+    :func:`estimate_size`. If the total exceeds ``max_bytes``, the budget
+    left after the rest of the grammar is shared between the data sets in
+    proportion to their size, and each is reduced with
+    :func:`reduce_values`, according to the first mark drawing it.
+
+    Parameters
+    ----------
+    spec : dict
+        Vega grammar as a Python data structure. It is not modified.
+    max_bytes : int
+        Size budget of the serialized grammar.
+    **dumps_args : dict
+        Keyword arguments of ``json.dumps`` used for the output.
+
+    Returns
+    -------
+    (dict, list of strings)
+        The grammar, with reduced data if needed, and a description of
+        every reduction applied.
+    """
+    data = [d for d in spec.get('data') or [] if d.get('values')]
+    depth = 3
+    sizes = [estimate_size(d['values'], depth=depth, **dumps_args)
+             for d in data]
+    skeleton = dict(spec)
+    skeleton['data'] = [dict(d, values=[]) if d.get('values') else d
+                        for d in spec.get('data') or []]
+    base = len(json.dumps(skeleton, **dumps_args))
+    if base + sum(sizes) <= max_bytes:
+        return spec, []
+    budget = max_bytes - base
+    if budget <= 0:
+        raise ValueError('max_bytes is smaller than the grammar without '
+                         'data values')
+
+    marks = {}
+    for mark in spec.get('marks') or []:
+        marks.setdefault((mark.get('from') or {}).get('data'), mark)
+
+    scale = budget / sum(sizes)
+    reports = []
+    reduced = {}
+    for d, size in zip(data, sizes):
+        values, done = reduce_values(d['values'], int(size * scale),
+                                     marks.get(d.get('name')), depth=depth,
+                                     **dumps_args)
+        reduced[id(d)] = values
+        reports.extend("data '{0}': {1}".format(d.get('name'), msg)
+                       for msg in done)
+
+    spec = dict(spec)
+    spec['data'] = [dict(d, values=reduced[id(d)]) if id(d) in reduced
+                    else d for d in spec.get('data') or []]
+    return spec, reports
@@ -0,0 +1,580 @@
+# -*- coding: utf-8 -*-
+"""
+
+Encoding: JSON output of Vega grammar.
+
+All of Vincent's JSON output goes through this module. The encoding is
+done by a backend, which is the standard library ``json`` module by
+default, or one of the faster ``rapidjson`` or ``ujson`` packages if
+selected with :func:`set_backend`. Grammar objects and NumPy
+scalars and arrays are handled by every backend.
+
+Files are written by :func:`dump`, which walks the grammar tree and writes
+the text in chunks as it is produced, so that writing a large
+visualization does not build the whole text in memory. With the ``json``
+backend, the output is byte-for-byte the same as ``json.dumps`` with the
+same arguments. Files can also be gzip-compressed as they are written.
+
+"""
+from __future__ import (print_function, division)
+import json
+import gzip
+import types
+from collections import OrderedDict
+from itertools import islice, izip
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#Number of consecutive flat rows encoded by a single ``json.dumps`` call.
+_batch_size = 1000
+
+_scalar_types = (str, unicode, int, long, float, bool, type(None))
+
+_row_types = frozenset(_scalar_types + (dict, list))
+
+
+def _is_flat(obj):
+    """True if a dict or list holds only scalars"""
+    values = obj.itervalues() if isinstance(obj, dict) else obj
+    for value in values:
+        if not isinstance(value, _scalar_types):
+            return False
+    return True
+
+
+def _is_row(obj):
+    """True for scalars, and for dicts and lists of scalars"""
+    if isinstance(obj, _scalar_types):
+        return True
+    return type(obj) in (dict, list) and _is_flat(obj)
+
+
+class RawJSON(object):
+    """JSON text that is written as is, and only decoded when needed
+
+    The streaming writer copies the text to the output verbatim; the other
+    output paths decode it with :meth:`load`.
+    """
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def load(self):
+        """Decode the JSON text"""
+        return json.loads(self.text)
+
+    def __reduce__(self):
+        return RawJSON, (self.text,)
+
+    def __repr__(self):
+        return '{0}({1} characters)'.format(type(self).__name__,
+                                             len(self.text))
+
+
+def default(obj):
+    """Encoder hook for objects the JSON backends don't know about
+
+    Grammar objects are encoded as their ``grammar`` dict, and NumPy
+    scalars and arrays as the equivalent Python values. Other objects are
+    encoded as null.
+    """
+    if hasattr(obj, 'grammar'):
+        return obj.grammar
+    elif isinstance(obj, RawJSON):
+        return obj.load()
+    elif np and isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif np and isinstance(obj, np.generic):
+        return obj.item()
+    return None
+
+
+def to_plain(obj):
+    """Convert grammar to plain Python containers, as JSON would
+
+    Grammar objects, ``GrammarDict``, ``KeyedList`` and tuples are
+    converted to dicts and lists; dict keys are converted to strings and
+    other objects with :func:`default`, like the ``json`` module does.
+    Subclasses of float and int become plain floats and ints. All of the
+    containers are copied, except for the lists of data values, under a
+    ``values`` key, which are shared with ``obj`` if they are already
+    plain.
+    """
+    if hasattr(obj, 'grammar'):
+        return to_plain(obj.grammar)
+    elif isinstance(obj, dict):
+        plain = {}
+        for key, value in obj.iteritems():
+            if not isinstance(key, basestring):
+                key = _key(key)
+            if key == 'values':
+                plain[key] = _shared_plain(value)
+            else:
+                plain[key] = to_plain(value)
+        return plain
+    elif isinstance(obj, (list, tuple)):
+        return [to_plain(value) for value in obj]
+    return _shared_plain(obj)
+
+
+def _shared_plain(obj):
+    """Like :func:`to_plain`, but lists and dicts that are already plain
+    are returned as is, not copied"""
+    if isinstance(obj, basestring) or obj is None or obj is True \
+            or obj is False:
+        return obj
+    elif type(obj) in (int, long, float):
+        return obj
+    elif hasattr(obj, 'grammar'):
+        return to_plain(obj.grammar)
+    elif isinstance(obj, dict):
+        plain = {}
+        changed = type(obj) is not dict
+        for key, value in obj.iteritems():
+            if not isinstance(key, basestring):
+                key = _key(key)
+                changed = True
+            new = _shared_plain(value)
+            changed = changed or new is not value
+            plain[key] = new
+        return plain if changed else obj
+    elif isinstance(obj, (list, tuple)):
+        plain = [_shared_plain(value) for value in obj]
+        if type(obj) is list and all(a is b for a, b in zip(plain, obj)):
+            return obj
+        return plain
+    elif isinstance(obj, float):
+        return float(obj)
+    elif isinstance(obj, (int, long)):
+        return int(obj)
+    value = default(obj)
+    return None if value is None else _shared_plain(value)
+
+
+def _key(key):
+    """Convert a dict key to a string, as ``json`` does"""
+    if isinstance(key, basestring):
+        return key
+    elif key is True:
+        return 'true'
+    elif key is False:
+        return 'false'
+    elif key is None:
+        return 'null'
+    elif isinstance(key, (int, long, float)):
+        return json.dumps(key)
+    raise TypeError('key {0!r} is not a string'.format(key))
+
+
+def _records(frame):
+    """Rows of a DataFrame as lists of dicts, ``_batch_size`` at a time"""
+    keys = list(frame.columns)
+    for start in xrange(0, len(frame), _batch_size):
+        stop = start + _batch_size
+        columns = [frame[k].values[start:stop].tolist() for k in keys]
+        yield [dict(izip(keys, row)) for row in izip(*columns)]
+
+
+def _batches(rows):
+    """Split an iterable into lists of ``_batch_size`` elements"""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, _batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _json_dumps(obj, **kwargs):
+    return json.dumps(obj, **kwargs)
+
+
+def _rapidjson_dumps(obj, sort_keys=False, indent=None, **kwargs):
+    import rapidjson
+    return rapidjson.dumps(to_plain(obj), sort_keys=sort_keys,
+                           indent=indent, number_mode=rapidjson.NM_NAN)
+
+
+def _ujson_dumps(obj, sort_keys=False, indent=None, **kwargs):
+    import ujson
+    options = {}
+    if ujson.__version__.startswith('1.'):
+        # ujson 1.x rounds floats to 9 digits by default.
+        options['double_precision'] = 15
+    if indent:
+        options['indent'] = indent
+    return ujson.dumps(to_plain(obj), sort_keys=sort_keys,
+                       escape_forward_slashes=False, **options)
+
+
+#Encoding backends, from the fastest to the slowest. Only ``json`` honors
+#the ``separators`` argument; the others honor ``indent``, and use the
+#separators of ``_fixed_separators``.
+_backends = OrderedDict([
+    ('rapidjson', _rapidjson_dumps),
+    ('ujson', _ujson_dumps),
+    ('json', _json_dumps)])
+
+_compact_separators = (',', ':')
+
+
+def _fixed_separators(backend, indent, separators):
+    """Separators written by the backends other than ``json``, which raise
+    a ValueError for other ``separators``"""
+    fixed = _compact_separators if indent is None else (',', ': ')
+    if separators is not None and tuple(separators) != fixed:
+        raise ValueError('the {0} backend only writes the separators {1!r}'
+                         .format(backend, fixed))
+    return fixed
+
+_backend = 'json'
+
+
+def _is_installed(name):
+    try:
+        __import__(name)
+    except ImportError:
+        return False
+    return True
+
+
+def available_backends():
+    """Names of the installed encoding backends, fastest first"""
+    return [name for name in _backends if _is_installed(name)]
+
+
+def _resolve(name):
+    """Name of the backend to use for a ``backend`` argument"""
+    if name is None:
+        return _backend
+    if name == 'auto':
+        return available_backends()[0]
+    if name not in _backends:
+        raise ValueError('unknown JSON backend {0}, must be one of ({1})'
+                         .format(name, ', '.join(['auto'] + list(_backends))))
+    if not _is_installed(name):
+        from .vega import LoadError
+        raise LoadError(name + ' could not be imported')
+    return name
+
+
+def set_backend(name):
+    """Set the default encoding backend
+
+    Parameters
+    ----------
+    name : string
+        One of ``'json'`` (the default, from the standard library),
+        ``'rapidjson'`` or ``'ujson'``, or ``'auto'`` for the fastest
+        installed backend. Only ``json`` honors the separator options of
+        the output functions: the other backends write compact JSON, or
+        ``(',', ': ')`` separators with an indentation, and raise a
+        ValueError for other separators. ``ujson`` 1.x rounds floats to
+        15 significant digits.
+    """
+    global _backend
+    _backend = _resolve(name)
+
+
+def get_backend():
+    """Name of the default encoding backend"""
+    return _backend
+
+
+class _Encoder(object):
+    """Walk a grammar tree, yielding JSON text in chunks"""
+
+    def __init__(self, indent=None, separators=None, sort_keys=False,
+                 default=default, backend=None, cache=False, **kwargs):
+        self.backend = _resolve(backend)
+        if self.backend != 'json':
+            separators = _fixed_separators(self.backend, indent, separators)
+        elif separators is None:
+            separators = (', ', ': ')
+        self.item_separator, self.key_separator = separators
+        self.indent = indent
+        self.sort_keys = sort_keys
+        self.default = default
+        self.dumps = _backends[self.backend]
+        self.dumps_args = dict(kwargs, indent=indent, separators=separators,
+                               sort_keys=sort_keys, default=default)
+        self.cache = cache
+        # Chunks of the frozen grammar objects encoded so far
+        self.shared = {}
+        self.options = (self.backend, indent, separators, sort_keys,
+                        tuple(sorted(kwargs.items())))
+
+    def newline(self, level):
+        if self.indent is None:
+            return ''
+        return '\n' + ' ' * (self.indent * level)
+
+    def leaf(self, obj, level):
+        """Encode an object in one piece with the backend"""
+        text = self.dumps(obj, **self.dumps_args)
+        if self.indent and level:
+            text = text.replace('\n', self.newline(level))
+        return text
+
+    def iterencode(self, obj, level=0, parent=None):
+        """Encode an object at an indentation level
+
+        ``parent`` is the grammar object containing ``obj``, which is
+        registered as a parent of the grammar objects found inside when
+        the output is cached, so that changes to them invalidate it.
+        """
+        if hasattr(obj, 'grammar'):
+            if (self.cache and parent is not None and
+                    hasattr(obj, '_add_parent')):
+                obj._add_parent(parent)
+            if getattr(obj, '_frozen', False):
+                for chunk in self.iterencode_shared(obj, level):
+                    yield chunk
+                return
+            if self.cache and hasattr(obj, '_cached'):
+                for chunk in self.iterencode_cached(obj, level):
+                    yield chunk
+                return
+            parent, obj = obj, obj.grammar
+        if isinstance(obj, dict):
+            if not obj or _is_flat(obj):
+                yield self.leaf(obj, level)
+            else:
+                for chunk in self.iterencode_dict(obj, level, parent):
+                    yield chunk
+        elif isinstance(obj, (list, tuple)):
+            for chunk in self.iterencode_list(obj, level, parent):
+                yield chunk
+        elif pd and isinstance(obj, pd.DataFrame):
+            batches = ((True, batch) for batch in _records(obj))
+            for chunk in self.iterencode_elements(batches, level):
+                yield chunk
+        elif isinstance(obj, (types.GeneratorType, type(iter([])))):
+            batches = ((True, batch) for batch in _batches(obj))
+            for chunk in self.iterencode_elements(batches, level):
+                yield chunk
+        elif isinstance(obj, RawJSON):
+            yield obj.text
+        elif isinstance(obj, _scalar_types) or self.default is None:
+            yield self.leaf(obj, level)
+        else:
+            for chunk in self.iterencode(self.default(obj), level, parent):
+                yield chunk
+
+    def iterencode_cached(self, node, level):
+        """Encode a grammar object, reusing its cached output
+
+        The cache of the object holds the chunks of its last encoding, with
+        the options, the level and the signature of the grammar they were
+        encoded from. Chunks of unchanged children are shared with the
+        caches of the children.
+        """
+        key = (self.options, level)
+        signature = node._signature()
+        cached = node._cached('json')
+        if cached is None or cached[0] != key or cached[1] != signature:
+            chunks = list(self.iterencode(node.grammar, level, node))
+            cached = node._store('json', (key, signature, chunks))
+        return iter(cached[2])
+
+    def iterencode_shared(self, node, level):
+        """Encode a frozen grammar object once per output
+
+        Frozen objects can't change, and are often shared by many parents
+        (see ``GrammarClass.intern``): their chunks are kept for the rest
+        of the output, by object and indentation level.
+        """
+        key = (id(node), level if self.indent else 0)
+        chunks = self.shared.get(key)
+        if chunks is None:
+            if self.cache:
+                chunks = list(self.iterencode_cached(node, level))
+            else:
+                chunks = list(self.iterencode(node.grammar, level, node))
+            self.shared[key] = chunks
+        return iter(chunks)
+
+    def iterencode_dict(self, obj, level, parent=None):
+        items = obj.iteritems()
+        if self.sort_keys:
+            items = sorted(items, key=lambda kv: kv[0])
+        yield '{'
+        first = True
+        for key, value in items:
+            if not first:
+                yield self.item_separator
+            first = False
+            yield self.newline(level + 1)
+            yield self.dumps(_key(key)) + self.key_separator
+            for chunk in self.iterencode(value, level + 1, parent):
+                yield chunk
+        yield self.newline(level) + '}'
+
+    def iterencode_list(self, obj, level, parent=None):
+        def elements():
+            # Runs of rows (scalars, or dicts and lists of scalars) are
+            # encoded together, other elements are walked one by one. A
+            # window of plain types is taken as rows after checking the
+            # first one, as the rows of data values share the same layout.
+            n = len(obj)
+            for start in xrange(0, n, _batch_size):
+                window = obj[start:start + _batch_size]
+                if (set(map(type, window)) <= _row_types and
+                        _is_row(window[0])):
+                    yield True, window
+                    continue
+                i, stop = start, start + len(window)
+                while i < stop:
+                    j = i
+                    while j < stop and _is_row(obj[j]):
+                        j += 1
+                    if j > i:
+                        yield True, obj[i:j]
+                        i = j
+                    else:
+                        yield False, obj[i]
+                        i += 1
+
+        return self.iterencode_elements(elements(), level, parent)
+
+    def iterencode_elements(self, elements, level, parent=None):
+        """Encode a JSON array from ``(is_batch, value)`` pairs
+
+        A batch is a sequence of rows encoded in one piece, any other value
+        is a single element of the array.
+        """
+        close = self.newline(level) + ']'
+        first = True
+        for is_batch, value in elements:
+            opening = '[' if first else self.item_separator
+            if is_batch:
+                if not value:
+                    continue
+                # Strip the brackets of the encoded batch.
+                text = self.leaf(list(value), level)
+                yield opening + text[1:len(text) - len(close)]
+            else:
+                yield opening + self.newline(level + 1)
+                for chunk in self.iterencode(value, level + 1, parent):
+                    yield chunk
+            first = False
+        yield '[]' if first else close
+
+
+def iterencode(obj, **kwargs):
+    """Encode grammar to JSON, yielding the text in chunks
+
+    Parameters
+    ----------
+    obj : object
+        Grammar object, ``GrammarDict`` or Python data structure. Data
+        values may also be given as generators of rows, or as pandas
+        ``DataFrame`` objects, whose columns are the keys of the rows. These
+        are encoded a batch of rows at a time, without building the whole
+        list.
+    **kwargs : dict
+        Arguments of ``json.dumps``, and ``backend`` and ``cache`` as in
+        :func:`dumps`. With the ``json`` backend, the output is the same as
+        that of ``json.dumps`` for the same arguments.
+    """
+    return _Encoder(**kwargs).iterencode(obj)
+
+
+def dumps(obj, backend=None, indent=None, separators=None, sort_keys=False,
+          default=default, cache=False, **kwargs):
+    """Encode grammar to a JSON string
+
+    Parameters
+    ----------
+    obj : object
+        Grammar object, ``GrammarDict`` or Python data structure.
+    backend : string, default None
+        Encoding backend, as in :func:`set_backend`. If None (default), the
+        backend set with :func:`set_backend` is used.
+    cache : boolean, default False
+        If True, the output of grammar objects is cached on the objects and
+        reused while they are unchanged, see ``GrammarClass.to_json``.
+    indent, separators, sort_keys, default, **kwargs
+        Arguments of ``json.dumps``. Backends other than ``json`` only
+        write the separators described in :func:`set_backend`, and ignore
+        ``**kwargs``.
+    """
+    if cache:
+        return ''.join(iterencode(obj, backend=backend, indent=indent,
+                                  separators=separators, sort_keys=sort_keys,
+                                  default=default, cache=cache, **kwargs))
+    backend = _resolve(backend)
+    if backend == 'json':
+        return json.dumps(obj, indent=indent, separators=separators,
+                          sort_keys=sort_keys, default=default, **kwargs)
+    _fixed_separators(backend, indent, separators)
+    return _backends[backend](obj, indent=indent, sort_keys=sort_keys,
+                              default=default)
+
+
+_gzip_level = 6
+
+
+def gzip_writer(fp, compress=True):
+    """Gzip stream writing to a file, without file name or time stamp in
+    the header, so that equal contents give equal files
+
+    Parameters
+    ----------
+    fp : file-like object
+        Output file, which is not closed with the stream.
+    compress : boolean or int, default True
+        Compression level from 1 to 9, or 6 for True.
+    """
+    level = _gzip_level if compress is True else compress
+    return gzip.GzipFile(filename='', mode='wb', compresslevel=level,
+                         fileobj=fp, mtime=0)
+
+
+def dump(obj, fp, chunk_size=65536, compress=False, **kwargs):
+    """Write grammar as JSON to a file, see :func:`iterencode`
+
+    Parameters
+    ----------
+    obj : object
+        Grammar to write.
+    fp : string or file-like object
+        Path of the output file, or an object with a ``write`` method, such
+        as an open file or ``socket.makefile()``.
+    chunk_size : int, default 65536
+        Approximate size of each write.
+    compress : boolean or int, default False
+        If True, the output is gzip-compressed, at the compression level
+        given by an int from 1 to 9, or 6 for True. The gzip header has no
+        file name or time stamp, so that equal grammars give equal files.
+    **kwargs : dict
+        Arguments of :func:`dumps`.
+    """
+    if isinstance(fp, basestring):
+        with open(fp, 'wb' if compress else 'w') as f:
+            return dump(obj, f, chunk_size, compress, **kwargs)
+    if compress:
+        gz = gzip_writer(fp, compress)
+        try:
+            return dump(obj, gz, chunk_size, **kwargs)
+        finally:
+            gz.close()
+
+    buffered, size = [], 0
+    for chunk in iterencode(obj, **kwargs):
+        buffered.append(chunk)
+        size += len(chunk)
+        if size >= chunk_size:
+            fp.write(''.join(buffered))
+            buffered, size = [], 0
+    if buffered:
+        fp.write(''.join(buffered))
@@ -3,6 +3,7 @@ from copy import deepcopy
 from .vega import (
     Data, Visualization, Scale, DataRef, Mark, MarkRef, MarkProperties,
     PropertySet, ValueRef, Axis)
+from .charts import fold_top_n
 
 try:
     import pandas as pd
@@ -34,6 +35,21 @@ except ImportError:
 
 
 class BarFactory(object):
+    """Bar charts from shared templates
+
+    The scales, axes and mark of the factory can be changed at any time.
+    Charts are made from frozen snapshots of them (see
+    ``GrammarClass.freeze``), taken again when they change, which all the
+    charts share: a chart gets a shallow copy of the top-level objects, and
+    the objects below them are copied on write, when the chart modifies
+    them. Making a chart thus doesn't depend on the size of the templates,
+    and changes to a chart don't affect the factory or the other charts.
+
+    Changes to the templates are detected with their cached fingerprints
+    (see ``GrammarClass.fingerprint``): contents modified in place, such as
+    the elements of the ``range`` list of a scale, need a call to the
+    ``invalidate`` method of the object containing them.
+    """
 
     def __init__(self, x_scale=None, y_scale=None, mark=None, width=None,
                  height=None):
@@ -69,22 +85,48 @@ class BarFactory(object):
         self.padding = {'top': 10, 'left': 30, 'bottom': 20, 'right': 10}
         self.x_axis = Axis(type='x', scale='x')
         self.y_axis = Axis(type='y', scale='y')
-
-    def __call__(self, x, y, color=None, make_copies=True):
+        self._snapshots = {}
+
+    def _template(self, attr):
+        """Frozen snapshot of a template attribute, taken again when the
+        attribute is replaced or modified"""
+        obj = getattr(self, attr)
+        if obj._frozen:
+            return obj
+        fingerprint = obj.fingerprint()
+        snapshot = self._snapshots.get(attr)
+        if (snapshot is None or snapshot[0] is not obj or
+                snapshot[1] != fingerprint):
+            snapshot = self._snapshots[attr] = (obj, fingerprint,
+                                                deepcopy(obj).freeze())
+        return snapshot[2]
+
+    def __call__(self, x, y, color=None, make_copies=True, top_n=None,
+                 other='Other'):
+        """Make a bar chart
+
+        If ``make_copies`` is False, the chart contains the template
+        objects of the factory themselves, so that changes to the chart
+        change the factory and the other charts made this way.
+        """
 
         vis = Visualization(width=self.width, height=self.height,
-                            padding=self.padding)
+                            padding=dict(self.padding))
+
+        # Fold the long tail of small categories before building the data.
+        if top_n is not None:
+            x, y = fold_top_n(x, y, top_n, other)
 
-        vis.data.append(Data.from_iters(x=x, y=y))
+        vis.data.append(Data.from_mult_iters(x=x, y=y))
 
         if make_copies:
-            maybe_copy = deepcopy
+            maybe_copy = lambda attr: self._template(attr)._copy()
         else:
-            maybe_copy = lambda x: x
+            maybe_copy = lambda attr: getattr(self, attr)
 
-        vis.scales.extend(maybe_copy([self.x_scale, self.y_scale]))
-        vis.axes.extend(maybe_copy([self.x_axis, self.y_axis]))
-        vis.marks.extend(maybe_copy([self.mark]))
+        vis.scales.extend([maybe_copy('x_scale'), maybe_copy('y_scale')])
+        vis.axes.extend([maybe_copy('x_axis'), maybe_copy('y_axis')])
+        vis.marks.append(maybe_copy('mark'))
 
         if color:
             vis.marks[0].properties.update.fill.value = color
@@ -97,4 +139,6 @@ class BarFactory(object):
 
     @color.setter
     def color(self, value):
+        if self.mark._frozen:
+            self.mark = self.mark._copy()
         self.mark.properties.update.fill.value = value
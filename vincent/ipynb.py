@@ -9,8 +9,8 @@ module will allow for embedding on a local server (but not in nbviewer)
 
 '''
 import random
-import json
 from IPython.core.display import display, HTML, Javascript
+from . import encoding
 
 
 def init_d3():
@@ -33,5 +33,5 @@ def display_vega(vis):
 
     a = HTML('''<div id="vis%d"></div>''' % id)
     b = Javascript('''vg.parse.spec(%s, function(chart)
-                        { chart({el:"#vis%d"}).update(); });''' % (json.dumps(vis.vega), id))
+                        { chart({el:"#vis%d"}).update(); });''' % (encoding.dumps(vis.vega), id))
     display(a, b)
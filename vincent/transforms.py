@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+
+Transforms: Build-time evaluation of Vega data transforms.
+
+Vega applies the ``transform`` lists of ``Data`` and ``MarkRef`` objects in
+the browser. The functions here evaluate the common transforms in Python
+with pandas and NumPy, so that a chart can ship the result instead of
+making the client do the work.
+
+Field references follow the Vega convention of ``data.<field>``, with
+dot-notation for nested fields.
+
+"""
+from __future__ import (print_function, division)
+
+from .vega import LoadError
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _accessor(field):
+    """Return a function reading a Vega field reference from a row"""
+    path = field.split('.')
+    if path[0] == 'data':
+        path = path[1:]
+    if not path:
+        return lambda row: row
+    elif len(path) == 1:
+        key = path[0]
+        return lambda row: row.get(key)
+
+    def get(row):
+        for key in path:
+            if row is None:
+                return None
+            row = row.get(key)
+        return row
+    return get
+
+
+def _field_name(field):
+    """Output key for a field reference, e.g. ``'data.y'`` -> ``'y'``"""
+    return field.split('.')[-1]
+
+
+def _column(values, field):
+    """Extract a field of every row as a NumPy array"""
+    get = _accessor(field)
+    return np.array([get(row) for row in values])
+
+
+def _numeric(column):
+    """Convert a column to floats, with nulls as NaN"""
+    return pd.Series(column).astype(float).values
+
+
+def _plain(value):
+    """Convert NumPy scalars to Python values and NaN to None"""
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def _factorize(column, sort=False):
+    """``pandas.factorize`` with nulls as their own, last, label"""
+    labels, levels = pd.factorize(column, sort=sort)
+    levels = list(levels)
+    if (labels < 0).any():
+        labels = np.where(labels < 0, len(levels), labels)
+        levels.append(None)
+    return labels, levels
+
+
+def _group_codes(values, keys):
+    """Integer group ids in order of first appearance for a set of keys
+
+    Returns the group id of every row and the key values of every group.
+    """
+    codes = np.zeros(len(values), dtype=np.int64)
+    uniques = []
+    for field in keys:
+        labels, levels = _factorize(_column(values, field))
+        codes = codes * len(levels) + labels
+        uniques.append(levels)
+    # Renumber the combined codes so that groups stay in appearance order.
+    codes, combined = pd.factorize(codes)
+    group_keys = []
+    for code in combined:
+        key = []
+        for levels in reversed(uniques):
+            code, label = divmod(code, len(levels))
+            key.append(_plain(levels[label]))
+        group_keys.append(key[::-1])
+    return codes, group_keys
+
+
+def _groups(values, keys):
+    """Split rows into groups, returning (key values, rows) pairs"""
+    if not values:
+        return []
+    codes, group_keys = _group_codes(values, keys)
+    order = np.argsort(codes, kind='mergesort')
+    bounds = np.cumsum(np.bincount(codes))[:-1]
+    return [(key, [values[i] for i in idx])
+            for key, idx in zip(group_keys, np.split(order, bounds))]
+
+
+def _stats(column, median=False):
+    """Summary statistics of a numeric column, using Vega's output keys"""
+    column = _numeric(column)
+    valid = column[~np.isnan(column)]
+    count = len(valid)
+    stats = {'count': count,
+             'min': valid.min() if count else None,
+             'max': valid.max() if count else None,
+             'sum': valid.sum(),
+             'mean': valid.mean() if count else None,
+             'variance': valid.var(ddof=1) if count > 1 else None,
+             'stdev': valid.std(ddof=1) if count > 1 else None}
+    if median:
+        stats['median'] = np.median(valid) if count else None
+    return dict((k, _plain(v)) for k, v in stats.iteritems())
+
+
+def stats(values, value, median=False, assign=False, **kwargs):
+    """Vega ``stats`` transform
+
+    Without ``assign``, the output is a single row with the ``count``,
+    ``min``, ``max``, ``sum``, ``mean``, ``variance`` and ``stdev`` (and
+    ``median`` if requested) of the ``value`` field. With ``assign``, these
+    keys are added to a copy of every row instead.
+    """
+    result = _stats(_column(values, value), median)
+    if assign:
+        return [dict(row, **result) for row in values]
+    return [result]
+
+
+_aggregate_ops = {
+    'count': 'size', 'valid': 'count', 'sum': 'sum', 'mean': 'mean',
+    'average': 'mean', 'min': 'min', 'max': 'max', 'variance': 'var',
+    'stdev': 'std', 'median': 'median'}
+
+
+def aggregate(values, groupby=None, fields=None, **kwargs):
+    """Grouped aggregation, as in the Vega 2 ``aggregate`` transform
+
+    ``fields`` is a list of ``{"name": "data.y", "ops": ["sum", "mean"]}``
+    entries. Each output row holds the ``groupby`` values and an
+    ``<op>_<field>`` key for every requested aggregate.
+    """
+    groupby = groupby or []
+    fields = fields or []
+    if not values:
+        return []
+    if groupby:
+        codes, group_keys = _group_codes(values, groupby)
+    else:
+        codes, group_keys = np.zeros(len(values), dtype=np.int64), [[]]
+
+    rows = [dict(zip(map(_field_name, groupby), key)) for key in group_keys]
+    for entry in fields:
+        column = _numeric(_column(values, entry['name']))
+        grouped = pd.Series(column).groupby(codes)
+        name = _field_name(entry['name'])
+        for op in entry.get('ops', []):
+            if op not in _aggregate_ops:
+                raise ValueError('unsupported aggregate op ' + op)
+            result = grouped.agg(_aggregate_ops[op])
+            for code, val in zip(result.index, result.values):
+                rows[code]['{0}_{1}'.format(op, name)] = _plain(val)
+    return rows
+
+
+def sort(values, by, **kwargs):
+    """Vega ``sort`` transform
+
+    ``by`` is a field reference or a list of them, prefixed with ``-`` for
+    a descending sort. The sort is stable.
+    """
+    if isinstance(by, basestring):
+        by = [by]
+    if not values:
+        return []
+    sort_keys = []
+    for field in by:
+        descending = field.startswith('-')
+        codes, _ = _factorize(_column(values, field.lstrip('-')), sort=True)
+        sort_keys.append(-codes if descending else codes)
+    # lexsort takes the primary key last.
+    order = np.lexsort(sort_keys[::-1])
+    return [values[i] for i in order]
+
+
+def window(values, size=2, step=1, **kwargs):
+    """Vega ``window`` transform
+
+    Produces a row ``{"key": start, "values": [...]}`` for every run of
+    ``size`` consecutive rows, advancing by ``step``.
+    """
+    return [{'key': i, 'values': values[i:i + size]}
+            for i in xrange(0, len(values) - size + 1, step)]
+
+
+def fold(values, fields, **kwargs):
+    """Vega ``fold`` transform
+
+    Every row is repeated once per field of ``fields``, with ``key`` set to
+    the field name and ``value`` to the field value. The folded fields
+    themselves are dropped from the output rows.
+    """
+    names = map(_field_name, fields)
+    getters = zip(names, map(_accessor, fields))
+    folded = []
+    for row in values:
+        base = dict((k, v) for k, v in row.iteritems() if k not in names)
+        for name, get in getters:
+            out = dict(base)
+            out['key'] = name
+            out['value'] = get(row)
+            folded.append(out)
+    return folded
+
+
+def facet(values, keys, transform=None, **kwargs):
+    """Vega ``facet`` transform
+
+    Groups rows by the ``keys`` fields, in order of first appearance. Each
+    output row is ``{"key": ..., "keys": [...], "values": [...]}``, where
+    ``key`` is the group values joined with ``'|'``. The optional
+    ``transform`` list is evaluated on the values of every group.
+    """
+    facets = []
+    for key, rows in _groups(values, keys):
+        if transform:
+            rows = evaluate(rows, transform)
+        facets.append({'key': '|'.join(map(unicode, key)), 'keys': key,
+                       'values': rows})
+    return facets
+
+
+_transforms = {
+    'aggregate': aggregate,
+    'facet': facet,
+    'fold': fold,
+    'sort': sort,
+    'stats': stats,
+    'window': window}
+
+
+#Transforms whose output rows are the input rows, which keep their fields
+_row_preserving = ('sort',)
+
+#Transforms whose output rows hold the nested ``values`` iterated by group
+#marks, which Vega only reads from its own transform output
+_nested = ('facet', 'window')
+
+
+def is_inlinable(transforms):
+    """True if the output of the transforms can replace data values
+
+    Values inlined in a grammar are ingested by Vega as ``{"data": row}``
+    tuples, while the output of its own transforms is not wrapped. This
+    breaks the group marks iterating the output of ``facet`` and
+    ``window``, so these are not inlined.
+    """
+    return is_supported(transforms) and not any(
+        t.get('type') in _nested for t in transforms)
+
+
+def preserves_rows(transforms):
+    """True if the output rows of the transforms are the input rows, whose
+    fields keep their ``data.<field>`` references once inlined"""
+    return all(t.get('type') in _row_preserving for t in transforms)
+
+
+def data_field(field):
+    """Reference to a field of inlined transform output
+
+    Vega references the fields of its own transform output, e.g. the
+    ``count`` of ``stats``, without the ``data.`` prefix, which they need
+    once the output is inlined as values.
+    """
+    if field == 'data' or field.startswith('data.'):
+        return field
+    return str('data.' + field)
+
+
+def is_supported(transforms):
+    """True if every transform of the list can be evaluated in Python"""
+    for t in transforms:
+        if t.get('type') not in _transforms:
+            return False
+        if t.get('transform') and not is_supported(t['transform']):
+            return False
+    return True
+
+
+def evaluate(values, transforms):
+    """Evaluate a list of Vega transforms over data values
+
+    Parameters
+    ----------
+    values : list
+        ``values`` of a ``Data`` object: a list of dicts or numbers.
+    transforms : list of dicts
+        Vega transform definitions, applied in order.
+
+    Returns
+    -------
+    list
+        The transformed values. Rows that pass through a transform
+        unchanged are shared with the input, not copied.
+    """
+    if not pd or not np:
+        raise LoadError('pandas could not be imported')
+
+    for t in transforms:
+        kwargs = dict((str(k), v) for k, v in t.iteritems() if k != 'type')
+        try:
+            func = _transforms[t.get('type')]
+        except KeyError:
+            raise ValueError('unsupported transform type '
+                             + str(t.get('type')))
+        values = func(values, **kwargs)
+    return values
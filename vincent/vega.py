@@ -6,10 +6,17 @@ in ORM.
 
 """
 from __future__ import (print_function, division)
-import json
 import time
 import random
 import copy
+import hashlib
+import json
+import re
+import weakref
+from cStringIO import StringIO
+from itertools import izip
+
+from . import encoding
 
 try:
     import pandas as pd
@@ -59,28 +66,159 @@ class ValidationError(Exception):
     pass
 
 
-class KeyedList(list):
+class GrammarList(list):
+    """A list of grammar objects, which gives copy-on-write views of the
+    frozen objects it contains
+
+    Indexing a frozen element returns a mutable copy of it (see
+    ``GrammarClass.freeze``), which replaces the element in the list when
+    it is first modified: frozen elements can be shared by several lists,
+    and modified through each of them. Iterating gives the elements
+    themselves.
+
+    Grammar objects compare by contents, but ``in``, ``index``, ``count``
+    and ``remove`` find them by identity, like the objects they were
+    before, and find the elements of views through them.
+    """
+    # Whether indexing gives views of frozen elements
+    _views_of_frozen = True
+
+    def __getitem__(self, key):
+        return self._view(key, list.__getitem__(self, key))
+
+    def _view(self, index, value):
+        """Copy-on-write view of the element ``value`` at ``index``"""
+        if (not self._views_of_frozen or isinstance(index, slice) or
+                not getattr(value, '_frozen', False)):
+            return value
+        views = self.__dict__.setdefault('_views', {})
+        view = views[index]() if index in views else None
+        if view is None or view._owner is None or view._owner[2] is not value:
+            view = value._copy()
+            view._owner = (self, index, value)
+            views[index] = weakref.ref(view)
+        return view
+
+    def _replace(self, index, old, new):
+        """Replace the element ``old``, expected at ``index``, with ``new``"""
+        if not (-len(self) <= index < len(self) and
+                list.__getitem__(self, index) is old):
+            index = next((i for i, x in enumerate(self) if x is old), None)
+            if index is None:
+                return
+        list.__setitem__(self, index, new)
+
+    def _is(self, element, value):
+        """Whether ``value`` is ``element`` or one of its views"""
+        if element is value:
+            return True
+        owner = getattr(value, '_owner', None)
+        return owner is not None and owner[0] is self and owner[2] is element
+
+    def index(self, value, *args):
+        if not hasattr(value, 'grammar'):
+            return list.index(self, value, *args)
+        bounds = slice(*(args + (None, None))[:2])
+        for i in range(len(self))[bounds]:
+            if self._is(list.__getitem__(self, i), value):
+                return i
+        raise ValueError('{0!r} is not in list'.format(value))
+
+    def __contains__(self, value):
+        try:
+            self.index(value)
+        except ValueError:
+            return False
+        return True
+
+    def count(self, value):
+        if not hasattr(value, 'grammar'):
+            return list.count(self, value)
+        return sum(1 for x in self if self._is(x, value))
+
+    def remove(self, value):
+        del self[self.index(value)]
+
+    def __getstate__(self):
+        """Copies and pickles don't keep the views"""
+        state = self.__dict__.copy()
+        state.pop('_views', None)
+        return state
+
+
+class KeyedList(GrammarList):
     """A list that can optionally be indexed by the ``name`` attribute of
-    its elements"""
+    its elements
+
+    Lookups by key use an index of the positions of the keys, which is
+    updated by ``append`` and rebuilt after other changes to the list.
+    The list is registered as a parent of the grammar objects it contains,
+    which reset its index when their key property is set. Other elements
+    can't tell the list when they are renamed: when there are some, the
+    index is also rebuilt when a key is not found. A lookup finding an
+    element whose key has changed rebuilds the index too.
+    """
+    # Grammar properties used as keys of lists
+    _key_names = set()
+
     def __init__(self, attr_name='name', *args, **kwargs):
         self.attr_name = attr_name
+        KeyedList._key_names.add(attr_name)
+        self._index = None
         list.__init__(self, *args, **kwargs)
 
-    def __get_keys(self):
-        keys = [getattr(x, self.attr_name) for x in self]
-        if len(keys) != len(set(keys)):
-            raise ValidationError('duplicate keys found')
-        return keys
+    def __build_index(self):
+        self._index = {}
+        self._duplicates = False
+        self._untracked = False
+        for i, x in enumerate(self):
+            self.__track(x)
+            key = getattr(x, self.attr_name)
+            if key in self._index:
+                self._duplicates = True
+            else:
+                self._index[key] = i
+
+    def __track(self, element):
+        """Get notified when the key of an element changes"""
+        if hasattr(element, '_add_parent'):
+            element._add_parent(self)
+        else:
+            self._untracked = True
+
+    def __position(self, key):
+        """Position of a key, or None if it is not in the list"""
+        if getattr(self, '_index', None) is None:
+            self.__build_index()
+        for attempt in (0, 1):
+            if self._duplicates:
+                raise ValidationError('duplicate keys found')
+            i = self._index.get(key)
+            if i is not None and i < len(self) and getattr(
+                    list.__getitem__(self, i), self.attr_name) == key:
+                return i
+            elif attempt or (i is None and not self._untracked):
+                return None
+            self.__build_index()
+
+    def _key_changed(self, name):
+        """Reset the index when the key of an element is set"""
+        if name == self.attr_name:
+            self._index = None
+
+    def _replace(self, index, old, new):
+        GrammarList._replace(self, index, old, new)
+        self._index = None
 
     def __getitem__(self, key):
         if isinstance(key, str):
-            keys = self.__get_keys()
-            if key not in keys:
+            i = self.__position(key)
+            if i is None:
                 raise KeyError(' "{0}" is an invalid key'.format(key))
             else:
-                return self[keys.index(key)]
+                return self._view(i, list.__getitem__(self, i))
         else:
-            return list.__getitem__(self, key)
+            return GrammarList.__getitem__(self, key)
 
     def __setitem__(self, key, value):
         if isinstance(key, str):
@@ -92,13 +230,153 @@ class KeyedList(list):
                     "key must be equal to '" + self.attr_name +
                     "' attribute")
 
-            keys = self.__get_keys()
-            if key not in keys:
+            i = self.__position(key)
+            if i is None:
                 self.append(value)
             else:
-                list.__setitem__(self, keys.index(key), value)
+                list.__setitem__(self, i, value)
+                self.__track(value)
         else:
             list.__setitem__(self, key, value)
+            self._index = None
+
+    def append(self, value):
+        list.append(self, value)
+        index = getattr(self, '_index', None)
+        if index is not None:
+            self.__track(value)
+            key = getattr(value, self.attr_name, None)
+            if key in index:
+                self._duplicates = True
+            else:
+                index[key] = len(self) - 1
+
+    def __getstate__(self):
+        """Copies and pickles don't keep the index"""
+        state = GrammarList.__getstate__(self)
+        state['_index'] = None
+        return state
+
+    def __delitem__(self, key):
+        self._index = None
+        list.__delitem__(self, key)
+
+    def __setslice__(self, i, j, values):
+        self._index = None
+        list.__setslice__(self, i, j, values)
+
+    def __delslice__(self, i, j):
+        self._index = None
+        list.__delslice__(self, i, j)
+
+    def extend(self, values):
+        self._index = None
+        list.extend(self, values)
+
+    def insert(self, i, value):
+        self._index = None
+        list.insert(self, i, value)
+
+    def reverse(self):
+        self._index = None
+        list.reverse(self)
+
+    def sort(self, *args, **kwargs):
+        self._index = None
+        list.sort(self, *args, **kwargs)
+
+    def __iadd__(self, values):
+        self._index = None
+        return list.__iadd__(self, values)
+
+    def __imul__(self, n):
+        self._index = None
+        return list.__imul__(self, n)
+
+    def pop(self, *args):
+        self._index = None
+        return list.pop(self, *args)
+
+
+def _immutable(self, *args, **kwargs):
+    raise TypeError('{0} object is frozen and cannot be modified'
+                    .format(type(self).__name__))
+
+
+class _FrozenList(list):
+    """Immutable list, in the grammar of frozen objects"""
+    _views_of_frozen = False
+
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = _immutable
+    __iadd__ = __imul__ = append = extend = insert = _immutable
+    pop = remove = reverse = sort = _immutable
+
+    def __reduce__(self):
+        return type(self), (list(self),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class _FrozenKeyedList(_FrozenList, KeyedList):
+    """Immutable ``KeyedList``, in the grammar of frozen objects"""
+
+    def __reduce__(self):
+        return type(self), (self.attr_name, list(self))
+
+
+class _FrozenDict(dict):
+    """Immutable dict, in the grammar of frozen objects"""
+
+    __setitem__ = __delitem__ = clear = pop = popitem = _immutable
+    setdefault = update = _immutable
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+_frozen_containers = (_FrozenList, _FrozenDict)
+
+
+def _frozen_value(value):
+    """Immutable version of a grammar value: grammar objects are frozen,
+    and lists and dicts are replaced by immutable copies"""
+    if hasattr(value, 'freeze'):
+        return value.freeze()
+    elif isinstance(value, _frozen_containers):
+        return value
+    elif isinstance(value, KeyedList):
+        return _FrozenKeyedList(value.attr_name, map(_frozen_value, value))
+    elif isinstance(value, list):
+        return _FrozenList(map(_frozen_value, value))
+    elif isinstance(value, dict):
+        return _FrozenDict((k, _frozen_value(v))
+                           for k, v in value.iteritems())
+    return value
+
+
+def _thawed(value):
+    """Mutable copy of an immutable container from :func:`_frozen_value`,
+    sharing the grammar objects it contains"""
+    if isinstance(value, _FrozenKeyedList):
+        return KeyedList(value.attr_name, map(_thawed, value))
+    elif isinstance(value, _FrozenList):
+        items = map(_thawed, value)
+        if items and hasattr(items[0], 'grammar'):
+            return GrammarList(items)
+        return items
+    elif isinstance(value, _FrozenDict):
+        return dict((k, _thawed(v)) for k, v in value.iteritems())
+    return value
 
 
 def grammar(grammar_type=None, grammar_name=None):
@@ -143,16 +421,46 @@ def grammar(grammar_type=None, grammar_name=None):
             if isinstance(grammar_type, (type, tuple)):
                 _assert_is_type(validator.__name__, value, grammar_type)
             validator(value)
+            if getattr(self, '_frozen', False):
+                if self.grammar.get(name) is value:
+                    # Validating a frozen object sets its own values
+                    return
+                _assert_not_frozen(self)
             self.grammar[name] = value
+            if getattr(self, '_parents', None) and \
+                    name in KeyedList._key_names:
+                _key_changed(self, name)
+            _changed(self)
 
         def getter(self):
-            return self.grammar.get(name, None)
+            value = self.grammar.get(name, None)
+            if isinstance(value, encoding.RawJSON):
+                # Values kept as raw JSON by from_json are decoded on access
+                value = self.grammar[name] = _decoded(value.load())
+            elif getattr(self, '_frozen', True):
+                pass
+            elif getattr(value, '_frozen', False):
+                # Copy on write: a mutable object gives a view of a frozen
+                # value, which replaces it when it is first modified
+                value = self._view(name, value)
+            elif isinstance(value, _frozen_containers):
+                # Changes to lists and dicts can't be detected: they are
+                # copied when accessed
+                value = self.grammar[name] = _thawed(value)
+                _changed(self)
+            return value
 
         def deleter(self):
             if name in self.grammar:
+                _assert_not_frozen(self)
                 del self.grammar[name]
+                if getattr(self, '_parents', None) and \
+                        name in KeyedList._key_names:
+                    _key_changed(self, name)
+                _changed(self)
 
-        return property(getter, setter, deleter, validator.__doc__)
+        return GrammarProperty(getter, setter, deleter, validator.__doc__,
+                               name, grammar_type)
 
     if isinstance(grammar_type, (type, tuple)):
         # If grammar_type is a type, return another decorator.
@@ -175,29 +483,247 @@ def grammar(grammar_type=None, grammar_name=None):
         return grammar_creator(grammar_type, grammar_type.__name__)
 
 
+class GrammarProperty(property):
+    """Property created by :func:`grammar`, which records the grammar key
+    and the type of its values"""
+    def __init__(self, fget, fset, fdel, doc, grammar_name, grammar_type):
+        super(GrammarProperty, self).__init__(fget, fset, fdel, doc)
+        self.grammar_name = grammar_name
+        if not isinstance(grammar_type, (type, tuple)):
+            grammar_type = None
+        self.grammar_type = grammar_type
+
+
+def _assert_not_frozen(obj):
+    """Raise an AttributeError if a grammar object is frozen"""
+    if getattr(obj, '_frozen', False):
+        raise AttributeError('{0} object is frozen and cannot be modified'
+                             .format(type(obj).__name__))
+
+
+def _changed(obj):
+    """Invalidate the caches of a grammar object after a change, and
+    install it if it is a copy-on-write view
+
+    Grammar objects are linked to their parents only when the parents
+    cache something, see ``GrammarClass.invalidate``, so that building
+    objects doesn't allocate the links.
+    """
+    if getattr(obj, '_cache', None):
+        obj.invalidate()
+    if getattr(obj, '_owner', None) is not None:
+        obj._install()
+
+
+def _key_changed(obj, name):
+    """Tell the keyed lists containing a grammar object that its ``name``
+    property was set, see ``KeyedList``"""
+    for ref in (getattr(obj, '_parents', None) or {}).values():
+        parent = ref()
+        if hasattr(parent, '_key_changed'):
+            parent._key_changed(name)
+
+
+class _Identity(object):
+    """Reference to an object that compares by identity, see
+    :func:`_signature`"""
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __eq__(self, other):
+        return isinstance(other, _Identity) and self.obj is other.obj
+
+    def __ne__(self, other):
+        return not self == other
+
+
+def _signature(value):
+    """Identity of a grammar value, used to validate cached output
+
+    Grammar objects are described by identity only: changes through their
+    properties invalidate the cached output of their parents. They are
+    referenced by the signature, so that their ids can't be reused while
+    it is cached. Dicts are described recursively, lists of grammar objects
+    by the identities of their entries, and other lists, such as data
+    values, by their identity only: rows added or changed in place aren't
+    detected, see :meth:`GrammarClass.invalidate`.
+    """
+    if hasattr(value, '_signature'):
+        return _Identity(value)
+    elif isinstance(value, dict):
+        return (id(value), tuple(sorted((k, _signature(v))
+                                        for k, v in value.iteritems())))
+    elif isinstance(value, (list, tuple)):
+        if value and hasattr(value[0], 'grammar'):
+            return (id(value), tuple(map(_Identity, value)))
+        return id(value)
+    elif isinstance(value, (basestring, int, long, float, type(None))):
+        return (type(value), value if value == value else 'NaN')
+    return id(value)
+
+
+def _canonical_json(value):
+    """Compact JSON with sorted keys, the canonical form of a value"""
+    return encoding.dumps(value, backend='json', sort_keys=True,
+                          separators=(',', ':'))
+
+
+def _hash_rows(rows, sha):
+    """Feed a list of data rows to a hash object
+
+    Rows of numbers, and the numeric columns of rows of dicts with the same
+    keys, are hashed from NumPy array buffers. Other data is hashed as
+    canonical JSON.
+    """
+    sha.update('L{0}:'.format(len(rows)))
+    if np and rows and type(rows[0]) is dict:
+        keys = rows[0].viewkeys()
+        if all(type(row) is dict and row.viewkeys() == keys for row in rows):
+            keys = sorted(keys)
+            for key in keys:
+                sha.update(_canonical_json(key))
+                _hash_column([row[key] for row in rows], sha)
+            return
+    elif np and rows and isinstance(rows[0], (int, long, float)):
+        _hash_column(rows, sha)
+        return
+    sha.update(_canonical_json(rows))
+
+
+def _hash_column(column, sha):
+    """Feed a column of values to a hash object"""
+    array = np.array(column)
+    if array.dtype.kind in 'iu':
+        array = array.astype(np.int64)
+    elif array.dtype.kind == 'f':
+        array = array.astype(np.float64)
+    elif array.dtype.kind != 'b':
+        sha.update('J' + _canonical_json(column))
+        return
+    sha.update(array.dtype.str + ':')
+    sha.update(array.tostring())
+
+
+def _hash_value(value, sha, parent=None):
+    """Feed a grammar value to a hash object
+
+    ``parent`` is the grammar object containing ``value``, which is
+    registered as a parent of the grammar objects found inside, so that
+    changes to them invalidate its cached fingerprint.
+    """
+    if hasattr(value, 'fingerprint'):
+        if parent is not None and hasattr(value, '_add_parent'):
+            value._add_parent(parent)
+        sha.update('G' + value.fingerprint())
+    elif isinstance(value, encoding.RawJSON):
+        _hash_value(_decoded(value.load()), sha)
+    elif isinstance(value, dict):
+        sha.update('D{0}:'.format(len(value)))
+        for key in sorted(value):
+            sha.update(_canonical_json(key))
+            _hash_value(value[key], sha, parent)
+    elif isinstance(value, (list, tuple)):
+        if value and hasattr(value[0], 'fingerprint'):
+            sha.update('N{0}:'.format(len(value)))
+            for entry in value:
+                _hash_value(entry, sha, parent)
+        else:
+            _hash_rows(value, sha)
+    else:
+        sha.update('J' + _canonical_json(value))
+
+
 class GrammarDict(dict):
     """The Vega Grammar. When called, obj.grammar returns a Python data
     structure for the Vega Grammar. When printed, obj.grammar returns a
     string representation."""
 
-    def __init__(self, *args, **kwargs):
-        """Standard Dict init"""
-        dict.__init__(self, *args, **kwargs)
-
     def encoder(self, obj):
         """Encode grammar objects for each level of hierarchy"""
-        if hasattr(obj, 'grammar'):
-            return obj.grammar
+        return encoding.default(obj)
 
     def __call__(self):
-        """When called, return the Vega grammar as a Python data structure."""
+        """When called, return the Vega grammar as a Python data structure.
+
+        Lists of data values that are already plain Python are shared with
+        the grammar, not copied. Other containers are copied."""
 
-        return json.loads(json.dumps(self, default=self.encoder))
+        return encoding.to_plain(self)
 
     def __str__(self):
         """String representation of Vega Grammar"""
 
-        return json.dumps(self, default=self.encoder)
+        return encoding.dumps(self)
+
+
+#Shared frozen grammar objects by class and contents, see
+#``GrammarClass.intern``
+_interned = weakref.WeakValueDictionary()
+
+
+def _intern_key(value):
+    """Hashable identity of a grammar value of an interned object
+
+    Frozen grammar objects stand for themselves, as the interned children
+    of equal objects are the same objects.
+    """
+    if getattr(value, '_frozen', False):
+        return value
+    elif isinstance(value, (basestring, int, long, float, type(None))):
+        return (type(value), value)
+    return (type(value), _canonical_json(value))
+
+
+def _equal(a, b):
+    """Structural equality of two grammar values
+
+    Grammar objects compare with ``==``, which uses the fast paths of
+    :meth:`GrammarClass.__eq__`, and so do plain lists and dicts, whose
+    comparison stops at the first difference. Raw JSON is compared as
+    text before decoding it, and NumPy arrays by their buffers.
+    """
+    if a is b:
+        return True
+    if isinstance(a, encoding.RawJSON) or isinstance(b, encoding.RawJSON):
+        if getattr(a, 'text', None) == getattr(b, 'text', False):
+            return True
+        if isinstance(a, encoding.RawJSON):
+            a = _decoded(a.load())
+        if isinstance(b, encoding.RawJSON):
+            b = _decoded(b.load())
+    if np and (isinstance(a, np.ndarray) or isinstance(b, np.ndarray)):
+        if (isinstance(a, np.ndarray) and isinstance(b, np.ndarray) and
+                a.dtype == b.dtype and a.shape == b.shape):
+            return (buffer(np.ascontiguousarray(a)) ==
+                    buffer(np.ascontiguousarray(b)))
+        return bool(np.array_equal(a, b))
+    if pd and isinstance(a, pd.DataFrame):
+        return isinstance(b, pd.DataFrame) and a.equals(b)
+    try:
+        return bool(a == b)
+    except ValueError:
+        # Arrays inside lists or dicts
+        return _canonical_json(a) == _canonical_json(b)
+
+
+def _hash_key(value):
+    """Hashable form of a grammar value, equal for values that are equal
+    according to :func:`_equal`"""
+    if hasattr(value, 'grammar'):
+        return value
+    elif isinstance(value, encoding.RawJSON):
+        return _hash_key(_decoded(value.load()))
+    elif isinstance(value, dict):
+        return frozenset((k, _hash_key(v)) for k, v in value.iteritems())
+    elif isinstance(value, (list, tuple)):
+        return tuple(_hash_key(v) for v in value)
+    elif np and isinstance(value, np.ndarray):
+        return _hash_key(value.tolist())
+    elif pd and isinstance(value, pd.DataFrame):
+        return _canonical_json(value.to_dict())
+    return value
 
 
 class GrammarClass(object):
@@ -207,7 +733,24 @@ class GrammarClass(object):
     This should be used as a superclass for classes that map to some JSON
     structure. The JSON content is stored in an internal dict named
     ``grammar``.
+
+    Grammar objects have no instance ``__dict__``: subclasses that don't
+    need other attributes than their grammar properties should define an
+    empty ``__slots__``.
+
+    Objects can be frozen, see :meth:`freeze` and :meth:`intern`.
     """
+    # Serialized fragments by encoder options, and weak references to the
+    # grammar objects containing this one, to invalidate them. Both are
+    # None until needed. Copy-on-write views of frozen objects have an
+    # owner, and objects keep weak references to the views of their
+    # frozen values, see ``_view``.
+    __slots__ = ('grammar', '_cache', '_parents', '_frozen', '_owner',
+                 '_views', '__weakref__')
+
+    # Values Vega assumes for undefined properties, omitted by minify
+    _defaults = {}
+
     def __init__(self, **kwargs):
         """Initialize a GrammarClass
 
@@ -217,40 +760,370 @@ class GrammarClass(object):
         ``ValueError`` is raised.
         """
         self.grammar = GrammarDict()
+        self._cache = None
+        self._parents = None
+        self._frozen = False
+        self._owner = None
+        self._views = None
 
         for attr, value in kwargs.iteritems():
-            if hasattr(self, attr):
+            if hasattr(type(self), attr) or hasattr(self, attr):
                 setattr(self, attr, value)
             else:
                 raise ValueError('unknown keyword argument ' + attr)
 
+    def __getstate__(self):
+        """Copies and pickles don't keep the caches"""
+        state = dict(getattr(self, '__dict__', ()))
+        state['grammar'] = self.grammar
+        if self._frozen:
+            state['_frozen'] = True
+        return state
+
+    def __setstate__(self, state):
+        self._cache = None
+        self._parents = None
+        self._frozen = False
+        self._owner = None
+        self._views = None
+        for attr, value in state.iteritems():
+            if attr not in ('_cache', '_parents', '_owner', '_views'):
+                object.__setattr__(self, attr, value)
+
+    def __reduce__(self):
+        """Pickle the grammar as a plain dict, and data values as columns
+
+        Lists of data rows are pickled as their columns, with NumPy arrays
+        for the columns of numbers, which are much smaller and faster to
+        pickle than the rows. Values still held as raw JSON (see
+        :meth:`from_json`) are decoded to be packed, and are pickled as
+        their text only if their rows can't be packed. Unpickling doesn't
+        run the validators.
+        """
+        grammar, packed = {}, {}
+        for key, value in self.grammar.iteritems():
+            columns = None
+            if key == 'values':
+                if isinstance(value, encoding.RawJSON):
+                    columns = _pack_rows(_decoded(value.load()))
+                else:
+                    columns = _pack_rows(value)
+            if columns is None:
+                grammar[key] = value
+            else:
+                packed[key] = columns
+        state = dict(getattr(self, '__dict__', ()))
+        if self._frozen:
+            state['_frozen'] = True
+        return _unpickle, (type(self), grammar, packed), state or None
+
+    def __copy__(self):
+        return self if self._frozen else self._copy()
+
+    def __deepcopy__(self, memo):
+        """Frozen objects are shared by copies"""
+        if self._frozen:
+            return self
+        new = memo[id(self)] = object.__new__(type(self))
+        new.__setstate__(copy.deepcopy(self.__getstate__(), memo))
+        return new
+
+    def __eq__(self, other):
+        """Structural equality: objects of the same class are equal if their
+        grammars are, whatever the order the properties were set in
+
+        The comparison stops at the first difference. Frozen objects are
+        first compared by their cached hashes.
+        """
+        if self is other:
+            return True
+        if not isinstance(other, GrammarClass):
+            return NotImplemented
+        if (type(other) is not type(self) or
+                len(other.grammar) != len(self.grammar)):
+            return False
+        if self._frozen and other._frozen and hash(self) != hash(other):
+            return False
+        for key, value in self.grammar.iteritems():
+            if key not in other.grammar or not _equal(value,
+                                                      other.grammar[key]):
+                return False
+        return True
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        """Hash of frozen objects, consistent with ``==`` and cached
+
+        Mutable objects are not hashable, like lists and dicts, since no
+        hash of their changing contents could stay consistent with ``==``:
+        freeze them first to use them in sets or as dict keys (see
+        :meth:`freeze`). ``GrammarList`` and ``KeyedList`` find their
+        elements by identity, not with ``==``.
+        """
+        if not self._frozen:
+            raise TypeError('unhashable type: {0} is not frozen'.format(
+                type(self).__name__))
+        cached = self._cached('hash')
+        if cached is None:
+            cached = self._store('hash', hash((type(self).__name__,
+                                               _hash_key(self.grammar))))
+        return cached
+
+    def _copy(self):
+        """Mutable shallow copy, sharing the values of the grammar"""
+        new = object.__new__(type(self))
+        new.__setstate__(self.__getstate__())
+        new.grammar = GrammarDict(self.grammar)
+        new._frozen = False
+        return new
+
+    def freeze(self):
+        """Make the object and the grammar values it contains immutable
+
+        Setting or deleting a grammar property of a frozen object raises an
+        ``AttributeError``. The grammar objects it contains are frozen too,
+        and its lists and dicts are replaced by immutable copies, which
+        raise a ``TypeError`` when modified.
+
+        Frozen objects can be shared by several parents (copy on write): a
+        mutable object gives a mutable view of a frozen value of its
+        grammar properties, or of an element of a ``GrammarList`` or
+        ``KeyedList``. The view is a shallow copy, which replaces the
+        frozen value in the parent when it is first modified; reading
+        through it doesn't copy anything else. Immutable lists and dicts
+        are copied when accessed through a mutable object, since changes
+        to them can't be detected.
+
+        Returns
+        -------
+        GrammarClass
+            The object itself.
+        """
+        if not self._frozen:
+            for key, value in self.grammar.items():
+                self.grammar[key] = _frozen_value(value)
+            self._frozen = True
+        return self
+
+    @classmethod
+    def intern(cls, **kwargs):
+        """Shared frozen instance with the given grammar properties
+
+        Interned objects with equal contents are the same object, which
+        saves memory when the same values (e.g.
+        ``ValueRef.intern(scale='x', field='data.x')``) are used across
+        many marks. They are frozen (see :meth:`freeze`), and held in a
+        weak-value cache as long as they are used. JSON written to a file
+        (see :func:`vincent.encoding.dump`), compressed or cached (see
+        :meth:`to_json`) encodes each shared object only once per output;
+        the string output of :meth:`to_json` without caching is encoded
+        by the backend in one call, which encodes it at every use.
+
+        Parameters
+        ----------
+        **kwargs : dict
+            Grammar properties, as for the class constructor. Mutable
+            grammar objects among them are copied and interned too.
+
+        Returns
+        -------
+        GrammarClass
+            Frozen instance of the class the method is called on.
+        """
+        return cls(**kwargs)._interned()
+
+    def _interned(self):
+        """Shared frozen object equal to this new object"""
+        for key, value in self.grammar.items():
+            if hasattr(value, '_interned') and not value._frozen:
+                self.grammar[key] = value._copy()._interned()
+        key = (type(self), frozenset((k, _intern_key(v))
+                                     for k, v in self.grammar.iteritems()))
+        shared = _interned.get(key)
+        if shared is None:
+            self.freeze()
+            shared = _interned[key] = self
+        return shared
+
+    def _view(self, key, value):
+        """Copy-on-write view of the frozen value of a grammar property"""
+        views = self._views
+        if views is None:
+            views = self._views = {}
+        view = views[key]() if key in views else None
+        if view is None or view._owner is None or view._owner[2] is not value:
+            view = value._copy()
+            view._owner = (self, key, value)
+            views[key] = weakref.ref(view)
+        return view
+
+    def _install(self):
+        """Replace the frozen value this view was made from, in the object
+        or list owning it, see ``_view``"""
+        owner, self._owner = self._owner, None
+        parent, key, value = owner
+        parent._replace(key, value, self)
+
+    def _replace(self, key, old, new):
+        """Replace the value ``old`` of a grammar property with ``new``"""
+        if self.grammar.get(key) is old:
+            self.grammar[key] = new
+            _changed(self)
+
+    def _add_parent(self, parent):
+        """Register a grammar object or keyed list containing this one"""
+        if self._frozen:
+            # Frozen objects never invalidate their parents
+            return
+        key = id(parent)
+        if self._parents is None:
+            self._parents = {}
+        if key not in self._parents:
+            self._parents[key] = weakref.ref(parent)
+
+    def _cached(self, key):
+        """Cached value for ``key``, or None"""
+        return self._cache.get(key) if self._cache else None
+
+    def _store(self, key, value):
+        """Cache a value for ``key``"""
+        if self._cache is None:
+            self._cache = {}
+        self._cache[key] = value
+        return value
+
+    def _signature(self):
+        """Identity of the grammar contents, used to validate the cache
+
+        The signature doesn't describe the contents of the grammar objects
+        in this one, see :func:`_signature`, so that checking it doesn't
+        walk the whole tree.
+        """
+        if self._frozen:
+            signature = self._cached('signature')
+            if signature is not None:
+                return signature
+        signature = tuple(sorted((k, _signature(v))
+                                 for k, v in self.grammar.iteritems()))
+        if self._frozen:
+            self._store('signature', signature)
+        return signature
+
+    def fingerprint(self):
+        """Hash of the canonical grammar of the object
+
+        The fingerprint is a SHA-1 hex digest that only depends on the
+        contents of the grammar: equal objects have equal fingerprints,
+        whatever the order the properties were set in. It is computed from
+        the fingerprints of the grammar objects contained in this one, and
+        numeric data columns are hashed from their array buffers, not from
+        their JSON.
+
+        Fingerprints are cached, and invalidated like the cached JSON
+        output (see ``to_json``): changes through grammar properties and to
+        the lists of grammar objects are detected, but contents modified in
+        place, such as the rows of data values, need a call to
+        :meth:`invalidate`.
+
+        Returns
+        -------
+        string
+            40-character hex digest.
+        """
+        signature = self._signature()
+        cached = self._cached('fingerprint')
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        sha = hashlib.sha1(type(self).__name__)
+        _hash_value(self.grammar, sha, self)
+        return self._store('fingerprint', (signature, sha.hexdigest()))[1]
+
+    def invalidate(self):
+        """Clear the cached output of the object and of its parents
+
+        The JSON output of grammar objects can be cached (see ``to_json``),
+        and changes through grammar properties clear the caches
+        automatically. Objects are linked to their parents when the
+        parents cache their output, and all of the objects below a cached
+        object have a cache, so objects without one have nothing to
+        invalidate. Call this after modifying mutable contents in place,
+        such as appending to or editing the rows of ``Data.values``, or to
+        free the cached output.
+        """
+        if not self._cache:
+            return
+        self._cache.clear()
+        for key, ref in (self._parents or {}).items():
+            parent = ref()
+            if parent is None:
+                del self._parents[key]
+            elif hasattr(parent, 'invalidate'):
+                parent.invalidate()
+
     def validate(self):
         """Validate the contents of the object.
 
         This calls ``setattr`` for each of the class's grammar properties. It
         will catch ``ValueError``s raised by the grammar property's setters
-        and re-raise them as :class:`ValidationError`.
+        and re-raise them as :class:`ValidationError`. Grammar keys without
+        a property are not checked.
         """
-        for key, val in self.grammar.iteritems():
+        properties = _grammar_properties(type(self))
+        for key, val in self.grammar.items():
+            if key not in properties:
+                continue
             try:
-                setattr(self, key, val)
+                setattr(self, properties[key][0], val)
             except ValueError as e:
                 raise ValidationError('invalid contents: ' + e.message)
 
-    def to_json(self, path=None, validate=False, pretty_print=True):
+    def to_json(self, path=None, validate=False, pretty_print=True,
+                max_bytes=None, backend=None, cache=False, compress=False,
+                minify=False):
         """Convert object to JSON
 
         Parameters
         ----------
-        path: string, default None
-            Path to write JSON out. If there is no path provided, JSON
-            will be returned as a string to the console.
+        path: string or file-like object, default None
+            Path or file to write JSON out. The JSON is written in chunks
+            as it is encoded, see :func:`vincent.encoding.dump`. If there
+            is no path provided, JSON will be returned as a string to the
+            console.
         validate : boolean
             If True, call the object's `validate` method before
             serializing. Default is False.
         pretty_print : boolean
             If True (default), JSON is printed in more-readable form with
             indentation and spaces.
+        max_bytes : int, default None
+            Size budget of the output. If the estimated size of the JSON
+            exceeds it, the data values are reduced according to the marks
+            drawing them (see :func:`vincent.downsample.fit_spec`), and a
+            ``DataReductionWarning`` is issued for every reduction. The
+            object itself is not modified.
+        backend : string, default None
+            JSON encoding backend, see :func:`vincent.encoding.set_backend`.
+            If None (default), the default backend is used.
+        cache : boolean, default False
+            If True, the JSON of every grammar object is cached, and reused
+            by later calls with the same options as long as the object is
+            unchanged, so that re-serializing after a small change only
+            encodes the changed objects. Changes through grammar properties
+            and to the containers of grammar objects are detected, but
+            contents modified in place, such as data values with rows
+            appended, removed or changed, need a call to :meth:`invalidate`. Each object keeps the output
+            of the last cached call, until :meth:`invalidate` is called.
+        compress : boolean or int, default False
+            If True, the JSON is gzip-compressed, see
+            :func:`vincent.encoding.dump`; the output path should then end
+            with ``.json.gz``. Without a path, the compressed bytes are
+            returned.
+        minify : boolean, default False
+            If True, the JSON is written as small as possible with the same
+            meaning, see :func:`minified`. This overrides ``pretty_print``.
 
         Returns
         -------
@@ -260,27 +1133,167 @@ class GrammarClass(object):
         if validate:
             self.validate()
 
-        if pretty_print:
+        if minify:
+            dumps_args = {'separators': (',', ':')}
+        elif pretty_print:
             dumps_args = {'indent': 2, 'separators': (',', ': ')}
         else:
             dumps_args = {}
 
-        def encoder(obj):
-            if hasattr(obj, 'grammar'):
-                return obj.grammar
+        grammar = self
+        if max_bytes:
+            from .downsample import fit_spec, warn_reductions
+            grammar, reports = fit_spec(self.grammar(), max_bytes,
+                                        **dumps_args)
+            warn_reductions(reports)
+        if minify:
+            grammar = minified(grammar, type(self))
 
         if path:
-            with open(path, 'w') as f:
-                json.dump(self.grammar, f, default=encoder, **dumps_args)
+            encoding.dump(grammar, path, backend=backend, cache=cache,
+                          compress=compress, **dumps_args)
+        elif compress:
+            output = StringIO()
+            encoding.dump(grammar, output, backend=backend, cache=cache,
+                          compress=compress, **dumps_args)
+            return output.getvalue()
+        else:
+            return encoding.dumps(grammar, backend=backend, cache=cache,
+                                  **dumps_args)
+
+    def diff(self, other):
+        """JSON Patch from this object to another
+
+        The grammar trees are compared structurally, and the returned list
+        of RFC 6902 operations turns the JSON of this object into the JSON
+        of ``other``. Grammar objects that are the same object or equal
+        (see ``==``) are skipped without diffing their contents.
+        Changes to ``values`` lists are described as a range of replaced,
+        added or removed rows, e.g. appended rows are only ``add``
+        operations, unless the whole list is shorter to replace.
+
+        Parameters
+        ----------
+        other : GrammarClass
+            Object of the same class.
+
+        Returns
+        -------
+        list of dicts
+            The ``add``, ``remove`` and ``replace`` operations, with their
+            ``value`` as Python data structures.
+        """
+        if type(other) is not type(self):
+            raise ValueError('cannot diff a {0} with a {1}'.format(
+                type(self).__name__, type(other).__name__))
+        operations = []
+        _diff(self, other, '', operations)
+        return operations
+
+    def apply_patch(self, patch):
+        """Apply a JSON Patch to the object in place
+
+        The operations of RFC 6902 are supported. Values are added as
+        grammar objects according to the grammar properties, as with
+        :meth:`from_json`, and the caches of the modified objects are
+        invalidated.
+
+        Parameters
+        ----------
+        patch : list of dicts
+            Operations, such as the output of :meth:`diff`.
+        """
+        _assert_not_frozen(self)
+        for operation in patch:
+            op, path = operation.get('op'), operation.get('path')
+            if op in ('add', 'replace', 'test'):
+                value = operation['value']
+            elif op in ('move', 'copy'):
+                value = _patch_get(self, operation['from'])
+                if op == 'move':
+                    _patch_apply(self, 'remove', operation['from'])
+                else:
+                    value = copy.deepcopy(value)
+                op = 'add'
+            elif op != 'remove':
+                raise ValueError('invalid patch operation: {0}'.format(op))
+
+            if op == 'test':
+                if (encoding.to_plain(_patch_get(self, path)) !=
+                        _decoded(value)):
+                    raise ValueError('test failed at ' + path)
+            else:
+                _patch_apply(self, op, path, value if op != 'remove'
+                             else None)
+
+    @classmethod
+    def from_json(cls, source, lazy_threshold=65536):
+        """Load an object from JSON
+
+        The grammar objects of the tree are rebuilt from the grammar
+        properties of the classes: e.g. a Vega spec loaded with
+        ``Visualization.from_json`` has ``Data``, ``Scale``, ``Axis`` and
+        ``Mark`` elements, down to their ``PropertySet`` and ``ValueRef``
+        objects. Keys without a grammar property, and values that don't
+        pass validation, are kept as they are in the ``grammar`` dict.
+
+        Parameters
+        ----------
+        source : string or file-like object
+            JSON text, or path or file to read it from.
+        lazy_threshold : int, default 65536
+            ``values`` lists of at least this many characters of JSON are
+            not decoded when loading. They are kept as raw JSON, which is
+            written back as is by ``to_json``, and decoded the first time
+            the property is accessed. If None or 0, everything is decoded.
+
+        Returns
+        -------
+        GrammarClass
+            An instance of the class the method is called on.
+        """
+        if hasattr(source, 'read'):
+            text = source.read()
+        elif source.lstrip()[:1] in ('{', '['):
+            text = source
         else:
-            return json.dumps(self.grammar, default=encoder, **dumps_args)
+            with open(source, 'r') as f:
+                text = f.read()
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        text, raw = _split_values(text, lazy_threshold)
+        return _load(cls, json.loads(text), raw)
 
-    def from_json(self):
-        """Load object from JSON
+    @classmethod
+    def from_grammar(cls, grammar, trusted=True):
+        """Build an object from a grammar dict in one pass
+
+        The dicts found under the grammar properties are built into
+        grammar objects according to the property types, as with
+        :meth:`from_json`, e.g. a ``Mark`` gets its ``MarkRef``,
+        ``MarkProperties``, ``PropertySet`` and ``ValueRef`` objects. This
+        is much faster than building the tree with the constructors when
+        the grammar is known to be valid, such as the fixed parts of a
+        chart.
 
-        Not yet implemented.
+        Parameters
+        ----------
+        grammar : dict
+            Grammar by grammar key (e.g. ``'from'``, not ``from_``), with
+            plain dicts or grammar objects as values. Keys without a
+            grammar property are kept as they are.
+        trusted : boolean, default True
+            If True, the values are stored without the type checks and
+            validators of the properties: call :meth:`validate` to check
+            them. If False, the properties are set one by one, as by the
+            constructor, and invalid values raise a ``ValueError``.
+
+        Returns
+        -------
+        GrammarClass
+            An instance of the class the method is called on.
         """
-        raise NotImplementedError()
+        return _from_grammar(cls, grammar, trusted)
 
 
 class Visualization(GrammarClass):
@@ -293,6 +1306,9 @@ class Visualization(GrammarClass):
     ``axes``, ``marks``, and ``scales`` attributes. See the docs for each
     attribute for details.
     """
+    __slots__ = ()
+    _defaults = {'width': 500, 'height': 500}
+
     def __init__(self, *args, **kwargs):
         """Initialize a Visualization
 
@@ -309,7 +1325,7 @@ class Visualization(GrammarClass):
             self.axes = KeyedList(attr_name='type')
         # Marks don't get keyed.
         if not self.marks:
-            self.marks = []
+            self.marks = GrammarList()
 
     @grammar(str)
     def name(value):
@@ -447,6 +1463,85 @@ class Visualization(GrammarClass):
                 raise ValidationError(
                     elem + ' must be defined for valid visualization')
 
+    def evaluate_transforms(self):
+        """Evaluate data transforms in Python instead of in the browser
+
+        The ``transform`` lists of ``Data`` and of the ``from_`` property
+        of ``Mark`` objects are evaluated with :mod:`vincent.transforms`
+        and replaced by the resulting ``values``. ``Data`` derived from a
+        ``source`` data set is resolved against that data set. A ``Mark``
+        transform is stored as a new ``Data`` object, which the mark then
+        references.
+
+        Vega references the fields of its own transform output, such as
+        the ``count`` of ``stats``, without the ``data.`` prefix that they
+        need once inlined as values: the field references of the marks
+        and scales using the evaluated data are prefixed accordingly.
+
+        Transforms that cannot be evaluated, such as those of data loaded
+        from a ``url`` or transform types without a Python implementation,
+        are left for Vega to apply, and so are ``facet`` and ``window``,
+        whose output is iterated by group marks.
+        """
+        from .transforms import (evaluate, is_inlinable, preserves_rows,
+                                 data_field)
+
+        by_name = dict((d.name, d) for d in self.data)
+        # Data sets holding inlined transform output with new fields
+        native = set()
+
+        def source_values(name):
+            source = by_name.get(name)
+            if source is None or source.transform:
+                return None
+            return source.values
+
+        for data in self.data:
+            if not data.transform or not is_inlinable(data.transform):
+                continue
+            if data.source:
+                values = source_values(data.source)
+            else:
+                values = data.values
+            if values is None:
+                continue
+            data.values = evaluate(values, data.transform)
+            if data.source in native or not preserves_rows(data.transform):
+                native.add(data.name)
+            del data.transform
+            del data.source
+
+        for i in xrange(len(self.marks)):
+            mark = self.marks[i]
+            ref = mark.from_
+            if ref and ref.transform and is_inlinable(ref.transform):
+                values = source_values(ref.data)
+                if values is not None:
+                    name = '{0}_{1}'.format(ref.data,
+                                            mark.name or 'mark' + str(i))
+                    self.data.append(Data(name, values=evaluate(
+                        values, ref.transform)))
+                    by_name[name] = self.data[-1]
+                    if (ref.data in native or
+                            not preserves_rows(ref.transform)):
+                        native.add(name)
+                    ref.data = name
+                    del ref.transform
+            if ref and ref.data in native and not ref.transform:
+                key = mark.key
+                if isinstance(key, basestring) and data_field(key) != key:
+                    mark.key = data_field(key)
+                _data_fields(mark, data_field)
+
+        for i in xrange(len(self.scales)):
+            scale = self.scales[i]
+            for attr in ('domain', 'domain_min', 'domain_max', 'range',
+                         'range_min', 'range_max'):
+                ref = getattr(scale, attr)
+                if (isinstance(ref, DataRef) and ref.data in native and
+                        isinstance(ref.field, basestring)):
+                    ref.field = data_field(ref.field)
+
     def display(self):
         """Display visualization inline in IPython notebook"""
 
@@ -474,6 +1569,7 @@ class Data(GrammarClass):
     containing the data and formatting instructions. Additionally, new data
     can be created from old data via the transform fields.
     """
+    __slots__ = ()
     _default_index_key = 'idx'
 
     def __init__(self, name=None, **kwargs):
@@ -907,6 +2003,22 @@ class Data(GrammarClass):
         #TODO: support writing to separate file
         return super(self.__class__, self).to_json(validate, pretty_print)
 
+    def to_columns(self, path, float32=False, delta=False, compress=False):
+        """Write the numeric columns of the values as binary buffers
+
+        See :func:`vincent.columnar.dump_columns`. As with ``to_json``, the
+        ``url`` attribute must be set to ``path`` independently for the
+        data to load in the HTML scaffold.
+
+        Returns
+        -------
+        dict
+            The manifest written to ``path``.
+        """
+        from .columnar import dump_columns
+        return dump_columns(self.values, path, float32=float32, delta=delta,
+                            compress=compress)
+
 
 class ValueRef(GrammarClass):
     """Container for the value-referencing properties of marks
@@ -920,6 +2032,8 @@ class ValueRef(GrammarClass):
     ValueRefs can reference numbers, strings, or arbitrary objects,
     depending on their use.
     """
+    __slots__ = ()
+
     @grammar((str, int, float))
     def value(value):
         """int, float, or string : used for constant values
@@ -976,6 +2090,8 @@ class PropertySet(GrammarClass):
     validation of the values is only performed on the ``value`` field of the
     class, which is ignored by Vega if the ``field`` property is set.
     """
+    __slots__ = ()
+
     @grammar(ValueRef)
     def x(value):
         """ValueRef : number, left-most x-coordinate
@@ -1260,6 +2376,8 @@ class MarkProperties(GrammarClass):
     data. This class defines four events for which the properties may
     change.
     """
+    __slots__ = ()
+
     @grammar(PropertySet)
     def enter(value):
         """PropertySet : properties applied when data is loaded
@@ -1288,6 +2406,8 @@ class MarkProperties(GrammarClass):
 class MarkRef(GrammarClass):
     """Definitions for Mark source data
     """
+    __slots__ = ()
+
     @grammar(str)
     def data(value):
         """string : Name of the source `Data`"""
@@ -1304,8 +2424,10 @@ class Mark(GrammarClass):
     bar, line etc.. This class defines how the marks appear and what data
     the marks represent.
     """
+    __slots__ = ()
     _valid_type_values = [
         'rect', 'symbol', 'path', 'arc', 'area', 'line', 'image', 'text']
+    _defaults = {'ease': 'cubic-in-out'}
 
     @grammar(str)
     def name(value):
@@ -1373,6 +2495,8 @@ class DataRef(GrammarClass):
     Data can be referenced in multiple ways, and sometimes it makes sense to
     reference multiple data fields at once.
     """
+    __slots__ = ()
+
     @grammar(str)
     def data(value):
         """string : Name of data-set containing the domain values"""
@@ -1393,6 +2517,9 @@ class Scale(GrammarClass):
     as numbers, time stamps, etc.) to a visual space (length of a line,
     height of a bar, etc.), for both independent and dependent variables.
     """
+    __slots__ = ()
+    _defaults = {'type': 'linear'}
+
     @grammar(str)
     def name(value):
         """string : Unique name for the scale
@@ -1537,6 +2664,8 @@ class AxisProperties(GrammarClass):
     but instead of events, the axes are divided into major ticks, minor
     ticks, labels, and the axis itself.
     """
+    __slots__ = ()
+
     @grammar(grammar_type=PropertySet, grammar_name='majorTicks')
     def major_ticks(value):
         """PropertySet : Definition of major tick marks"""
@@ -1560,6 +2689,8 @@ class Axis(GrammarClass):
     Axes are visual cues that the viewer uses to interpret the marks
     representing the data itself.
     """
+    __slots__ = ()
+
     @grammar(str)
     def type(value):
         """string : Type of axis - ``'x'`` or ``'y'``"""
@@ -1634,3 +2765,587 @@ class Axis(GrammarClass):
     def properties(value):
         """AxisProperties : Custom styling for ticks and tick labels
         """
+
+
+_values_pattern = re.compile(r'"values"\s*:\s*\[')
+_lazy_marker = u'\x00vincent-lazy-{0}'
+
+
+def _array_end(text, start):
+    """Position after the end of the JSON array starting at ``start``
+
+    Only the brackets and the quotes are scanned for. Returns None if the
+    array is not closed, or contains escaped characters, which would need
+    a full parse to skip over strings.
+    """
+    depth = quotes = 0
+    last = pos = start
+    next_open = start
+    next_close = text.find(']', start)
+    while True:
+        if next_open != -1 and next_open < pos:
+            next_open = text.find('[', pos)
+        if next_close != -1 and next_close < pos:
+            next_close = text.find(']', pos)
+        if next_close == -1:
+            return None
+        if next_open == -1 or next_close < next_open:
+            pos = next_close
+        else:
+            pos = next_open
+        quotes += text.count('"', last, pos)
+        last = pos
+        if not quotes % 2:
+            depth += 1 if text[pos] == '[' else -1
+            if not depth:
+                end = pos + 1
+                if (text.find('\\"', start, end) != -1 or
+                        text.find('\\\\', start, end) != -1):
+                    return None
+                return end
+        pos += 1
+
+
+def _split_values(text, threshold):
+    """Replace the long ``values`` arrays of a JSON text with markers
+
+    Returns the new text, and a dict of the :class:`encoding.RawJSON`
+    arrays by marker.
+    """
+    raw = {}
+    if not threshold:
+        return text, raw
+    pieces = []
+    pos = 0
+    match = _values_pattern.search(text)
+    while match:
+        start = match.end() - 1
+        end = _array_end(text, start)
+        if end is None or end - start < threshold:
+            match = _values_pattern.search(text, match.end())
+            continue
+        marker = _lazy_marker.format(len(raw))
+        raw[marker] = encoding.RawJSON(text[start:end])
+        pieces.extend([text[pos:start], json.dumps(marker)])
+        pos = end
+        match = _values_pattern.search(text, end)
+    pieces.append(text[pos:])
+    return ''.join(pieces), raw
+
+
+def _decoded(value, raw=None):
+    """Decoded JSON with byte strings, as used by the grammar classes, and
+    the markers of ``raw`` replaced by their decoded values"""
+    if isinstance(value, unicode):
+        if raw and value in raw:
+            return _decoded(raw[value].load())
+        return value.encode('utf-8')
+    elif isinstance(value, dict):
+        return dict((_decoded(k), _decoded(v, raw))
+                    for k, v in value.iteritems())
+    elif isinstance(value, list):
+        return [_decoded(v, raw) for v in value]
+    return value
+
+
+_property_maps = {}
+
+
+def _data_fields(obj, data_field):
+    """Rewrite the field references of the ``ValueRef`` objects in a
+    grammar tree with ``data_field``, see
+    ``Visualization.evaluate_transforms``"""
+    if isinstance(obj, ValueRef) and isinstance(obj.field, basestring):
+        field = data_field(obj.field)
+        if field != obj.field:
+            obj.field = field
+    properties = _grammar_properties(type(obj))
+    for key in list(obj.grammar):
+        if key in properties:
+            value = getattr(obj, properties[key][0])
+            if hasattr(value, 'grammar'):
+                _data_fields(value, data_field)
+
+
+def _grammar_properties(cls):
+    """Grammar properties of a class, as a dict of (attribute name,
+    property) by grammar key"""
+    properties = _property_maps.get(cls)
+    if properties is None:
+        properties = {}
+        for attr in dir(cls):
+            prop = getattr(cls, attr, None)
+            if isinstance(prop, GrammarProperty):
+                properties[prop.grammar_name] = (attr, prop)
+        _property_maps[cls] = properties
+    return properties
+
+
+def _element_types(cls):
+    """Classes of the elements of the list properties of a class"""
+    if issubclass(cls, Visualization):
+        return {'data': Data, 'scales': Scale, 'axes': Axis, 'marks': Mark}
+    return {}
+
+
+def _grammar_class(grammar_type):
+    """Grammar class accepted by a property type, if any"""
+    if not isinstance(grammar_type, tuple):
+        grammar_type = (grammar_type,)
+    for value_type in grammar_type:
+        if isinstance(value_type, type) and issubclass(value_type,
+                                                       GrammarClass):
+            return value_type
+    return None
+
+
+_class_maps = {}
+_no_classes = (None, None, None)
+
+
+def _property_classes(cls):
+    """Grammar properties of a class, as a dict of (attribute name, class
+    of dict values, class of list elements) by grammar key, used to build
+    grammar trees"""
+    classes = _class_maps.get(cls)
+    if classes is None:
+        elements = _element_types(cls)
+        classes = dict((key, (attr, _grammar_class(prop.grammar_type),
+                              elements.get(key)))
+                       for key, (attr, prop)
+                       in _grammar_properties(cls).iteritems())
+        _class_maps[cls] = classes
+    return classes
+
+
+def _element_list(key, items):
+    """List of elements of a ``Visualization`` property, keyed like those
+    built by ``Visualization.__init__``"""
+    if key in ('data', 'scales'):
+        return KeyedList('name', items)
+    elif key == 'axes':
+        return KeyedList('type', items)
+    elif key == 'marks':
+        return GrammarList(items)
+    return items
+
+
+def _blank(cls):
+    """Grammar object of class ``cls`` with an empty grammar, created
+    without running the constructor"""
+    obj = object.__new__(cls)
+    GrammarClass.__init__(obj)
+    return obj
+
+
+def _from_grammar(cls, grammar, trusted):
+    """Grammar object of class ``cls`` built from a grammar dict, see
+    ``GrammarClass.from_grammar``"""
+    obj = _blank(cls) if trusted else cls()
+    classes = _property_classes(cls)
+    for key, value in grammar.iteritems():
+        attr, value_class, element_class = classes.get(key, _no_classes)
+        if value_class and isinstance(value, dict):
+            value = _from_grammar(value_class, value, trusted)
+        elif element_class and isinstance(value, list):
+            value = _element_list(key, [
+                _from_grammar(element_class, v, trusted)
+                if isinstance(v, dict) else v for v in value])
+        if trusted or not attr:
+            obj.grammar[key] = value
+            if isinstance(value, (GrammarClass, list)):
+                _changed(obj)
+        else:
+            setattr(obj, attr, value)
+    if trusted:
+        for key in _element_types(cls):
+            if key not in obj.grammar:
+                obj.grammar[key] = _element_list(key, [])
+    return obj
+
+
+#Smallest lists of data rows pickled as columns
+_pack_size = 16
+
+#Types of the values of columns pickled as NumPy arrays
+_packed_dtypes = {int: '<i8', float: '<f8', bool: '?'}
+
+
+def _pack_column(column):
+    """A column of data as a NumPy array if its values are all ints, floats
+    or booleans, so that they are restored exactly, else as a list"""
+    kind = type(column[0])
+    if kind in _packed_dtypes and set(map(type, column)) == set([kind]):
+        return np.array(column, dtype=_packed_dtypes[kind])
+    return column
+
+
+def _pack_rows(rows):
+    """Columns of a list of data rows, to pickle them compactly
+
+    Returns the keys of the rows (None for rows of numbers) and their
+    columns, see :func:`_pack_column`, or None if the rows are not all
+    numbers or dicts with the same keys.
+    """
+    if not np or type(rows) is not list or len(rows) < _pack_size:
+        return None
+    first = rows[0]
+    if type(first) in _packed_dtypes:
+        column = _pack_column(rows)
+        return None if column is rows else (None, [column])
+    if type(first) is not dict:
+        return None
+    keys = first.viewkeys()
+    for row in rows:
+        if type(row) is not dict or row.viewkeys() != keys:
+            return None
+    keys = list(keys)
+    return keys, [_pack_column([row[key] for row in rows]) for key in keys]
+
+
+def _unpack_rows(keys, columns):
+    """Data rows from the output of :func:`_pack_rows`"""
+    columns = [c.tolist() if isinstance(c, np.ndarray) else c
+               for c in columns]
+    if keys is None:
+        return columns[0]
+    return [dict(izip(keys, row)) for row in izip(*columns)]
+
+
+def _unpickle(cls, grammar, packed):
+    """Grammar object pickled by ``GrammarClass.__reduce__``
+
+    The grammar is stored without validation, as by
+    ``GrammarClass.from_grammar``.
+    """
+    obj = _blank(cls)
+    obj.grammar.update(grammar)
+    for key, (keys, columns) in packed.iteritems():
+        obj.grammar[key] = _unpack_rows(keys, columns)
+    for value in obj.grammar.itervalues():
+        if isinstance(value, (GrammarClass, list)):
+            _changed(obj)
+    return obj
+
+
+def _load(cls, grammar, raw):
+    """Build a grammar object of class ``cls`` from decoded JSON"""
+    obj = cls()
+    for key, value in grammar.iteritems():
+        _set_property(obj, _decoded(key), value, raw)
+    return obj
+
+
+def _element(cls, key, value, raw=None):
+    """Element of the list property ``key`` of class ``cls``, from decoded
+    JSON"""
+    elements = _element_types(cls)
+    if key in elements and isinstance(value, dict):
+        return _load(elements[key], value, raw or {})
+    return _decoded(value, raw)
+
+
+def _set_property(obj, key, value, raw=None):
+    """Set the grammar key of an object from decoded JSON, building the
+    grammar objects it holds
+
+    Keys without a grammar property, and values that don't pass
+    validation, are stored in the grammar dict as they are.
+    """
+    raw = raw or {}
+    properties = _grammar_properties(type(obj))
+    if key not in properties:
+        obj.grammar[key] = _decoded(value, raw)
+        _changed(obj)
+        return
+    attr, prop = properties[key]
+    if (prop.grammar_type is list and isinstance(value, unicode) and
+            value in raw):
+        obj.grammar[key] = raw[value]
+        _changed(obj)
+        return
+    value_class = _grammar_class(prop.grammar_type)
+    if isinstance(value, dict) and value_class:
+        value = _load(value_class, value, raw)
+    elif isinstance(value, list) and key in _element_types(type(obj)):
+        items = [_element(type(obj), key, v, raw) for v in value]
+        current = obj.grammar.get(key)
+        if isinstance(current, KeyedList):
+            items = KeyedList(current.attr_name, items)
+        value = items
+    else:
+        value = _decoded(value, raw)
+    try:
+        setattr(obj, attr, value)
+    except ValueError:
+        obj.grammar[key] = value
+        _changed(obj)
+
+
+def _short_float(value):
+    """Shortest form of a float for JSON
+
+    ``repr`` already gives the shortest digits that round-trip; whole
+    numbers are also written without their fractional part, as ints.
+    """
+    if value.is_integer() and abs(value) < 2 ** 53:
+        return int(value)
+    return value
+
+
+def minified(grammar, cls=None):
+    """Smallest equivalent form of a grammar
+
+    Null values and the values Vega assumes for undefined properties (see
+    the ``_defaults`` of the grammar classes) are omitted from the grammar
+    dicts, and floats are written in their shortest form, with whole
+    numbers as ints. Data values keep their nulls.
+
+    Parameters
+    ----------
+    grammar : GrammarClass, dict or list
+        Grammar to minify. It is not modified.
+    cls : GrammarClass subclass, default None
+        Class of the grammar, if it is a plain dict, such as the ``vega``
+        dict of ``vincent.Vega`` for ``Visualization``.
+
+    Returns
+    -------
+    dict or list
+        Plain Python data structure, to be written with compact separators.
+    """
+    if hasattr(grammar, 'grammar'):
+        return minified(grammar.grammar, type(grammar))
+    elif isinstance(grammar, encoding.RawJSON):
+        return minified(grammar.load())
+    elif np and isinstance(grammar, np.ndarray):
+        return minified(grammar.tolist())
+    elif np and isinstance(grammar, np.generic):
+        return minified(grammar.item())
+    elif isinstance(grammar, float):
+        return _short_float(grammar)
+    elif isinstance(grammar, (list, tuple)):
+        return [minified(v, cls) for v in grammar]
+    elif not isinstance(grammar, dict):
+        return grammar
+    elif cls is None:
+        return dict((k, minified(v)) for k, v in grammar.iteritems())
+
+    properties = _grammar_properties(cls)
+    elements = _element_types(cls)
+    output = {}
+    for key, value in grammar.iteritems():
+        if value is None:
+            continue
+        elif key in cls._defaults and cls._defaults[key] == value:
+            continue
+        value_class = elements.get(key)
+        if value_class is None and key in properties:
+            value_class = _grammar_class(properties[key][1].grammar_type)
+        output[key] = minified(value, value_class)
+    return output
+
+
+def _pointer(path, key):
+    """JSON Pointer of the member ``key`` of ``path``"""
+    return '{0}/{1}'.format(path, str(key).replace('~', '~0')
+                            .replace('/', '~1'))
+
+
+def _diff(old, new, path, operations, key=None):
+    """Append the patch operations from ``old`` to ``new`` at ``path``"""
+    if hasattr(old, 'grammar') and type(old) is type(new):
+        # Equality stops at the first difference, and doesn't hash the
+        # subtrees again at every level like fingerprints would
+        if not _equal(old, new):
+            _diff_dicts(old.grammar, new.grammar, path, operations)
+        return
+    if isinstance(old, encoding.RawJSON) or isinstance(new,
+                                                       encoding.RawJSON):
+        if getattr(old, 'text', None) == getattr(new, 'text', False):
+            return
+        if isinstance(old, encoding.RawJSON):
+            old = _decoded(old.load())
+        if isinstance(new, encoding.RawJSON):
+            new = _decoded(new.load())
+
+    if (isinstance(old, dict) and isinstance(new, dict) and
+            not hasattr(old, 'grammar') and not hasattr(new, 'grammar')):
+        _diff_dicts(old, new, path, operations)
+    elif isinstance(old, list) and isinstance(new, list):
+        if key == 'values':
+            _diff_rows(old, new, path, operations)
+        elif any(hasattr(v, 'grammar') for v in old + new):
+            _diff_lists(old, new, path, operations)
+        elif old != new:
+            operations.append({'op': 'replace', 'path': path,
+                               'value': encoding.to_plain(new)})
+    elif type(old) is not type(new) or old != new:
+        operations.append({'op': 'replace', 'path': path,
+                           'value': encoding.to_plain(new)})
+
+
+def _diff_dicts(old, new, path, operations):
+    """Patch operations between two dicts"""
+    for key in sorted(old):
+        if key not in new:
+            operations.append({'op': 'remove', 'path': _pointer(path, key)})
+    for key in sorted(new):
+        if key not in old:
+            operations.append({'op': 'add', 'path': _pointer(path, key),
+                               'value': encoding.to_plain(new[key])})
+        else:
+            _diff(old[key], new[key], _pointer(path, key), operations, key)
+
+
+def _diff_lists(old, new, path, operations):
+    """Patch operations between two lists, element by element"""
+    for i, (old_value, new_value) in enumerate(zip(old, new)):
+        _diff(old_value, new_value, _pointer(path, i), operations)
+    for value in new[len(old):]:
+        operations.append({'op': 'add', 'path': _pointer(path, '-'),
+                           'value': encoding.to_plain(value)})
+    for i in reversed(xrange(len(new), len(old))):
+        operations.append({'op': 'remove', 'path': _pointer(path, i)})
+
+
+def _diff_rows(old, new, path, operations):
+    """Patch operations between two lists of data rows
+
+    The rows are compared position by position, with the extra rows added
+    or removed at the end, or as the range of rows between the common head
+    and tail of the lists, for rows inserted or removed in the middle,
+    whichever takes fewer operations. If most rows change, the whole list
+    is replaced.
+    """
+    n, m = len(old), len(new)
+    limit = min(n, m)
+    start = 0
+    while start < limit and old[start] == new[start]:
+        start += 1
+    end = 0
+    while end < limit - start and old[n - 1 - end] == new[m - 1 - end]:
+        end += 1
+    aligned = [i for i in xrange(start, limit) if old[i] != new[i]]
+    if len(aligned) < limit - start - end:
+        replaced, added = aligned, xrange(n, m)
+        removed = reversed(xrange(m, n))
+    else:
+        replaced = xrange(start, limit - end)
+        added = xrange(limit - end, m - end)
+        removed = [limit - end] * max(n - m, 0)
+    changes = len(replaced) + abs(n - m)
+    if not changes:
+        return
+    if changes > m // 2 + 1:
+        operations.append({'op': 'replace', 'path': path,
+                           'value': encoding.to_plain(new)})
+        return
+
+    for i in replaced:
+        operations.append({'op': 'replace', 'path': _pointer(path, i),
+                           'value': encoding.to_plain(new[i])})
+    for i in added:
+        index = '-' if added[-1] == m - 1 else i
+        operations.append({'op': 'add', 'path': _pointer(path, index),
+                           'value': encoding.to_plain(new[i])})
+    for i in removed:
+        operations.append({'op': 'remove', 'path': _pointer(path, i)})
+
+
+def _patch_tokens(path):
+    """Unescaped tokens of a JSON Pointer"""
+    if path == '':
+        return []
+    if not isinstance(path, basestring) or not path.startswith('/'):
+        raise ValueError('invalid patch path: {0}'.format(path))
+    return [str(t.replace('~1', '/').replace('~0', '~'))
+            for t in path[1:].split('/')]
+
+
+def _patch_child(node, token):
+    """Member of a grammar object, dict or list"""
+    if hasattr(node, 'grammar'):
+        properties = _grammar_properties(type(node))
+        if token in properties:
+            value = getattr(node, properties[token][0])
+            if value is None and token not in node.grammar:
+                raise KeyError(token)
+            return value
+        return node.grammar[token]
+    elif isinstance(node, list):
+        return node[int(token)]
+    return node[token]
+
+
+def _patch_resolve(root, tokens):
+    """Node at the path of ``tokens``, with the grammar object containing
+    it and the grammar key it is found under"""
+    node, owner, owner_key = root, root, None
+    try:
+        for token in tokens:
+            if hasattr(node, 'grammar'):
+                owner, owner_key = node, token
+            else:
+                owner_key = None
+            node = _patch_child(node, token)
+    except (KeyError, IndexError, ValueError, TypeError):
+        raise ValueError('invalid patch path: /' + '/'.join(tokens))
+    return node, owner, owner_key
+
+
+def _patch_get(root, path):
+    """Value at a JSON Pointer"""
+    return _patch_resolve(root, _patch_tokens(path))[0]
+
+
+def _patch_apply(root, op, path, value=None):
+    """Apply an add, remove or replace operation"""
+    tokens = _patch_tokens(path)
+    if not tokens:
+        raise ValueError('the root of the grammar cannot be patched')
+    container, owner, owner_key = _patch_resolve(root, tokens[:-1])
+    token = tokens[-1]
+
+    if hasattr(container, 'grammar'):
+        if op != 'add' and token not in container.grammar:
+            raise ValueError('invalid patch path: ' + path)
+        if op == 'remove':
+            properties = _grammar_properties(type(container))
+            if token in properties:
+                delattr(container, properties[token][0])
+            else:
+                del container.grammar[token]
+                _changed(container)
+        else:
+            _set_property(container, token, value)
+        return
+
+    try:
+        if isinstance(container, list):
+            index = len(container) if token == '-' else int(token)
+            if index < 0 or index > len(container) or (
+                    op != 'add' and index == len(container)):
+                raise IndexError(index)
+            if op != 'remove' and owner_key is not None:
+                value = _element(type(owner), owner_key, value)
+            elif op != 'remove':
+                value = _decoded(value)
+            if op == 'add':
+                container.insert(index, value)
+            elif op == 'replace':
+                container[index] = value
+            else:
+                del container[index]
+        elif isinstance(container, dict):
+            if op != 'add' and token not in container:
+                raise KeyError(token)
+            if op == 'remove':
+                del container[token]
+            else:
+                container[token] = _decoded(value)
+        else:
+            raise TypeError(type(container))
+    except (KeyError, IndexError, ValueError, TypeError):
+        raise ValueError('invalid patch path: ' + path)
+    _changed(owner)
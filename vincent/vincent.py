@@ -14,16 +14,27 @@ import os
 import json
 import time
 import itertools
-from copy import deepcopy
+from contextlib import contextmanager
+from copy import copy, deepcopy
 from pkg_resources import resource_string
 from string import Template
 import pandas as pd
 import numpy as np
+from . import columnar, downsample, encoding
+from .vega import Visualization, minified
 
 
 class Vega(object):
     '''Vega abstract base class'''
 
+    #Nesting depth of ``batch`` blocks, and arguments of the build_vega call
+    #deferred to the end of the outermost one
+    _batch_depth = 0
+    _pending_build = None
+
+    #Ids of the lists of data values shared with copies, see _update_copy
+    _shared_values = frozenset()
+
     def __init__(self, width=600, height=300, padding=None, viewport=None):
         '''
         The Vega classes generate JSON output in Vega grammar, a
@@ -75,8 +86,9 @@ class Vega(object):
         return vis
 
     def __add__(self, tuple):
-        '''Allow for updating of Vega with add operator'''
-        vis = deepcopy(self)
+        '''Allow for updating of Vega with add operator. The new object
+        shares its data with this one, see ``_update_copy``'''
+        vis = self._update_copy()
         vis.update_component('add', *tuple)
         return vis
 
@@ -86,8 +98,9 @@ class Vega(object):
         return self
 
     def __sub__(self, tuple):
-        '''Allow for updating of Vega with sub operator'''
-        vis = deepcopy(self)
+        '''Allow for updating of Vega with sub operator. The new object
+        shares its data with this one, see ``_update_copy``'''
+        vis = self._update_copy()
         vis.update_component('remove', *tuple)
         return vis
 
@@ -96,20 +109,107 @@ class Vega(object):
         self.update_component('remove', *tuple)
         return self
 
+    def _update_copy(self):
+        '''Copy of the Vega object that shares its rows of data values with
+        this object
+
+        All the components are deep-copied, except the lists of rows under
+        ``data[i]['values']``, which makes the copy independent of the amount
+        of data. Both objects copy a shared list before changing it, see
+        ``_unshare``.
+
+        '''
+        memo = {}
+        for data in self.data:
+            values = data.get('values')
+            if isinstance(values, list):
+                memo[id(values)] = values
+        shared = self._shared_values.union(memo)
+        raw_data = getattr(self, 'raw_data', None)
+        memo[id(raw_data)] = raw_data
+
+        vis = self.__class__.__new__(self.__class__)
+        for key, attr in self.__dict__.iteritems():
+            vis.__dict__[key] = deepcopy(attr, memo)
+        # Batches of this object don't apply to the copy.
+        vis.__dict__.pop('_batch_depth', None)
+        vis.__dict__.pop('_pending_build', None)
+        self._shared_values = vis._shared_values = shared
+        return vis
+
+    def _unshare(self, data, path):
+        '''Copy the lists and dicts along ``path`` in the ``data`` component,
+        if its rows of data values are shared with another object'''
+        if id(data.get('values')) not in self._shared_values:
+            return
+        node = data
+        for key in path:
+            try:
+                child = node[key]
+            except (IndexError, KeyError, TypeError):
+                break
+            if not isinstance(child, (list, dict)):
+                break
+            node[key] = node = copy(child)
+
     def build_vega(self, *args):
         '''Build complete vega specification. String arguments passed will not
         be included in vega dict.
 
+        Within a ``batch`` block, the build is deferred to the end of the
+        block, or to the next access to the ``vega`` dict.
+
         Ex: object.build_vega('viewport')
 
         '''
 
+        if self._batch_depth:
+            self._pending_build = args
+            return
+
         keys = ['width', 'height', 'padding', 'viewport', 'data',
                 'scales', 'axes', 'marks']
-        self.vega = {}
+        self._pending_build = None
+        self._vega = {}
         for key in keys:
             if key not in args:
-                self.vega[key] = getattr(self, key)
+                self._vega[key] = getattr(self, key)
+
+    @property
+    def vega(self):
+        '''Complete vega specification, see ``build_vega``'''
+        if self._pending_build is not None:
+            depth, self._batch_depth = self._batch_depth, 0
+            try:
+                self.build_vega(*self._pending_build)
+            finally:
+                self._batch_depth = depth
+        return self._vega
+
+    @contextmanager
+    def batch(self):
+        '''Apply several updates, and rebuild the vega dict once at the end
+
+        The ``update_vis``, ``axis_label``, ``build_component``,
+        ``update_component`` and ``tabular_data`` calls made in the block
+        don't rebuild the vega dict each time. Blocks can be nested; the
+        dict is rebuilt when the outermost one exits, even on an error,
+        and changes made before the error are kept.
+
+        Example:
+        --------
+        >>>with vis.batch():
+        >>>    vis.update_component('add', 'w', 'axes', 0, 'scale')
+        >>>    vis.axis_label(x_label='X Data', y_label='Y Data')
+
+        '''
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._pending_build is not None:
+                self.build_vega(*self._pending_build)
 
     def update_vis(self, **kwargs):
         '''
@@ -282,6 +382,10 @@ class Vega(object):
             par.append({})
             setattr(self, parameter, par)
 
+        if parameter == 'data' and args[:1] == ('values',):
+            self._unshare(self.data[index],
+                          args if change == 'remove' else args[:-1])
+
         parameter = getattr(self, parameter)[index]
         if not args:
             args = [value]
@@ -294,10 +398,12 @@ class Vega(object):
         self.build_vega()
 
     def multi_update(self, comp_list):
-        '''Pass a list of component updates to change all'''
+        '''Pass a list of component updates to change all. The vega dict is
+        rebuilt once, after all the updates.'''
 
-        for update in comp_list:
-            self.update_component(*update)
+        with self.batch():
+            for update in comp_list:
+                self.update_component(*update)
 
     def _json_IO(self, host, port):
         '''Return data values as JSON for StringIO '''
@@ -306,12 +412,14 @@ class Vega(object):
         self.update_component('remove', 'values', 'data', 0)
         url = ''.join(['http://', host, ':', str(port), '/data.json'])
         self.update_component('add', url, 'data', 0, 'url')
-        vega = json.dumps(self.vega, sort_keys=True, indent=4)
-        data = json.dumps(data_vals, sort_keys=True, indent=4)
+        vega = encoding.dumps(self.vega, sort_keys=True, indent=4)
+        data = encoding.dumps(data_vals, sort_keys=True, indent=4)
         return vega, data
 
     def to_json(self, path, split_data=False, data_path='data.json',
-                html=False, html_path='vega_template.html'):
+                html=False, html_path='vega_template.html', pyramid=None,
+                max_bytes=None, backend=None, compress=False, binary=False,
+                minify=False):
         '''
         Save Vega object to JSON
 
@@ -329,51 +437,166 @@ class Vega(object):
         html_path: string, default 'vega_template.html'
             Path for the scaffolding HTML file. Does nothing if `html` is
             False.
+        pyramid: iterable of ints, default None
+            Decimation factors, e.g. (10, 100, 1000). Splits the data as with
+            `split_data`, and also writes a min/max envelope of the data for
+            every factor to `data_path` with the factor appended to the file
+            name, plus a `_manifest` JSON listing the levels. The grammar
+            references the coarsest level; the HTML scaffold loads finer
+            levels as the visible x-domain narrows. Rows must be ordered by
+            their x-values.
+        max_bytes: int, default None
+            Size budget of the output. If the estimated size of the JSON
+            exceeds it, the data is reduced according to the chart type:
+            lines and areas are downsampled, scatter points are binned,
+            bars are reduced to the top values, and floats are rounded as a
+            last resort. A `vincent.downsample.DataReductionWarning` is
+            issued for every reduction, and the Vega object itself is not
+            modified.
+        backend: string, default None
+            JSON encoding backend, see `vincent.encoding.set_backend`. If
+            None (default), the default backend is used.
+        compress: boolean or int, default False
+            Gzip-compress all of the JSON files written, see
+            `vincent.encoding.dump`. The file names are used as given, so
+            they should end with `.json.gz`. The HTML scaffold decompresses
+            the files in the browser.
+        binary: boolean or dict, default False
+            Splits the data as with `split_data`, and writes the numeric
+            columns as binary buffers, with a manifest at `data_path`, see
+            `vincent.columnar.dump_columns`. A dict gives the `float32` and
+            `delta` options of `dump_columns`. With `pyramid`, every level
+            is written this way. The HTML scaffold rebuilds the rows.
+        minify: boolean, default False
+            Write all of the JSON files as small as possible with the same
+            meaning: with compact separators, without the null and default
+            values of the grammar, and with floats in their shortest form.
+            See `vincent.vega.minified`.
         '''
 
-        def json_out(path, output):
+        if minify:
+            dumps_args = {'sort_keys': True, 'separators': (',', ':')}
+        else:
+            dumps_args = {'sort_keys': True, 'indent': 4,
+                          'separators': (',', ': ')}
+
+        def json_out(path, output, grammar_class=None):
             '''Output to JSON'''
-            with open(path, 'w') as f:
-                json.dump(output, f, sort_keys=True, indent=4,
-                          separators=(',', ': '))
-
-        if split_data:
-            name = self.data[0]['name']
-            data_out = self.data[0]['values']
-            self.update_component('remove', 'values', 'data', 0)
-            self.update_component('add', data_path, 'data', 0, 'url')
-            json_out(data_path, data_out)
-            json_out(path, self.vega)
-
-            #Reset our data in the Vega object
-            self.data.pop(0)
-            self.data.insert(0, {'name': name, 'values': data_out})
-            self.build_vega()
+            if minify:
+                output = minified(output, grammar_class)
+            encoding.dump(output, path, backend=backend, compress=compress,
+                          **dumps_args)
+
+        def rows_out(path, rows):
+            '''Output data values, as JSON or binary columns'''
+            if binary:
+                options = binary if isinstance(binary, dict) else {}
+                columnar.dump_columns(rows, path, compress=compress,
+                                      minify=minify, **options)
+            else:
+                json_out(path, rows)
+
+        spec = self.vega
+        if max_bytes:
+            spec, reports = downsample.fit_spec(spec, max_bytes,
+                                                **dumps_args)
+            downsample.warn_reductions(reports)
+
+        manifest_path = ''
+        if split_data or pyramid or binary:
+            name = spec['data'][0]['name']
+            data_out = spec['data'][0]['values']
+            data_url = data_path
+            if pyramid:
+                root, ext = os.path.splitext(data_path)
+                if ext == '.gz':
+                    root, inner = os.path.splitext(root)
+                    ext = inner + ext
+                manifest_path = ''.join([root, '_manifest', ext])
+                levels = []
+                for factor, rows in downsample.pyramid(data_out, pyramid):
+                    level_path = data_path
+                    if factor != 1:
+                        level_path = '{0}_{1}{2}'.format(root, factor, ext)
+                    rows_out(level_path, rows)
+                    levels.append({'factor': factor, 'url': level_path,
+                                   'rows': len(rows)})
+                domain = None
+                if data_out:
+                    domain = [data_out[0]['x'], data_out[-1]['x']]
+                json_out(manifest_path, {'name': name, 'domain': domain,
+                                         'levels': levels})
+                data_url = levels[0]['url']
+            else:
+                rows_out(data_path, data_out)
+            #The grammar references the data file instead of the values
+            data_ref = dict(spec['data'][0], url=data_url)
+            del data_ref['values']
+            spec = dict(spec, data=[data_ref] + list(spec['data'][1:]))
+            json_out(path, spec, Visualization)
         else:
-            json_out(path, self.vega)
+            json_out(path, spec, Visualization)
 
         if html:
             template = Template(
                 resource_string('vincent', 'vega_template.html'))
             with open(html_path, 'w') as f:
-                f.write(template.substitute(path=path))
+                f.write(template.substitute(path=path,
+                                            manifest=manifest_path))
 
-    def _serial_transform(self, str_time):
+    def _serial_transform(self, str_time, values=None):
         '''Transform data to make it JSON serializable. Vega requires
         Epoch time in milliseconds, and it will be converted to local
-        timestamp, not UTC.'''
-        for objs in self.data[0]['values']:
+        timestamp, not UTC. Transforms the first data values by default.'''
+        if values is None:
+            values = self.data[0]['values']
+        for objs in values:
             for key, value in objs.iteritems():
-                if isinstance(value, pd.Period):
-                    value = value.to_timestamp()
-                if pd.isnull(value):
-                    objs[key] = None
-                elif (isinstance(value, pd.tslib.Timestamp) or
-                      isinstance(value, pd.Period)):
-                    objs[key] = time.mktime(value.timetuple()) * 1000
+                objs[key] = self._serial_value(value)
+
+    @staticmethod
+    def _serial_value(value):
+        '''JSON serializable value, see _serial_transform'''
+        if isinstance(value, pd.Period):
+            value = value.to_timestamp()
+        if pd.isnull(value):
+            return None
+        elif isinstance(value, pd.tslib.Timestamp):
+            return time.mktime(value.timetuple()) * 1000
+        return value
+
+    @classmethod
+    def _serial_column(cls, column):
+        '''Transform a Pandas Series or Index to a list of JSON serializable
+        values, as _serial_transform does one value at a time, with
+        vectorized conversions for numbers and datetimes.'''
+        if isinstance(column, pd.PeriodIndex):
+            column = column.to_timestamp()
+        if getattr(column, 'tz', None) is not None:
+            return [cls._serial_value(value) for value in column]
+        values = np.asarray(column)
+        kind = values.dtype.kind
+        if kind == 'M':
+            nulls = pd.isnull(values)
+            stamps = pd.DatetimeIndex(values).to_pydatetime()
+            return [None if null else time.mktime(stamp.timetuple()) * 1000
+                    for stamp, null in itertools.izip(stamps, nulls)]
+        elif kind in 'biu':
+            return values.tolist()
+        elif kind == 'f':
+            serial = values.tolist()
+            nulls = np.isnan(values)
+            if nulls.any():
+                for index in np.flatnonzero(nulls).tolist():
+                    serial[index] = None
+            return serial
+        return [cls._serial_value(value) for value in values]
+
+    _resample_rules = {'second': 'S', 'minute': 'T', 'hour': 'H',
+                       'day': 'D', 'week': 'W', 'month': 'M', 'year': 'A'}
 
     def tabular_data(self, data, columns=None, use_index=False,
-                     append=False, axis_time='day'):
+                     append=False, axis_time='day', resample=None):
         '''Create the data for a bar chart in Vega grammer. Data can be passed
         in a list, dict, or Pandas Dataframe.
 
@@ -397,6 +620,11 @@ class Vega(object):
         axis_time: string, default 'day'
             Time scale for axis. Must be one of 'second', 'minute', 'hour',
             'day', 'week', 'month', or 'year'
+        resample: string, default None
+            Aggregate a Pandas Series/DataFrame with a DatetimeIndex to the
+            `axis_time` granularity before building the data. Must be one of
+            'mean', 'sum', 'min', 'max', or 'last'. Periods without data
+            are dropped.
 
         Examples:
         ---------
@@ -405,12 +633,18 @@ class Vega(object):
         >>>myvega.tabular_data(my_dataframe, columns=['column 1'],
                                use_index=True)
         >>>myvega.tabular_data(my_dataframe, columns=['column 1', 'column 2'])
+        >>>myvega.tabular_data(minute_series, axis_time='hour',
+                               resample='max')
 
 
         '''
 
         self.raw_data = data
 
+        if resample:
+            data = self._resample(data, columns, use_index, axis_time,
+                                  resample)
+
         def default_range(data_len, append):
             if append:
                 start = self.data[0]['values'][-1]['x'] + 1
@@ -428,6 +662,22 @@ class Vega(object):
                 self.update_component('add', axis_time, 'scales', 0,
                                       'nice')
 
+        def frame_column(name):
+            '''Cast a DataFrame column as DataFrame.iterrows would'''
+            column = data[name]
+            dtype = data.iloc[:0].values.dtype
+            if dtype != np.object_ and column.dtype != dtype:
+                column = column.astype(dtype)
+            return column
+
+        def xy_values(xvals, yvals):
+            return [{"x": x, "y": y} for x, y in
+                    itertools.izip(self._serial_column(xvals),
+                                   self._serial_column(yvals))]
+
+        #Pandas data is serialized one column at a time
+        serial = False
+
         #Tuples
         if isinstance(data, tuple):
             values = [{"x": x[0], "y": x[1]} for x in data]
@@ -437,10 +687,14 @@ class Vega(object):
             values = [{"x": x, "y": y}
                       for x, y in zip(default_range(len(data), append), data)]
 
+        #Series
+        elif isinstance(data, pd.Series):
+            period_axis(data, axis_time)
+            values = xy_values(data.index, data)
+            serial = True
+
         #Dicts
-        elif isinstance(data, dict) or isinstance(data, pd.Series):
-            if isinstance(data, pd.Series):
-                period_axis(data, axis_time)
+        elif isinstance(data, dict):
             values = [{"x": x, "y": y} for x, y in data.iteritems()]
 
         #Dataframes
@@ -450,11 +704,11 @@ class Vega(object):
                                  'cannot be > 1')
             if use_index or len(columns) == 1:
                 period_axis(data, axis_time)
-                values = [{"x": x[0], "y": x[1][columns[0]]}
-                          for x in data.iterrows()]
+                values = xy_values(data.index, frame_column(columns[0]))
             else:
-                values = [{"x": x[1][columns[0]], "y": x[1][columns[1]]}
-                          for x in data.iterrows()]
+                values = xy_values(frame_column(columns[0]),
+                                   frame_column(columns[1]))
+            serial = True
 
         #NumPy arrays
         elif isinstance(data, np.ndarray):
@@ -462,16 +716,56 @@ class Vega(object):
         else:
             raise TypeError('unknown data type %s' % type(data))
 
+        if not serial:
+            self._serial_transform(axis_time, values)
+
         if append:
+            self._unshare(self.data[0], ['values'])
             self.data[0]['values'].extend(values)
         else:
             filter = lambda x: x.get('name') == 'table'
             self.data = list(itertools.ifilterfalse(filter, self.data))
             self.data.insert(0, {"name": "table", "values": values})
 
-        self._serial_transform(axis_time)
         self.build_vega()
 
+    @classmethod
+    def _resample(cls, data, columns, use_index, axis_time, how):
+        '''Aggregate time series data to the axis_time granularity'''
+        if how not in ('mean', 'sum', 'min', 'max', 'last'):
+            raise ValueError('resample must be one of mean, sum, min, max, '
+                             'or last')
+        if axis_time not in cls._resample_rules:
+            raise ValueError('invalid axis_time %s' % axis_time)
+        if (not isinstance(data, (pd.Series, pd.DataFrame)) or
+                not isinstance(data.index, pd.DatetimeIndex)):
+            raise ValueError('resample requires a Pandas object with a '
+                             'DatetimeIndex')
+        if isinstance(data, pd.DataFrame):
+            if not columns:
+                raise ValueError('resample requires a column of a DataFrame')
+            if not (use_index or len(columns) == 1):
+                raise ValueError('resample requires the index as x-values')
+            data = data[columns[:1]]
+            column = data[columns[0]]
+        else:
+            column = data
+
+        # Grouping by time works with the old and new resample APIs, and
+        # periods without values are dropped by their count, as recent
+        # Pandas versions sum them to 0 instead of NaN
+        rule = cls._resample_rules[axis_time]
+        values = data.groupby(cls._time_grouper(rule)).agg(how)
+        counts = column.groupby(cls._time_grouper(rule)).count()
+        return values[counts > 0]
+
+    @staticmethod
+    def _time_grouper(rule):
+        '''Grouper of a DatetimeIndex by periods of a frequency rule'''
+        if hasattr(pd, 'Grouper'):
+            return pd.Grouper(freq=rule)
+        return pd.TimeGrouper(rule)
+
     @staticmethod
     def _numpy_to_values(data, default_range, append):
         '''Convert a NumPy array to values attribute'''
@@ -508,29 +802,29 @@ class Bar(Vega):
 
     def __init__(self, **kwargs):
         '''Build Vega Bar chart with default parameters'''
-        super(Bar, self).__init__(**kwargs)
-
-        self.scales = [{"name": "x", "type": "ordinal", "range": "width",
-                        "domain": {"data": "table", "field": "data.x"}},
-                       {"name": "y", "range": "height", "nice": True,
-                        "domain": {"data": "table", "field": "data.y"}}]
-
-        self.axes = [{"type": "x", "scale": "x"}, {"type": "y", "scale": "y"}]
-
-        self.marks = [{"type": "rect", "from": {"data": "table"},
-                       "properties": {
-                           "enter": {
-                               "x": {"scale": "x", "field": "data.x"},
-                               "width": {"scale": "x", "band": True,
-                                         "offset": -1},
-                               "y": {"scale": "y", "field": "data.y"},
-                               "y2": {"scale": "y", "value": 0}
-                           },
-                           "update": {"fill": {"value": "#2a3140"}}
-                       }
-                       }]
-
-        self.build_vega()
+        with self.batch():
+            super(Bar, self).__init__(**kwargs)
+
+            self.scales = [{"name": "x", "type": "ordinal", "range": "width",
+                            "domain": {"data": "table", "field": "data.x"}},
+                           {"name": "y", "range": "height", "nice": True,
+                            "domain": {"data": "table", "field": "data.y"}}]
+
+            self.axes = [{"type": "x", "scale": "x"},
+                         {"type": "y", "scale": "y"}]
+
+            self.marks = [{"type": "rect", "from": {"data": "table"},
+                           "properties": {
+                               "enter": {
+                                   "x": {"scale": "x", "field": "data.x"},
+                                   "width": {"scale": "x", "band": True,
+                                             "offset": -1},
+                                   "y": {"scale": "y", "field": "data.y"},
+                                   "y2": {"scale": "y", "value": 0}
+                               },
+                               "update": {"fill": {"value": "#2a3140"}}
+                           }
+                           }]
 
 
 class Area(Bar):
@@ -538,13 +832,14 @@ class Area(Bar):
 
     def __init__(self, **kwargs):
         '''Build Vega Area chart with default parameters'''
-        super(Area, self).__init__(**kwargs)
-        area_updates = [('remove', 'width', 'marks', 0, 'properties', 'enter'),
-                        ('add', 'area', 'marks', 0, 'type'),
-                        ('add', 'linear', 'scales', 0, 'type')]
+        with self.batch():
+            super(Area, self).__init__(**kwargs)
+            area_updates = [('remove', 'width', 'marks', 0, 'properties',
+                             'enter'),
+                            ('add', 'area', 'marks', 0, 'type'),
+                            ('add', 'linear', 'scales', 0, 'type')]
 
-        self.multi_update(area_updates)
-        self.build_vega()
+            self.multi_update(area_updates)
 
 
 class Scatter(Bar):
@@ -552,23 +847,23 @@ class Scatter(Bar):
 
     def __init__(self, **kwargs):
         '''Build Vega Scatter chart with default parameters'''
-        super(Scatter, self).__init__(**kwargs)
-        self.height, self.width = 400, 400
-        self.padding = {'top': 40, 'left': 40, 'bottom': 40, 'right': 40}
-        scatter_updates = [('remove', 'type', 'scales', 0),
-                           ('add', True, 'scales', 0, 'nice'),
-                           ('remove', 'width', 'marks', 0, 'properties',
-                            'enter'),
-                           ('remove', 'y2', 'marks', 0, 'properties',
-                            'enter'),
-                           ('add', {'value': '#2a3140'}, 'marks', 0,
-                            'properties', 'enter', 'stroke'),
-                           ('add', {'value': 0.9}, 'marks', 0, 'properties',
-                            'enter', 'fillOpacity'),
-                           ('add', 'symbol', 'marks', 0, 'type')]
-
-        self.multi_update(scatter_updates)
-        self.build_vega()
+        with self.batch():
+            super(Scatter, self).__init__(**kwargs)
+            self.height, self.width = 400, 400
+            self.padding = {'top': 40, 'left': 40, 'bottom': 40, 'right': 40}
+            scatter_updates = [('remove', 'type', 'scales', 0),
+                               ('add', True, 'scales', 0, 'nice'),
+                               ('remove', 'width', 'marks', 0, 'properties',
+                                'enter'),
+                               ('remove', 'y2', 'marks', 0, 'properties',
+                                'enter'),
+                               ('add', {'value': '#2a3140'}, 'marks', 0,
+                                'properties', 'enter', 'stroke'),
+                               ('add', {'value': 0.9}, 'marks', 0,
+                                'properties', 'enter', 'fillOpacity'),
+                               ('add', 'symbol', 'marks', 0, 'type')]
+
+            self.multi_update(scatter_updates)
 
 
 class Line(Bar):
@@ -576,21 +871,21 @@ class Line(Bar):
 
     def __init__(self, **kwargs):
         '''Build Vega Line plot chart with default parameters'''
-
-        super(Line, self).__init__(**kwargs)
-        line_updates = [('add', 'linear', 'scales', 0, 'type'),
-                        ('remove', 'update', 'marks', 0, 'properties'),
-                        ('remove', 'width', 'marks', 0, 'properties', 'enter'),
-                        ('remove', 'y2', 'marks', 0, 'properties',
-                         'enter'),
-                        ('add', 'line', 'marks', 0, 'type'),
-                        ('add', {'value': '#2a3140'}, 'marks', 0,
-                         'properties', 'enter', 'stroke'),
-                        ('add', {'value': 2}, 'marks', 0, 'properties',
-                         'enter', 'strokeWidth')]
-
-        self.multi_update(line_updates)
-        self.build_vega()
+        with self.batch():
+            super(Line, self).__init__(**kwargs)
+            line_updates = [('add', 'linear', 'scales', 0, 'type'),
+                            ('remove', 'update', 'marks', 0, 'properties'),
+                            ('remove', 'width', 'marks', 0, 'properties',
+                             'enter'),
+                            ('remove', 'y2', 'marks', 0, 'properties',
+                             'enter'),
+                            ('add', 'line', 'marks', 0, 'type'),
+                            ('add', {'value': '#2a3140'}, 'marks', 0,
+                             'properties', 'enter', 'stroke'),
+                            ('add', {'value': 2}, 'marks', 0, 'properties',
+                             'enter', 'strokeWidth')]
+
+            self.multi_update(line_updates)
 
 
 class Map(Vega):
@@ -788,6 +1083,13 @@ class Map(Vega):
                 geo_path = ''.join([os.path.split(path)[0], value['file']])
             else:
                 geo_path = '/'.join([os.path.split(path)[0], value['file']])
-            with open(geo_path, 'w') as f:
-                json.dump(value['data'], f, sort_keys=True, indent=4,
-                          separators=(',', ': '))
+            if kwargs.get('minify'):
+                encoding.dump(minified(value['data']), geo_path,
+                              sort_keys=True, separators=(',', ':'),
+                              backend=kwargs.get('backend'),
+                              compress=kwargs.get('compress', False))
+            else:
+                encoding.dump(value['data'], geo_path, sort_keys=True,
+                              indent=4, separators=(',', ': '),
+                              backend=kwargs.get('backend'),
+                              compress=kwargs.get('compress', False))